@@ -11,7 +11,7 @@ CREATE TABLE video_queue (
     content TEXT NOT NULL,
     hook_text VARCHAR(255),
     target_platform VARCHAR(50) NOT NULL,
-    status VARCHAR(20) DEFAULT 'queued' CHECK (status IN ('queued', 'processing', 'completed', 'failed', 'cancelled')),
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'processing', 'completed', 'failed', 'cancelled')),
     priority INTEGER DEFAULT 1 CHECK (priority BETWEEN 1 AND 5),
     batch_id VARCHAR(100),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -25,7 +25,22 @@ CREATE TABLE video_queue (
     -- ADHD optimization fields
     adhd_optimized BOOLEAN DEFAULT true,
     estimated_attention_span INTEGER, -- in seconds
-    natural_pause_points INTEGER[] -- array of timestamps
+    natural_pause_points INTEGER[], -- array of timestamps
+    -- Generation plan (see profbrainrot.planner); NULL until planned
+    planned_size VARCHAR(20), -- Wan 2.5 "W*H"
+    planned_duration INTEGER, -- seconds requested
+    -- Worker lease: a processing row whose lease expires is reclaimed by a reaper
+    claimed_by VARCHAR(100),
+    lease_expires_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    -- Local copy of the video (video_url is a signed link that expires)
+    video_url_expires_at TIMESTAMP,
+    local_path TEXT,
+    video_sha256 CHAR(64),
+    downloaded_at TIMESTAMP,
+    -- Near-duplicate of an earlier script (MinHash similarity >= threshold)
+    duplicate_of VARCHAR(100),
+    duplicate_similarity REAL
 );
 
 -- Index for efficient queue processing
@@ -33,6 +48,40 @@ CREATE INDEX idx_video_queue_status_priority ON video_queue(status, priority, cr
 CREATE INDEX idx_video_queue_batch_id ON video_queue(batch_id);
 CREATE INDEX idx_video_queue_lesson_id ON video_queue(lesson_id);
 CREATE INDEX idx_video_queue_script_type ON video_queue(script_type);
+CREATE INDEX idx_video_queue_lease ON video_queue(lease_expires_at) WHERE status = 'processing';
+CREATE INDEX idx_video_queue_duplicate_of ON video_queue(duplicate_of) WHERE duplicate_of IS NOT NULL;
+-- Backs the oldest/newest recount in queue_status_counts_bump
+CREATE INDEX idx_video_queue_summary ON video_queue(status, script_type, target_platform, created_at);
+CREATE INDEX idx_video_queue_unplanned ON video_queue(priority, created_at) WHERE status = 'queued' AND planned_size IS NULL;
+CREATE INDEX idx_video_queue_undownloaded ON video_queue(video_url_expires_at) WHERE status = 'completed' AND local_path IS NULL;
+
+-- Submission ledger: one row per generation attempt, written *before* the
+-- provider call so a crash between submit and save never pays twice
+CREATE TABLE generation_tasks (
+    id SERIAL PRIMARY KEY,
+    script_id VARCHAR(100) NOT NULL REFERENCES video_queue(script_id),
+    attempt INTEGER NOT NULL DEFAULT 0, -- video_queue.error_count at submit time
+    idempotency_key VARCHAR(150) UNIQUE NOT NULL, -- script_id:attempt
+    task_id VARCHAR(100) UNIQUE, -- provider task id, set once the submit returns
+    status VARCHAR(20) DEFAULT 'intended' CHECK (status IN ('intended', 'submitted', 'succeeded', 'failed')),
+    request JSONB DEFAULT '{}',
+    video_url TEXT,
+    error_message TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    submitted_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX idx_generation_tasks_script_attempt ON generation_tasks(script_id, attempt);
+
+-- MinHash signatures of video_queue.content for near-duplicate detection;
+-- the LSH index itself is rebuilt in memory from this table
+CREATE TABLE script_signatures (
+    script_id VARCHAR(100) PRIMARY KEY REFERENCES video_queue(script_id) ON DELETE CASCADE,
+    signature BYTEA NOT NULL, -- num_perm uint32 values
+    num_perm INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
 
 -- Lessons table to track original lesson plans
 CREATE TABLE lessons (
@@ -51,12 +100,20 @@ CREATE TABLE lessons (
     -- Processing status
     processing_status VARCHAR(50) DEFAULT 'pending' CHECK (processing_status IN ('pending', 'processing', 'completed', 'failed')),
     total_scripts_generated INTEGER DEFAULT 0,
-    total_videos_created INTEGER DEFAULT 0
+    total_videos_created INTEGER DEFAULT 0,
+    -- Bumped whenever an import changes the content; part of the script ids
+    content_revision INTEGER NOT NULL DEFAULT 0,
+    -- Script generation lease: a lesson claimed by a batchgen run that died
+    -- before queueing its scripts is claimed again once this passes
+    claim_expires_at TIMESTAMP
 );
 
--- Video generation API usage tracking
+CREATE INDEX idx_lessons_claim ON lessons(claim_expires_at) WHERE processing_status = 'processing';
+
+-- Video generation API usage tracking, partitioned by month (see
+-- ensure_log_partitions / drop_expired_log_partitions)
 CREATE TABLE api_usage_log (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     script_id VARCHAR(100) REFERENCES video_queue(script_id),
     api_provider VARCHAR(50) NOT NULL, -- zebracat, invideo, etc.
     api_endpoint VARCHAR(255),
@@ -64,11 +121,46 @@ CREATE TABLE api_usage_log (
     status_code INTEGER,
     response_time INTEGER, -- in milliseconds
     cost_cents INTEGER, -- cost in cents for tracking
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP,
     error_message TEXT,
-    metadata JSONB DEFAULT '{}'
+    metadata JSONB DEFAULT '{}',
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Catches rows outside every monthly partition; normally empty
+CREATE TABLE api_usage_log_default PARTITION OF api_usage_log DEFAULT;
+
+CREATE INDEX idx_api_usage_log_created_at ON api_usage_log USING brin(created_at);
+CREATE INDEX idx_api_usage_log_script_id ON api_usage_log(script_id, id DESC);
+
+-- Spending caps enforced by reserve_budget; NULL cap_cents means no cap
+CREATE TABLE budget_caps (
+    period VARCHAR(10) PRIMARY KEY CHECK (period IN ('day', 'month')),
+    cap_cents INTEGER CHECK (cap_cents >= 0),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+INSERT INTO budget_caps (period) VALUES ('day'), ('month');
+
+-- Cost ledger: a reservation is taken before each submit and settled at the
+-- exact price once the task finishes (or released if it fails)
+CREATE TABLE budget_reservations (
+    id SERIAL PRIMARY KEY,
+    script_id VARCHAR(100) NOT NULL REFERENCES video_queue(script_id),
+    size VARCHAR(20) NOT NULL,
+    duration INTEGER NOT NULL,
+    audio BOOLEAN NOT NULL,
+    reserved_cents INTEGER NOT NULL,
+    cost_cents INTEGER, -- set when settled
+    status VARCHAR(20) NOT NULL DEFAULT 'reserved' CHECK (status IN ('reserved', 'settled', 'released')),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    settled_at TIMESTAMP
+);
+
+CREATE INDEX idx_budget_reservations_created_at ON budget_reservations(created_at);
+CREATE UNIQUE INDEX idx_budget_reservations_open ON budget_reservations(script_id) WHERE status = 'reserved';
+
 -- Processing batches for managing 2-3 video groups
 CREATE TABLE processing_batches (
     id SERIAL PRIMARY KEY,
@@ -85,18 +177,50 @@ CREATE TABLE processing_batches (
     metadata JSONB DEFAULT '{}'
 );
 
--- Error log for debugging
+-- Error log for debugging, partitioned by month like api_usage_log
 CREATE TABLE error_log (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     script_id VARCHAR(100) REFERENCES video_queue(script_id),
     error_type VARCHAR(100) NOT NULL,
     error_message TEXT NOT NULL,
     error_context JSONB DEFAULT '{}',
     retry_attempt INTEGER DEFAULT 0,
     resolved BOOLEAN DEFAULT false,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE error_log_default PARTITION OF error_log DEFAULT;
+
+CREATE INDEX idx_error_log_created_at ON error_log USING brin(created_at);
+CREATE INDEX idx_error_log_script_id ON error_log(script_id, id DESC);
+
+-- Script-generation cache: parsed LLM output keyed on the normalized lesson
+-- plus model and prompt version, so re-uploads skip the OpenAI call
+CREATE TABLE script_cache (
+    cache_key CHAR(64) PRIMARY KEY, -- script_cache_key(...)
+    model VARCHAR(50) NOT NULL,
+    prompt_version VARCHAR(50) NOT NULL,
+    scripts JSONB NOT NULL, -- {"shorts": [...], "long_form": {...}}
+    size_bytes INTEGER NOT NULL,
+    hits INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_hit_at TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX idx_script_cache_expires_at ON script_cache(expires_at);
+
+-- Single-row hit/miss counters behind script_cache_summary
+CREATE TABLE script_cache_stats (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    hits BIGINT DEFAULT 0,
+    misses BIGINT DEFAULT 0,
+    evictions BIGINT DEFAULT 0
 );
 
+INSERT INTO script_cache_stats DEFAULT VALUES;
+
 -- Platform posting schedule
 CREATE TABLE posting_schedule (
     id SERIAL PRIMARY KEY,
@@ -111,17 +235,41 @@ CREATE TABLE posting_schedule (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Row counts per queue group, kept exact by the video_queue counter
+-- triggers so queue_status_summary never scans the queue
+CREATE TABLE queue_status_counts (
+    status VARCHAR(20) NOT NULL,
+    script_type VARCHAR(20) NOT NULL,
+    target_platform VARCHAR(50) NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    oldest_item TIMESTAMP,
+    newest_item TIMESTAMP,
+    PRIMARY KEY (status, script_type, target_platform)
+);
+
+-- Per-lesson queue totals behind lesson_progress, kept current by the
+-- video_queue progress triggers; lessons with no queue rows have no row
+CREATE TABLE lesson_progress_rollup (
+    lesson_id VARCHAR(100) PRIMARY KEY,
+    videos_in_queue BIGINT NOT NULL DEFAULT 0,
+    videos_completed BIGINT NOT NULL DEFAULT 0,
+    videos_failed BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_lesson_progress_rollup_failed ON lesson_progress_rollup(lesson_id) WHERE videos_failed > 0;
+
 -- Views for common queries
 CREATE VIEW queue_status_summary AS
 SELECT
     status,
     script_type,
     target_platform,
-    COUNT(*) as count,
-    MIN(created_at) as oldest_item,
-    MAX(created_at) as newest_item
-FROM video_queue
-GROUP BY status, script_type, target_platform;
+    count,
+    oldest_item,
+    newest_item
+FROM queue_status_counts
+WHERE count > 0;
 
 CREATE VIEW lesson_progress AS
 SELECT
@@ -131,12 +279,21 @@ SELECT
     l.processing_status,
     l.total_scripts_generated,
     l.total_videos_created,
-    COUNT(vq.id) as videos_in_queue,
-    COUNT(CASE WHEN vq.status = 'completed' THEN 1 END) as videos_completed,
-    COUNT(CASE WHEN vq.status = 'failed' THEN 1 END) as videos_failed
+    COALESCE(p.videos_in_queue, 0) as videos_in_queue,
+    COALESCE(p.videos_completed, 0) as videos_completed,
+    COALESCE(p.videos_failed, 0) as videos_failed
 FROM lessons l
-LEFT JOIN video_queue vq ON l.lesson_id = vq.lesson_id
-GROUP BY l.lesson_id, l.title, l.subject, l.processing_status, l.total_scripts_generated, l.total_videos_created;
+LEFT JOIN lesson_progress_rollup p ON p.lesson_id = l.lesson_id;
+
+CREATE VIEW script_cache_summary AS
+SELECT
+    (SELECT COUNT(*) FROM script_cache) as entries,
+    (SELECT COALESCE(SUM(size_bytes), 0) FROM script_cache) as total_bytes,
+    s.hits,
+    s.misses,
+    s.evictions,
+    ROUND(s.hits::numeric / NULLIF(s.hits + s.misses, 0), 4) as hit_rate
+FROM script_cache_stats s;
 
 -- Helper functions
 CREATE OR REPLACE FUNCTION get_next_batch(batch_size INTEGER DEFAULT 3)
@@ -162,11 +319,811 @@ $$ LANGUAGE plpgsql;
 CREATE OR REPLACE FUNCTION mark_batch_processing(batch_script_ids TEXT[])
 RETURNS VOID AS $$
 BEGIN
+    -- Rows already taken by claim_batch() keep their batch and start time
     UPDATE video_queue
     SET status = 'processing',
         processing_started_at = CURRENT_TIMESTAMP,
-        batch_id = 'batch_' || to_char(CURRENT_TIMESTAMP, 'YYYYMMDDHH24MISS')
-    WHERE script_id = ANY(batch_script_ids);
+        batch_id = 'batch_' || to_char(CURRENT_TIMESTAMP, 'YYYYMMDDHH24MISS') || '_' || left(md5(random()::text), 8),
+        claimed_by = 'n8n',
+        lease_expires_at = CURRENT_TIMESTAMP + INTERVAL '15 minutes',
+        heartbeat_at = CURRENT_TIMESTAMP
+    WHERE script_id = ANY(batch_script_ids)
+      AND status = 'queued';
+END;
+$$ LANGUAGE plpgsql;
+
+-- Atomically claim up to batch_size queued rows for one worker.
+-- SKIP LOCKED lets any number of workers (n8n or Python) call this
+-- concurrently without ever handing out the same row twice.
+CREATE OR REPLACE FUNCTION claim_batch(worker_id TEXT, batch_size INTEGER DEFAULT 3,
+                                       lease_seconds INTEGER DEFAULT 900)
+RETURNS TABLE (
+    id INTEGER,
+    script_id VARCHAR,
+    lesson_id VARCHAR,
+    content TEXT,
+    script_type VARCHAR,
+    target_platform VARCHAR,
+    priority INTEGER,
+    error_count INTEGER,
+    estimated_attention_span INTEGER,
+    planned_size VARCHAR,
+    planned_duration INTEGER,
+    batch_id VARCHAR
+) AS $$
+DECLARE
+    new_batch_id VARCHAR := 'batch_' || to_char(clock_timestamp(), 'YYYYMMDDHH24MISS')
+                            || '_' || replace(gen_random_uuid()::text, '-', '');
+    claimed_count INTEGER;
+BEGIN
+    RETURN QUERY
+    WITH next_rows AS (
+        SELECT vq.id
+        FROM video_queue vq
+        WHERE vq.status = 'queued'
+          AND vq.error_count < 3
+        ORDER BY vq.priority ASC, vq.created_at ASC
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE video_queue vq
+    SET status = 'processing',
+        processing_started_at = CURRENT_TIMESTAMP,
+        batch_id = new_batch_id,
+        claimed_by = worker_id,
+        lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => lease_seconds),
+        heartbeat_at = CURRENT_TIMESTAMP
+    FROM next_rows
+    WHERE vq.id = next_rows.id
+    RETURNING vq.id, vq.script_id, vq.lesson_id, vq.content, vq.script_type,
+              vq.target_platform, vq.priority, vq.error_count,
+              vq.estimated_attention_span, vq.planned_size, vq.planned_duration,
+              vq.batch_id;
+
+    GET DIAGNOSTICS claimed_count = ROW_COUNT;
+    IF claimed_count > 0 THEN
+        INSERT INTO processing_batches (batch_id, batch_type, total_items, status, started_at, metadata)
+        SELECT new_batch_id,
+               CASE WHEN bool_and(vq.script_type = 'short') THEN 'shorts_only'
+                    WHEN bool_and(vq.script_type = 'long') THEN 'long_only'
+                    ELSE 'mixed' END,
+               claimed_count, 'processing', CURRENT_TIMESTAMP,
+               jsonb_build_object('worker_id', worker_id)
+        FROM video_queue vq
+        WHERE vq.batch_id = new_batch_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Heartbeat: extend the lease on the rows a live worker is still processing
+CREATE OR REPLACE FUNCTION renew_leases(worker_id TEXT, held_script_ids TEXT[],
+                                        lease_seconds INTEGER DEFAULT 900)
+RETURNS INTEGER AS $$
+DECLARE
+    renewed INTEGER;
+BEGIN
+    UPDATE video_queue
+    SET lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => lease_seconds),
+        heartbeat_at = CURRENT_TIMESTAMP
+    WHERE script_id = ANY(held_script_ids)
+      AND claimed_by = worker_id
+      AND status = 'processing';
+    GET DIAGNOSTICS renewed = ROW_COUNT;
+    RETURN renewed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Take over processing rows whose owner stopped heartbeating. The caller
+-- must check the returned task_id with the provider before resubmitting.
+CREATE OR REPLACE FUNCTION claim_expired_leases(worker_id TEXT, batch_size INTEGER DEFAULT 10,
+                                                lease_seconds INTEGER DEFAULT 900)
+RETURNS TABLE (
+    id INTEGER,
+    script_id VARCHAR,
+    content TEXT,
+    previous_owner VARCHAR,
+    task_id TEXT
+) AS $$
+BEGIN
+    RETURN QUERY
+    WITH expired AS (
+        SELECT vq.id, vq.claimed_by
+        FROM video_queue vq
+        WHERE vq.status = 'processing'
+          AND COALESCE(vq.lease_expires_at,
+                       vq.processing_started_at + INTERVAL '15 minutes') < CURRENT_TIMESTAMP
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE video_queue vq
+    SET claimed_by = worker_id,
+        lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => lease_seconds),
+        heartbeat_at = CURRENT_TIMESTAMP
+    FROM expired
+    WHERE vq.id = expired.id
+    RETURNING vq.id, vq.script_id, vq.content, expired.claimed_by,
+              COALESCE((SELECT gt.task_id
+                        FROM generation_tasks gt
+                        WHERE gt.script_id = vq.script_id
+                          AND gt.attempt = vq.error_count
+                          AND gt.task_id IS NOT NULL),
+                       vq.metadata->>'task_id')::TEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Script cache key: whitespace/Unicode-normalized lesson fields (title,
+-- subject and grade level case-folded) plus model and prompt version
+CREATE OR REPLACE FUNCTION script_cache_key(title TEXT, subject TEXT, grade_level TEXT,
+                                            content TEXT, model TEXT, prompt_version TEXT)
+RETURNS CHAR(64) AS $$
+    SELECT encode(sha256(convert_to(concat_ws(chr(31),
+        lower(btrim(regexp_replace(normalize(COALESCE(title, ''), NFC), '\s+', ' ', 'g'))),
+        lower(btrim(regexp_replace(normalize(COALESCE(subject, ''), NFC), '\s+', ' ', 'g'))),
+        lower(btrim(regexp_replace(normalize(COALESCE(grade_level, ''), NFC), '\s+', ' ', 'g'))),
+        btrim(regexp_replace(normalize(COALESCE(content, ''), NFC), '\s+', ' ', 'g')),
+        model, prompt_version), 'UTF8')), 'hex');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Look up cached scripts for a lesson; counts the hit or miss
+CREATE OR REPLACE FUNCTION script_cache_lookup(title TEXT, subject TEXT, grade_level TEXT,
+                                               content TEXT, model TEXT, prompt_version TEXT)
+RETURNS TABLE (
+    cache_key CHAR(64),
+    hit BOOLEAN,
+    scripts JSONB
+) AS $$
+DECLARE
+    key CHAR(64) := script_cache_key(title, subject, grade_level, content, model, prompt_version);
+    cached JSONB;
+BEGIN
+    UPDATE script_cache sc
+    SET hits = sc.hits + 1, last_hit_at = CURRENT_TIMESTAMP
+    WHERE sc.cache_key = key AND sc.expires_at > CURRENT_TIMESTAMP
+    RETURNING sc.scripts INTO cached;
+
+    UPDATE script_cache_stats s
+    SET hits = s.hits + (cached IS NOT NULL)::int,
+        misses = s.misses + (cached IS NULL)::int;
+
+    RETURN QUERY SELECT key, cached IS NOT NULL, cached;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drop expired entries, then least recently used ones until the cache
+-- fits in max_bytes. Returns the number of entries removed.
+CREATE OR REPLACE FUNCTION script_cache_evict(max_bytes BIGINT DEFAULT 268435456)
+RETURNS INTEGER AS $$
+DECLARE
+    expired INTEGER;
+    evicted INTEGER;
+BEGIN
+    DELETE FROM script_cache WHERE expires_at <= CURRENT_TIMESTAMP;
+    GET DIAGNOSTICS expired = ROW_COUNT;
+
+    WITH ranked AS (
+        SELECT sc.cache_key,
+               SUM(sc.size_bytes) OVER (ORDER BY COALESCE(sc.last_hit_at, sc.created_at) DESC,
+                                                 sc.cache_key) AS running_bytes
+        FROM script_cache sc
+    )
+    DELETE FROM script_cache sc
+    USING ranked
+    WHERE sc.cache_key = ranked.cache_key AND ranked.running_bytes > max_bytes;
+    GET DIAGNOSTICS evicted = ROW_COUNT;
+
+    UPDATE script_cache_stats SET evictions = evictions + expired + evicted;
+    RETURN expired + evicted;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Store parsed scripts for a key returned by script_cache_lookup, then trim
+CREATE OR REPLACE FUNCTION script_cache_store(key TEXT, model TEXT, prompt_version TEXT,
+                                              scripts JSONB,
+                                              ttl INTERVAL DEFAULT INTERVAL '30 days',
+                                              max_bytes BIGINT DEFAULT 268435456)
+RETURNS INTEGER AS $$
+BEGIN
+    INSERT INTO script_cache (cache_key, model, prompt_version, scripts, size_bytes, expires_at)
+    VALUES (key, model, prompt_version, scripts, octet_length(scripts::text),
+            CURRENT_TIMESTAMP + ttl)
+    ON CONFLICT (cache_key) DO UPDATE
+        SET scripts = EXCLUDED.scripts, size_bytes = EXCLUDED.size_bytes,
+            created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at;
+    RETURN script_cache_evict(max_bytes);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Lenient integer cast for model output ("30", 30.0, "about 30" -> NULL)
+CREATE OR REPLACE FUNCTION json_int(value TEXT)
+RETURNS INTEGER AS $$
+    SELECT CASE WHEN btrim(value) ~ '^-?[0-9]+(\.[0-9]*)?$'
+                THEN trunc(btrim(value)::numeric)::integer END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Queue the short scripts of one lesson ({"lesson_id", "lesson_title",
+-- "shorts": [...]}) or of an array of them in a single statement, and set
+-- each lesson's counters in the same transaction. Script ids are
+-- <lesson_id>_<platform>_<n>, or <lesson_id>_r<revision>_<platform>_<n> once
+-- an import has changed the lesson, so regenerated scripts never collide
+-- with the previous version's rows. Scripts already queued are left alone.
+CREATE OR REPLACE FUNCTION enqueue_scripts(batch JSONB)
+RETURNS TABLE (
+    lesson_id VARCHAR(100),
+    scripts INTEGER,
+    queued INTEGER
+) AS $$
+    WITH batch_lessons AS (
+        SELECT b.value->>'lesson_id' AS lesson_id,
+               b.value->>'lesson_title' AS lesson_title,
+               CASE WHEN jsonb_typeof(b.value->'shorts') = 'array'
+                    THEN b.value->'shorts' ELSE '[]' END AS shorts,
+               COALESCE(l.content_revision, 0) AS revision
+        FROM jsonb_array_elements(CASE WHEN jsonb_typeof(batch) = 'array'
+                                       THEN batch ELSE jsonb_build_array(batch) END) b
+        LEFT JOIN lessons l ON l.lesson_id = b.value->>'lesson_id'
+    ), inserted AS (
+        INSERT INTO video_queue (lesson_id, lesson_title, script_id, script_type, content,
+                                 hook_text, target_platform, priority, adhd_optimized,
+                                 estimated_attention_span, natural_pause_points, metadata)
+        SELECT bl.lesson_id, bl.lesson_title,
+               concat(bl.lesson_id, '_',
+                      CASE WHEN bl.revision > 0 THEN concat('r', bl.revision, '_') END,
+                      s.value->>'platform', '_', s.n - 1),
+               'short', COALESCE(s.value->>'content', ''), s.value->>'hook',
+               s.value->>'platform', 1, true, json_int(s.value->>'duration'),
+               NULLIF(ARRAY(SELECT json_int(p)
+                            FROM jsonb_array_elements_text(
+                                CASE WHEN jsonb_typeof(s.value->'pause_points') = 'array'
+                                     THEN s.value->'pause_points' ELSE '[]' END) p),
+                      '{}'),
+               s.value
+        FROM batch_lessons bl
+        CROSS JOIN LATERAL jsonb_array_elements(bl.shorts) WITH ORDINALITY AS s(value, n)
+        ON CONFLICT (script_id) DO NOTHING
+        RETURNING video_queue.lesson_id
+    ), updated AS (
+        UPDATE lessons l
+        SET processing_status = 'processing',
+            total_scripts_generated = jsonb_array_length(bl.shorts),
+            claim_expires_at = NULL,
+            updated_at = CURRENT_TIMESTAMP
+        FROM batch_lessons bl
+        WHERE l.lesson_id = bl.lesson_id
+    )
+    SELECT bl.lesson_id::VARCHAR(100), jsonb_array_length(bl.shorts),
+           COALESCE(i.queued, 0)::integer
+    FROM batch_lessons bl
+    LEFT JOIN (SELECT inserted.lesson_id, COUNT(*) AS queued
+               FROM inserted GROUP BY inserted.lesson_id) i
+        ON i.lesson_id = bl.lesson_id;
+$$ LANGUAGE sql;
+
+-- Wake Python queue workers (LISTEN video_queue_insert) as soon as scripts are queued
+CREATE OR REPLACE FUNCTION notify_video_queue_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('video_queue_insert', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_video_queue_notify_insert
+    AFTER INSERT ON video_queue
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_video_queue_insert();
+
+-- Push each new row and status change to the dashboard (LISTEN video_queue_status)
+CREATE OR REPLACE FUNCTION notify_video_queue_status()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('video_queue_status', json_build_object(
+        'script_id', NEW.script_id,
+        'lesson_id', NEW.lesson_id,
+        'lesson_title', NEW.lesson_title,
+        'script_type', NEW.script_type,
+        'target_platform', NEW.target_platform,
+        'status', NEW.status,
+        'old_status', CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END,
+        'created_at', NEW.created_at,
+        'changed_at', clock_timestamp()
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_video_queue_notify_status_insert
+    AFTER INSERT ON video_queue
+    FOR EACH ROW EXECUTE FUNCTION notify_video_queue_status();
+
+CREATE TRIGGER trg_video_queue_notify_status_update
+    AFTER UPDATE OF status ON video_queue
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION notify_video_queue_status();
+
+-- Apply one group's share of a statement's changes to queue_status_counts.
+-- oldest/newest are only recounted (two index probes) when a row at either
+-- end of the group left it.
+CREATE OR REPLACE FUNCTION queue_status_counts_bump(p_status TEXT, p_script_type TEXT,
+                                                    p_target_platform TEXT,
+                                                    added BIGINT, removed BIGINT,
+                                                    added_oldest TIMESTAMP, added_newest TIMESTAMP,
+                                                    removed_oldest TIMESTAMP, removed_newest TIMESTAMP)
+RETURNS VOID AS $$
+DECLARE
+    c queue_status_counts%ROWTYPE;
+BEGIN
+    INSERT INTO queue_status_counts AS qc (status, script_type, target_platform, count,
+                                           oldest_item, newest_item)
+    VALUES (p_status, p_script_type, p_target_platform, added - removed,
+            added_oldest, added_newest)
+    ON CONFLICT (status, script_type, target_platform) DO UPDATE
+        SET count = qc.count + EXCLUDED.count,
+            oldest_item = LEAST(qc.oldest_item, EXCLUDED.oldest_item),
+            newest_item = GREATEST(qc.newest_item, EXCLUDED.newest_item)
+    RETURNING * INTO c;
+
+    IF c.count <= 0 THEN
+        DELETE FROM queue_status_counts qc
+        WHERE qc.status = p_status AND qc.script_type = p_script_type
+          AND qc.target_platform = p_target_platform;
+    ELSIF removed > 0 AND (removed_oldest <= c.oldest_item OR removed_newest >= c.newest_item) THEN
+        UPDATE queue_status_counts qc
+        SET oldest_item = (SELECT MIN(vq.created_at) FROM video_queue vq
+                           WHERE vq.status = p_status AND vq.script_type = p_script_type
+                             AND vq.target_platform = p_target_platform),
+            newest_item = (SELECT MAX(vq.created_at) FROM video_queue vq
+                           WHERE vq.status = p_status AND vq.script_type = p_script_type
+                             AND vq.target_platform = p_target_platform)
+        WHERE qc.status = p_status AND qc.script_type = p_script_type
+          AND qc.target_platform = p_target_platform;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level: one bump per affected group, in key order so concurrent
+-- statements lock counter rows in the same order
+CREATE OR REPLACE FUNCTION video_queue_count_changes()
+RETURNS TRIGGER AS $$
+DECLARE
+    d RECORD;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        FOR d IN
+            SELECT status, script_type, target_platform, COUNT(*) AS added, 0 AS removed,
+                   MIN(created_at) AS added_oldest, MAX(created_at) AS added_newest,
+                   NULL::timestamp AS removed_oldest, NULL::timestamp AS removed_newest
+            FROM new_rows
+            GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+        LOOP
+            PERFORM queue_status_counts_bump(d.status, d.script_type, d.target_platform,
+                                             d.added, d.removed, d.added_oldest,
+                                             d.added_newest, d.removed_oldest,
+                                             d.removed_newest);
+        END LOOP;
+    ELSIF TG_OP = 'DELETE' THEN
+        FOR d IN
+            SELECT status, script_type, target_platform, 0 AS added, COUNT(*) AS removed,
+                   NULL::timestamp AS added_oldest, NULL::timestamp AS added_newest,
+                   MIN(created_at) AS removed_oldest, MAX(created_at) AS removed_newest
+            FROM old_rows
+            GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+        LOOP
+            PERFORM queue_status_counts_bump(d.status, d.script_type, d.target_platform,
+                                             d.added, d.removed, d.added_oldest,
+                                             d.added_newest, d.removed_oldest,
+                                             d.removed_newest);
+        END LOOP;
+    ELSE
+        -- Only rows that moved between groups (heartbeats, metadata etc. don't)
+        FOR d IN
+            WITH moved AS (
+                SELECT o.status AS old_status, o.script_type AS old_script_type,
+                       o.target_platform AS old_target_platform, o.created_at AS old_created_at,
+                       n.status, n.script_type, n.target_platform, n.created_at
+                FROM old_rows o
+                JOIN new_rows n ON n.id = o.id
+                WHERE (o.status, o.script_type, o.target_platform, o.created_at)
+                      IS DISTINCT FROM (n.status, n.script_type, n.target_platform, n.created_at)
+            ), changes AS (
+                SELECT status, script_type, target_platform, created_at, 1 AS n FROM moved
+                UNION ALL
+                SELECT old_status, old_script_type, old_target_platform, old_created_at, -1 FROM moved
+            )
+            SELECT status, script_type, target_platform,
+                   COUNT(*) FILTER (WHERE n > 0) AS added,
+                   COUNT(*) FILTER (WHERE n < 0) AS removed,
+                   MIN(created_at) FILTER (WHERE n > 0) AS added_oldest,
+                   MAX(created_at) FILTER (WHERE n > 0) AS added_newest,
+                   MIN(created_at) FILTER (WHERE n < 0) AS removed_oldest,
+                   MAX(created_at) FILTER (WHERE n < 0) AS removed_newest
+            FROM changes
+            GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+        LOOP
+            PERFORM queue_status_counts_bump(d.status, d.script_type, d.target_platform,
+                                             d.added, d.removed, d.added_oldest,
+                                             d.added_newest, d.removed_oldest,
+                                             d.removed_newest);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_video_queue_count_insert
+    AFTER INSERT ON video_queue
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION video_queue_count_changes();
+
+CREATE TRIGGER trg_video_queue_count_update
+    AFTER UPDATE ON video_queue
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION video_queue_count_changes();
+
+CREATE TRIGGER trg_video_queue_count_delete
+    AFTER DELETE ON video_queue
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION video_queue_count_changes();
+
+-- Add per-lesson deltas (parallel arrays, sorted by lesson_id) to
+-- lesson_progress_rollup and drop lessons left with no queue rows
+CREATE OR REPLACE FUNCTION lesson_progress_bump(lesson_ids TEXT[], in_queue BIGINT[],
+                                                completed BIGINT[], failed BIGINT[])
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO lesson_progress_rollup AS p (lesson_id, videos_in_queue, videos_completed,
+                                             videos_failed)
+    SELECT * FROM unnest(lesson_ids, in_queue, completed, failed)
+    ON CONFLICT (lesson_id) DO UPDATE
+        SET videos_in_queue = p.videos_in_queue + EXCLUDED.videos_in_queue,
+            videos_completed = p.videos_completed + EXCLUDED.videos_completed,
+            videos_failed = p.videos_failed + EXCLUDED.videos_failed,
+            updated_at = CURRENT_TIMESTAMP;
+
+    DELETE FROM lesson_progress_rollup
+    WHERE lesson_id = ANY(lesson_ids) AND videos_in_queue <= 0;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION video_queue_progress_changes()
+RETURNS TRIGGER AS $$
+DECLARE
+    ids TEXT[];
+    in_queue BIGINT[];
+    completed BIGINT[];
+    failed BIGINT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(lesson_id ORDER BY lesson_id),
+               array_agg(n ORDER BY lesson_id),
+               array_agg(c ORDER BY lesson_id),
+               array_agg(f ORDER BY lesson_id)
+        INTO ids, in_queue, completed, failed
+        FROM (SELECT lesson_id, COUNT(*) AS n,
+                     COUNT(*) FILTER (WHERE status = 'completed') AS c,
+                     COUNT(*) FILTER (WHERE status = 'failed') AS f
+              FROM new_rows GROUP BY lesson_id) d;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(lesson_id ORDER BY lesson_id),
+               array_agg(-n ORDER BY lesson_id),
+               array_agg(-c ORDER BY lesson_id),
+               array_agg(-f ORDER BY lesson_id)
+        INTO ids, in_queue, completed, failed
+        FROM (SELECT lesson_id, COUNT(*) AS n,
+                     COUNT(*) FILTER (WHERE status = 'completed') AS c,
+                     COUNT(*) FILTER (WHERE status = 'failed') AS f
+              FROM old_rows GROUP BY lesson_id) d;
+    ELSE
+        WITH moved AS (
+            SELECT o.lesson_id AS old_lesson_id, o.status AS old_status,
+                   n.lesson_id, n.status
+            FROM old_rows o
+            JOIN new_rows n ON n.id = o.id
+            WHERE (o.lesson_id, o.status) IS DISTINCT FROM (n.lesson_id, n.status)
+        ), changes AS (
+            SELECT lesson_id, status, 1 AS n FROM moved
+            UNION ALL
+            SELECT old_lesson_id, old_status, -1 FROM moved
+        ), d AS (
+            SELECT lesson_id, SUM(n) AS n,
+                   COALESCE(SUM(n) FILTER (WHERE status = 'completed'), 0) AS c,
+                   COALESCE(SUM(n) FILTER (WHERE status = 'failed'), 0) AS f
+            FROM changes GROUP BY lesson_id
+        )
+        SELECT array_agg(lesson_id ORDER BY lesson_id),
+               array_agg(n ORDER BY lesson_id),
+               array_agg(c ORDER BY lesson_id),
+               array_agg(f ORDER BY lesson_id)
+        INTO ids, in_queue, completed, failed
+        FROM d
+        WHERE (n, c, f) <> (0, 0, 0);
+    END IF;
+
+    IF ids IS NOT NULL THEN
+        PERFORM lesson_progress_bump(ids, in_queue, completed, failed);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_video_queue_progress_insert
+    AFTER INSERT ON video_queue
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION video_queue_progress_changes();
+
+CREATE TRIGGER trg_video_queue_progress_update
+    AFTER UPDATE ON video_queue
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION video_queue_progress_changes();
+
+CREATE TRIGGER trg_video_queue_progress_delete
+    AFTER DELETE ON video_queue
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION video_queue_progress_changes();
+
+-- Recompute lesson_progress_rollup from video_queue for one lesson, or for
+-- all of them when p_lesson_id is NULL. Returns the number of rollup rows
+-- that were wrong.
+CREATE OR REPLACE FUNCTION refresh_lesson_progress(p_lesson_id TEXT DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    created INTEGER := 0;
+    fixed INTEGER;
+    stale INTEGER;
+BEGIN
+    IF p_lesson_id IS NULL THEN
+        LOCK TABLE lesson_progress_rollup IN SHARE ROW EXCLUSIVE MODE;
+    ELSE
+        -- Hold the lesson's rollup row (creating it if need be) so trigger
+        -- updates in flight finish first and later ones apply on top
+        INSERT INTO lesson_progress_rollup (lesson_id) VALUES (p_lesson_id)
+        ON CONFLICT (lesson_id) DO NOTHING;
+        GET DIAGNOSTICS created = ROW_COUNT;
+        PERFORM 1 FROM lesson_progress_rollup WHERE lesson_id = p_lesson_id FOR UPDATE;
+    END IF;
+
+    WITH actual AS (
+        SELECT lesson_id, COUNT(*) AS videos_in_queue,
+               COUNT(*) FILTER (WHERE status = 'completed') AS videos_completed,
+               COUNT(*) FILTER (WHERE status = 'failed') AS videos_failed
+        FROM video_queue
+        WHERE p_lesson_id IS NULL OR lesson_id = p_lesson_id
+        GROUP BY lesson_id
+    )
+    INSERT INTO lesson_progress_rollup AS p (lesson_id, videos_in_queue, videos_completed,
+                                             videos_failed)
+    SELECT a.* FROM actual a
+    LEFT JOIN lesson_progress_rollup r USING (lesson_id)
+    WHERE (r.videos_in_queue, r.videos_completed, r.videos_failed)
+          IS DISTINCT FROM (a.videos_in_queue, a.videos_completed, a.videos_failed)
+    ON CONFLICT (lesson_id) DO UPDATE
+        SET videos_in_queue = EXCLUDED.videos_in_queue,
+            videos_completed = EXCLUDED.videos_completed,
+            videos_failed = EXCLUDED.videos_failed,
+            updated_at = CURRENT_TIMESTAMP;
+    GET DIAGNOSTICS fixed = ROW_COUNT;
+
+    DELETE FROM lesson_progress_rollup p
+    WHERE (p_lesson_id IS NULL OR p.lesson_id = p_lesson_id)
+      AND NOT EXISTS (SELECT 1 FROM video_queue vq WHERE vq.lesson_id = p.lesson_id);
+    GET DIAGNOSTICS stale = ROW_COUNT;
+
+    -- The placeholder row was never wrong, just unneeded
+    RETURN fixed + stale - LEAST(created, stale);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Cents a reservation counts against the caps: the estimate while open,
+-- the settled cost afterwards
+CREATE OR REPLACE FUNCTION budget_charge(r budget_reservations)
+RETURNS INTEGER AS $$
+    SELECT CASE r.status WHEN 'reserved' THEN r.reserved_cents
+                         WHEN 'settled' THEN r.cost_cents
+                         ELSE 0 END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Reserve p_cents for one submit of p_script_id if it fits under the daily
+-- and monthly caps. The cap rows are locked, so concurrent workers reserve
+-- one at a time. A script's open reservation is returned as is, so a retry
+-- after a crash does not count twice. When a cap is hit reservation_id is
+-- NULL, limited_by names the cap and retry_in is the seconds until its
+-- period rolls over.
+CREATE OR REPLACE FUNCTION reserve_budget(p_script_id TEXT, p_size TEXT, p_duration INTEGER,
+                                          p_audio BOOLEAN, p_cents INTEGER)
+RETURNS TABLE(reservation_id INTEGER, reserved_cents INTEGER, size VARCHAR(20),
+              duration INTEGER, audio BOOLEAN, limited_by VARCHAR(10),
+              retry_in DOUBLE PRECISION) AS $$
+DECLARE
+    day_cap INTEGER;
+    month_cap INTEGER;
+    day_start TIMESTAMP := date_trunc('day', LOCALTIMESTAMP);
+    month_start TIMESTAMP := date_trunc('month', LOCALTIMESTAMP);
+    day_spent BIGINT;
+    month_spent BIGINT;
+BEGIN
+    PERFORM 1 FROM budget_caps FOR UPDATE;
+
+    RETURN QUERY
+    SELECT r.id, r.reserved_cents, r.size, r.duration, r.audio, NULL::VARCHAR(10),
+           NULL::DOUBLE PRECISION
+    FROM budget_reservations r
+    WHERE r.script_id = p_script_id AND r.status = 'reserved';
+    IF FOUND THEN
+        RETURN;
+    END IF;
+
+    SELECT MAX(cap_cents) FILTER (WHERE period = 'day'),
+           MAX(cap_cents) FILTER (WHERE period = 'month')
+    INTO day_cap, month_cap
+    FROM budget_caps;
+
+    SELECT COALESCE(SUM(budget_charge(r)) FILTER (WHERE r.created_at >= day_start), 0),
+           COALESCE(SUM(budget_charge(r)), 0)
+    INTO day_spent, month_spent
+    FROM budget_reservations r
+    WHERE r.created_at >= month_start;
+
+    IF month_cap IS NOT NULL AND month_spent + p_cents > month_cap THEN
+        RETURN QUERY SELECT NULL::INTEGER, p_cents, p_size::VARCHAR(20), p_duration, p_audio,
+                            'month'::VARCHAR(10),
+                            EXTRACT(EPOCH FROM month_start + INTERVAL '1 month' - LOCALTIMESTAMP)::DOUBLE PRECISION;
+        RETURN;
+    END IF;
+    IF day_cap IS NOT NULL AND day_spent + p_cents > day_cap THEN
+        RETURN QUERY SELECT NULL::INTEGER, p_cents, p_size::VARCHAR(20), p_duration, p_audio,
+                            'day'::VARCHAR(10),
+                            EXTRACT(EPOCH FROM day_start + INTERVAL '1 day' - LOCALTIMESTAMP)::DOUBLE PRECISION;
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    INSERT INTO budget_reservations AS r (script_id, size, duration, audio, reserved_cents)
+    VALUES (p_script_id, p_size, p_duration, p_audio, p_cents)
+    RETURNING r.id, r.reserved_cents, r.size, r.duration, r.audio, NULL::VARCHAR(10),
+              NULL::DOUBLE PRECISION;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Settle a script's open reservation at its exact cost (0 releases it).
+-- Returns the reservation id, or NULL if the script had none open. The cost
+-- also goes on the api_usage_log row of the status check that saw the task
+-- finish, written with it by the caller.
+CREATE OR REPLACE FUNCTION settle_budget(p_script_id TEXT, p_cost_cents INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    settled_id INTEGER;
+BEGIN
+    UPDATE budget_reservations
+    SET status = CASE WHEN p_cost_cents > 0 THEN 'settled' ELSE 'released' END,
+        cost_cents = p_cost_cents, settled_at = CURRENT_TIMESTAMP
+    WHERE script_id = p_script_id AND status = 'reserved'
+    RETURNING id INTO settled_id;
+    RETURN settled_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create the monthly api_usage_log / error_log partitions (named
+-- <table>_pYYYYMM) from this month through months_ahead months from now,
+-- plus any month that already has rows in the _default partition (written
+-- while maintenance was not running). Those rows are moved into their new
+-- partition: the default is detached, the month created and filled, and the
+-- default reattached, since creating a partition whose range the default
+-- already holds rows for fails. A month that still cannot be created is
+-- skipped with a warning so the others are. Returns the number of
+-- partitions created.
+CREATE OR REPLACE FUNCTION ensure_log_partitions(months_ahead INTEGER DEFAULT 2)
+RETURNS INTEGER AS $$
+DECLARE
+    parent TEXT;
+    default_name TEXT;
+    month_start DATE;
+    month_end DATE;
+    partition_name TEXT;
+    stranded BOOLEAN;
+    created INTEGER := 0;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY['api_usage_log', 'error_log'] LOOP
+        default_name := parent || '_default';
+        FOR month_start IN EXECUTE format(
+            'SELECT generate_series(date_trunc(''month'', CURRENT_DATE),
+                                    date_trunc(''month'', CURRENT_DATE) + make_interval(months => $1),
+                                    INTERVAL ''1 month'')::date
+             UNION
+             SELECT DISTINCT date_trunc(''month'', created_at)::date FROM %I
+             ORDER BY 1', default_name) USING months_ahead
+        LOOP
+            partition_name := parent || '_p' || to_char(month_start, 'YYYYMM');
+            CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+            month_end := (month_start + INTERVAL '1 month')::date;
+            BEGIN
+                EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE created_at >= $1 AND created_at < $2)',
+                               default_name)
+                    INTO stranded USING month_start, month_end;
+                IF stranded THEN
+                    EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent, default_name);
+                END IF;
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, parent, month_start, month_end);
+                IF stranded THEN
+                    EXECUTE format('WITH moved AS (
+                                        DELETE FROM %I WHERE created_at >= $1 AND created_at < $2
+                                        RETURNING *)
+                                    INSERT INTO %I SELECT * FROM moved',
+                                   default_name, partition_name)
+                        USING month_start, month_end;
+                    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I DEFAULT', parent, default_name);
+                END IF;
+                created := created + 1;
+            EXCEPTION WHEN OTHERS THEN
+                RAISE WARNING 'ensure_log_partitions: skipping %: %', partition_name, SQLERRM;
+            END;
+        END LOOP;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drop monthly log partitions that ended more than keep_months months ago.
+-- Returns the number of partitions dropped.
+CREATE OR REPLACE FUNCTION drop_expired_log_partitions(keep_months INTEGER DEFAULT 6)
+RETURNS INTEGER AS $$
+DECLARE
+    part RECORD;
+    cutoff DATE := (date_trunc('month', CURRENT_DATE) - make_interval(months => keep_months))::date;
+    dropped INTEGER := 0;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname IN ('api_usage_log', 'error_log')
+          AND c.relname ~ '_p[0-9]{6}$'
+          AND to_date(right(c.relname, 6), 'YYYYMM') < cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('DROP TABLE %I', part.relname);
+        dropped := dropped + 1;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_log_partitions();
+
+-- Recount queue_status_counts from video_queue and fix any drift (e.g. after
+-- TRUNCATE, which fires no row triggers). Blocks counter updates while it
+-- runs. Returns the number of groups corrected.
+CREATE OR REPLACE FUNCTION repair_queue_status_counts()
+RETURNS INTEGER AS $$
+DECLARE
+    fixed INTEGER;
+    stale INTEGER;
+BEGIN
+    LOCK TABLE queue_status_counts IN SHARE ROW EXCLUSIVE MODE;
+
+    WITH actual AS (
+        SELECT status, script_type, target_platform, COUNT(*) AS count,
+               MIN(created_at) AS oldest_item, MAX(created_at) AS newest_item
+        FROM video_queue
+        GROUP BY status, script_type, target_platform
+    )
+    INSERT INTO queue_status_counts AS qc (status, script_type, target_platform, count,
+                                           oldest_item, newest_item)
+    SELECT a.* FROM actual a
+    LEFT JOIN queue_status_counts c USING (status, script_type, target_platform)
+    WHERE (c.count, c.oldest_item, c.newest_item)
+          IS DISTINCT FROM (a.count, a.oldest_item, a.newest_item)
+    ON CONFLICT (status, script_type, target_platform) DO UPDATE
+        SET count = EXCLUDED.count, oldest_item = EXCLUDED.oldest_item,
+            newest_item = EXCLUDED.newest_item;
+    GET DIAGNOSTICS fixed = ROW_COUNT;
+
+    DELETE FROM queue_status_counts qc
+    WHERE NOT EXISTS (SELECT 1 FROM video_queue vq
+                      WHERE vq.status = qc.status AND vq.script_type = qc.script_type
+                        AND vq.target_platform = qc.target_platform);
+    GET DIAGNOSTICS stale = ROW_COUNT;
+
+    RETURN fixed + stale;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -0,0 +1,45 @@
+"""
+ProfBrainRot Python pipeline components.
+
+The n8n workflows remain the reference pipeline; this package holds the
+pieces that need to run natively (API client, worker, queue tooling).
+"""
+
+from .cache import GenerationCache, cache_key
+from .dedup import DuplicateIndex
+from .downloader import DownloadError, DownloadResult, RangeDownloader
+from .downloads import DownloadQueue
+from .poller import DurationModel, TaskPoller
+from .scheduler import SubmissionScheduler, TokenBucket
+from .scriptgen import Lesson, ScriptGenerator, ScriptSet
+from .wan25 import (
+    GenerationParams,
+    RateLimitError,
+    Task,
+    TaskStatus,
+    Wan25Client,
+    Wan25Error,
+)
+
+__all__ = [
+    "DownloadError",
+    "DownloadQueue",
+    "DownloadResult",
+    "DuplicateIndex",
+    "DurationModel",
+    "GenerationCache",
+    "GenerationParams",
+    "Lesson",
+    "RangeDownloader",
+    "RateLimitError",
+    "ScriptGenerator",
+    "ScriptSet",
+    "SubmissionScheduler",
+    "Task",
+    "TaskPoller",
+    "TaskStatus",
+    "TokenBucket",
+    "Wan25Client",
+    "Wan25Error",
+    "cache_key",
+]
@@ -0,0 +1,242 @@
+"""
+Batch script generation for lesson backlogs.
+
+The lesson processor workflow generates scripts for one webhook at a time,
+each execution blocked on a single completion. :class:`BatchScriptGenerator`
+works through every ``pending`` lesson with a bounded pool of concurrent
+completions, paced by request-per-minute and token-per-minute budgets, and
+queues each lesson's scripts the moment its completion arrives. Cached
+lessons (see :mod:`profbrainrot.scriptgen`) skip the API and the budgets.
+
+Run with ``python -m profbrainrot.batchgen``.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, Optional
+
+import aiohttp
+
+from . import db
+from .scheduler import TokenBucket
+from .scriptgen import (
+    Lesson,
+    OpenAIError,
+    ScriptGenerationError,
+    ScriptGenerator,
+    ScriptSet,
+)
+
+logger = logging.getLogger(__name__)
+
+# Rough prompt-size estimate used to reserve TPM budget before a call;
+# the reservation is settled against the reported usage afterwards.
+CHARS_PER_TOKEN = 4
+
+
+class BatchScriptGenerator:
+    """Generates and queues scripts for many lessons concurrently.
+
+    At most ``concurrency`` completions run at once. Each call first takes
+    one token from the ``requests_per_minute`` bucket and its estimated
+    size (prompt plus ``completion_tokens``) from the ``tokens_per_minute``
+    bucket. Claimed lessons are leased for ``lease_seconds``; if a run dies
+    before queueing a lesson's scripts, a later run claims it again.
+    """
+
+    def __init__(self, generator: ScriptGenerator, pool,
+                 concurrency: int = 8, requests_per_minute: float = 500,
+                 tokens_per_minute: float = 40000,
+                 completion_tokens: int = 1500, max_retries: int = 3,
+                 lease_seconds: int = 900):
+        self.generator = generator
+        self.pool = pool
+        self.concurrency = concurrency
+        self.completion_tokens = completion_tokens
+        self.max_retries = max_retries
+        self.lease_seconds = lease_seconds
+        self.requests = TokenBucket(requests_per_minute / 60.0,
+                                    requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self._started = None
+        self.generated = 0
+        self.cached = 0
+        self.failed = 0
+        self.scripts_queued = 0
+        self.tokens_used = 0
+        self.throttled = 0
+
+    def stats(self) -> Dict[str, float]:
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        done = self.generated + self.cached
+        return {
+            "generated": self.generated,
+            "cached": self.cached,
+            "failed": self.failed,
+            "scripts_queued": self.scripts_queued,
+            "tokens_used": self.tokens_used,
+            "throttled": self.throttled,
+            "elapsed_s": elapsed,
+            "lessons_per_min": done * 60.0 / elapsed if elapsed else 0.0,
+        }
+
+    # -- running ---------------------------------------------------------
+
+    async def run(self, lessons: Optional[Iterable[Lesson]] = None,
+                  limit: Optional[int] = None) -> Dict[str, float]:
+        """Process ``lessons``, or claim pending lessons from the database.
+
+        Returns :meth:`stats` once every lesson has been queued or failed.
+        """
+        self._started = time.monotonic()
+        queue = asyncio.Queue(maxsize=self.concurrency)
+        workers = [asyncio.create_task(self._work(queue))
+                   for _ in range(self.concurrency)]
+        try:
+            if lessons is not None:
+                for count, lesson in enumerate(lessons):
+                    if limit is not None and count >= limit:
+                        break
+                    await queue.put(lesson)
+            else:
+                await self._claim_into(queue, limit)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+        return self.stats()
+
+    async def _claim_into(self, queue: asyncio.Queue,
+                          limit: Optional[int]) -> None:
+        # Claim a page at a time, only as fast as the pool drains it, so
+        # lessons are not left marked processing by a run that is still
+        # working through earlier pages.
+        claimed = 0
+        while limit is None or claimed < limit:
+            page = self.concurrency
+            if limit is not None:
+                page = min(page, limit - claimed)
+            async with self.pool.acquire() as conn:
+                rows = await db.claim_pending_lessons(conn, page,
+                                                     self.lease_seconds)
+            if not rows:
+                return
+            claimed += len(rows)
+            for row in rows:
+                await queue.put(Lesson(row["lesson_id"], row["title"],
+                                       row["subject"], row["grade_level"],
+                                       row["original_content"]))
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            lesson = await queue.get()
+            if lesson is None:
+                return
+            try:
+                await self.process(lesson)
+            except Exception as e:
+                self.failed += 1
+                logger.error("Script generation failed for %s: %s",
+                             lesson.lesson_id, e)
+                try:
+                    async with self.pool.acquire() as conn:
+                        await db.mark_lesson_failed(conn, lesson.lesson_id,
+                                                    str(e))
+                except Exception:
+                    logger.exception("Could not mark %s failed",
+                                     lesson.lesson_id)
+
+    async def process(self, lesson: Lesson) -> int:
+        """Generate (or fetch) and queue scripts for one lesson."""
+        key, scripts = await self.generator.lookup(lesson)
+        if scripts is not None:
+            self.cached += 1
+        else:
+            scripts = await self._complete(lesson)
+            await self.generator.store(key, scripts)
+            self.generated += 1
+        async with self.pool.acquire() as conn:
+            queued = await db.enqueue_scripts(conn, lesson.lesson_id,
+                                              lesson.title, scripts.shorts)
+        self.scripts_queued += queued
+        logger.info("Queued %d script(s) for %s%s", queued, lesson.lesson_id,
+                    " (cached)" if scripts.cached else "")
+        return queued
+
+    def estimate_tokens(self, lesson: Lesson) -> int:
+        prompt = sum(len(m["content"]) for m in self.generator.messages(lesson))
+        return min(int(self.tokens.capacity),
+                   prompt // CHARS_PER_TOKEN + self.completion_tokens)
+
+    async def _complete(self, lesson: Lesson) -> ScriptSet:
+        estimate = self.estimate_tokens(lesson)
+        attempt = 0
+        while True:
+            await self.requests.acquire()
+            await self.tokens.acquire(estimate)
+            throttled = False
+            try:
+                scripts = await self.generator.complete(lesson)
+            except OpenAIError as e:
+                retryable = e.status == 429 or e.status >= 500
+                if e.status == 429:
+                    throttled = True
+                    self.throttled += 1
+                    backoff = e.retry_after or 2.0 ** attempt
+                    self.requests.drain(backoff)
+                    self.tokens.drain(backoff)
+                error = e
+            except ScriptGenerationError as e:
+                retryable, error = True, e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retryable, error = True, e
+            else:
+                used = scripts.usage.get("total_tokens", estimate)
+                self.tokens.adjust(used - estimate)
+                self.tokens_used += used
+                return scripts
+            attempt += 1
+            if not retryable or attempt > self.max_retries:
+                raise error
+            logger.warning("Retrying %s (attempt %d): %s", lesson.lesson_id,
+                           attempt, error)
+            if not throttled:
+                # After a 429 the drained buckets already hold the retry back.
+                await asyncio.sleep(2.0 ** (attempt - 1))
+
+
+async def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--limit", type=int, default=None,
+                        help="stop after this many lessons (default: all pending)")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="completions in flight")
+    parser.add_argument("--rpm", type=float, default=500,
+                        help="OpenAI requests per minute")
+    parser.add_argument("--tpm", type=float, default=40000,
+                        help="OpenAI tokens per minute")
+    parser.add_argument("--dsn", default=None,
+                        help="Postgres DSN (default: DATABASE_URL / DB_POSTGRESDB_*)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    pool = await db.create_pool(args.dsn, max_size=args.concurrency + 2)
+    try:
+        async with ScriptGenerator.from_env(pool) as generator:
+            batch = BatchScriptGenerator(generator, pool,
+                                         concurrency=args.concurrency,
+                                         requests_per_minute=args.rpm,
+                                         tokens_per_minute=args.tpm)
+            stats = await batch.run(limit=args.limit)
+        logger.info("Done: %s", stats)
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
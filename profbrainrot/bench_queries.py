@@ -0,0 +1,213 @@
+"""
+Statement throughput benchmark for the hot queue and log queries.
+
+Runs the same claim / log start / log finish / complete-or-fail cycle over
+synthetic ``video_queue`` rows in three ways:
+
+``literal``
+    values interpolated into the SQL text, as the n8n workflows used to
+    do; every statement is parsed and planned from scratch.
+``unprepared``
+    the :mod:`profbrainrot.db` functions with asyncpg's statement cache
+    turned off; parameters are bound, but every call still re-plans.
+``prepared``
+    the :mod:`profbrainrot.db` functions on a normal pool; each statement
+    is prepared once per connection and reused.
+
+The benchmark queues and processes its own rows, so run it against a
+scratch database: it refuses to start if anything else is queued.
+
+Run with ``python -m profbrainrot.bench_queries --dsn ...``.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Dict, List
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+MODES = ("literal", "unprepared", "prepared")
+ENDPOINT = "/services/aigc/video-generation/video-synthesis"
+PREFIX = "bench_"
+
+
+def _quote(value) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class _LiteralQueries:
+    """The db functions used by the cycle, as interpolated SQL."""
+
+    @staticmethod
+    async def claim_batch(conn, worker_id, batch_size, lease_seconds=900):
+        return await conn.fetch(
+            f"SELECT * FROM claim_batch({_quote(worker_id)}, "
+            f"{batch_size}, {lease_seconds})")
+
+    @staticmethod
+    async def log_api_start(conn, script_id, api_endpoint, request_type):
+        return await conn.fetchval(
+            "INSERT INTO api_usage_log (script_id, api_provider, "
+            "api_endpoint, request_type) VALUES "
+            f"({_quote(script_id)}, 'wan2.5', {_quote(api_endpoint)}, "
+            f"{_quote(request_type)}) RETURNING id")
+
+    @staticmethod
+    async def log_api_finish(conn, log_id, status_code, response_time,
+                             error_message=None):
+        await conn.execute(
+            f"UPDATE api_usage_log SET status_code = {_quote(status_code)}, "
+            f"response_time = {_quote(response_time)}, "
+            f"error_message = {_quote(error_message)}, "
+            f"completed_at = CURRENT_TIMESTAMP WHERE id = {log_id}")
+
+    @staticmethod
+    async def mark_completed(conn, script_id, video_url, video_duration):
+        await conn.execute(
+            "UPDATE video_queue SET status = 'completed', "
+            "completed_at = CURRENT_TIMESTAMP, "
+            f"video_url = {_quote(video_url)}, "
+            f"video_duration = {_quote(video_duration)}, "
+            f"lease_expires_at = NULL WHERE script_id = {_quote(script_id)}")
+
+    @staticmethod
+    async def mark_failed(conn, script_id, error_message):
+        return await conn.fetchval(
+            "UPDATE video_queue SET status = CASE WHEN error_count + 1 >= 3 "
+            "THEN 'cancelled' ELSE 'failed' END, "
+            "error_count = LEAST(error_count + 1, 3), "
+            f"error_message = {_quote(error_message)}, "
+            f"lease_expires_at = NULL WHERE script_id = {_quote(script_id)} "
+            "RETURNING status")
+
+    @staticmethod
+    async def log_error(conn, script_id, error_type, error_message,
+                        error_context="{}"):
+        await conn.execute(
+            "INSERT INTO error_log (script_id, error_type, error_message, "
+            f"error_context) VALUES ({_quote(script_id)}, "
+            f"{_quote(error_type)}, {_quote(error_message)}, "
+            f"{_quote(error_context)}::jsonb)")
+
+
+async def _cycle(pool, queries, worker_id: str, fail_every: int) -> int:
+    """Process queued rows until none are left; returns statements run."""
+    statements = 0
+    while True:
+        async with pool.acquire() as conn:
+            rows = await queries.claim_batch(conn, worker_id, 1)
+            statements += 1
+            if not rows:
+                return statements
+            script_id = rows[0]["script_id"]
+            log_id = await queries.log_api_start(conn, script_id, ENDPOINT,
+                                                 "create")
+            if fail_every and rows[0]["id"] % fail_every == 0:
+                message = "bench: O'Reilly said \"no\""
+                await queries.log_api_finish(conn, log_id, 500, 120, message)
+                await queries.mark_failed(conn, script_id, message)
+                await queries.log_error(conn, script_id, "api_error", message)
+                statements += 4
+            else:
+                await queries.log_api_finish(conn, log_id, 200, 120)
+                await queries.mark_completed(
+                    conn, script_id, f"https://example.com/{script_id}.mp4",
+                    10)
+                statements += 3
+
+
+async def _reset(conn, rows: int) -> None:
+    async with conn.transaction():
+        await conn.execute(
+            "DELETE FROM api_usage_log WHERE script_id LIKE $1 || '%'", PREFIX)
+        await conn.execute(
+            "DELETE FROM error_log WHERE script_id LIKE $1 || '%'", PREFIX)
+        await conn.execute(
+            "DELETE FROM processing_batches "
+            "WHERE metadata->>'worker_id' LIKE $1 || '%'", PREFIX)
+        await conn.execute(
+            "DELETE FROM video_queue WHERE script_id LIKE $1 || '%'", PREFIX)
+        await conn.execute(
+            """
+            INSERT INTO video_queue (lesson_id, lesson_title, script_id,
+                                     script_type, content, target_platform)
+            SELECT 'bench_lesson', 'Benchmark', $1 || n, 'short',
+                   'benchmark script ' || n, 'tiktok'
+            FROM generate_series(1, $2) n
+            """, PREFIX, rows)
+
+
+async def run_mode(dsn, mode: str, rows: int, connections: int,
+                   fail_every: int) -> Dict[str, float]:
+    cache_size = 256 if mode == "prepared" else 0
+    pool = await db.create_pool(dsn, min_size=connections,
+                                max_size=connections,
+                                statement_cache_size=cache_size,
+                                # Measure statement overhead, not WAL flushes.
+                                server_settings={"synchronous_commit": "off"})
+    queries = _LiteralQueries if mode == "literal" else db
+    try:
+        async with pool.acquire() as conn:
+            await _reset(conn, rows)
+        started = time.perf_counter()
+        counts = await asyncio.gather(*(
+            _cycle(pool, queries, f"{PREFIX}{mode}_{n}", fail_every)
+            for n in range(connections)))
+        elapsed = time.perf_counter() - started
+        async with pool.acquire() as conn:
+            await _reset(conn, 0)
+    finally:
+        await pool.close()
+    statements = sum(counts)
+    return {"statements": statements, "elapsed_s": elapsed,
+            "statements_per_sec": statements / elapsed}
+
+
+async def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=2000,
+                        help="synthetic queue rows per mode")
+    parser.add_argument("--connections", type=int, default=4,
+                        help="pool size / concurrent workers")
+    parser.add_argument("--fail-every", type=int, default=5,
+                        help="fail every Nth row (0: never)")
+    parser.add_argument("--modes", nargs="+", choices=MODES,
+                        default=list(MODES))
+    parser.add_argument("--dsn", default=None,
+                        help="Postgres DSN (default: DATABASE_URL / DB_POSTGRESDB_*)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    pool = await db.create_pool(args.dsn, max_size=1)
+    try:
+        queued = await pool.fetchval(
+            "SELECT COUNT(*) FROM video_queue "
+            "WHERE status = 'queued' AND script_id NOT LIKE $1 || '%'", PREFIX)
+    finally:
+        await pool.close()
+    if queued:
+        raise SystemExit(f"{queued} real row(s) are queued; run the benchmark "
+                         "against a scratch database")
+
+    results: List[str] = []
+    for mode in args.modes:
+        stats = await run_mode(args.dsn, mode, args.rows, args.connections,
+                               args.fail_every)
+        logger.info("%s: %s", mode, stats)
+        results.append(f"{mode:<11} {stats['statements']:>8} statements "
+                       f"{stats['elapsed_s']:>7.2f}s "
+                       f"{stats['statements_per_sec']:>9.0f}/s")
+    print("\n".join(results))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
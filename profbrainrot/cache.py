@@ -0,0 +1,284 @@
+"""
+Content-addressed cache of generated videos.
+
+A generation is identified by a sha256 over everything that determines the
+output: model, prompt, negative prompt, size, duration, audio and the other
+generation parameters, plus the seed policy. With no fixed seed (``random``,
+what the n8n workflow does) any earlier video for the same request is an
+acceptable result; with a fixed seed only that seed's video is.
+
+Videos live under ``<directory>/objects`` with a small SQLite index next to
+them. The store is bounded by ``max_bytes`` and evicts the least recently
+used entries first; pinned entries are never evicted.
+
+Run ``python -m profbrainrot.cache --help`` to inspect, pin or trim a store.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from .wan25 import DEFAULT_MODEL, DEFAULT_NEGATIVE_PROMPT, GenerationParams
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 20 << 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    video_url TEXT,
+    video_duration INTEGER,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    pinned INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_entries_lru ON entries(pinned, last_used);
+"""
+
+
+def cache_key(prompt: str, params: GenerationParams = GenerationParams(),
+              negative_prompt: Optional[str] = DEFAULT_NEGATIVE_PROMPT,
+              model: str = DEFAULT_MODEL) -> str:
+    """sha256 hex digest identifying one generation request."""
+    payload = params.to_payload()
+    payload.pop("seed", None)
+    payload["seed_policy"] = "random" if params.seed is None else params.seed
+    canonical = json.dumps({"model": model, "prompt": prompt,
+                            "negative_prompt": negative_prompt or "",
+                            "parameters": payload},
+                           sort_keys=True, separators=(",", ":"),
+                           ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    key: str
+    path: str
+    size: int
+    sha256: str
+    video_url: Optional[str]
+    video_duration: Optional[int]
+    created_at: float
+    last_used: float
+    hits: int
+    pinned: bool
+
+
+def _link_or_copy(source: str, target: str) -> None:
+    """Hard-link ``source`` to ``target`` (copy across filesystems)."""
+    tmp = target + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(source, tmp)
+    except OSError:
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+
+
+class GenerationCache:
+    """Local object store for generated videos keyed by :func:`cache_key`."""
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"))
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _object_path(self, key: str) -> str:
+        return os.path.join(self.directory, "objects", key[:2], key + ".mp4")
+
+    # -- lookups ---------------------------------------------------------
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry for ``key`` and mark it recently used."""
+        row = self._db.execute("SELECT * FROM entries WHERE key = ?",
+                               (key,)).fetchone()
+        if row is not None and not os.path.exists(row["path"]):
+            logger.warning("Cached object for %s is missing; dropping it", key)
+            with self._db:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        now = time.time()
+        with self._db:
+            self._db.execute(
+                "UPDATE entries SET last_used = ?, hits = hits + 1 "
+                "WHERE key = ?", (now, key))
+        return self._entry(row, last_used=now, hits=row["hits"] + 1)
+
+    def __contains__(self, key: str) -> bool:
+        return self._db.execute("SELECT 1 FROM entries WHERE key = ?",
+                                (key,)).fetchone() is not None
+
+    def materialize(self, entry: CacheEntry, target: str) -> str:
+        """Place the cached video at ``target`` (hard link when possible)."""
+        directory = os.path.dirname(target)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _link_or_copy(entry.path, target)
+        return target
+
+    # -- updates ---------------------------------------------------------
+
+    def put(self, key: str, source: str, sha256: str,
+            video_url: Optional[str] = None,
+            video_duration: Optional[int] = None,
+            pin: bool = False) -> Optional[CacheEntry]:
+        """Add the video at ``source`` under ``key`` and trim the store.
+
+        Returns None if the video alone is larger than the store.
+        """
+        path = self._object_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _link_or_copy(source, path)
+        size = os.path.getsize(path)
+        now = time.time()
+        with self._db:
+            self._db.execute(
+                """
+                INSERT INTO entries (key, path, size, sha256, video_url,
+                                     video_duration, created_at, last_used,
+                                     pinned)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    path = excluded.path, size = excluded.size,
+                    sha256 = excluded.sha256, video_url = excluded.video_url,
+                    video_duration = excluded.video_duration,
+                    last_used = excluded.last_used,
+                    pinned = MAX(entries.pinned, excluded.pinned)
+                """, (key, path, size, sha256, video_url, video_duration,
+                      now, now, int(pin)))
+        self.evict()
+        return self.peek(key)
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry for ``key`` without touching its LRU position."""
+        row = self._db.execute("SELECT * FROM entries WHERE key = ?",
+                               (key,)).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def pin(self, key: str, pinned: bool = True) -> bool:
+        """Exclude ``key`` from eviction; False if it is not cached."""
+        with self._db:
+            cursor = self._db.execute(
+                "UPDATE entries SET pinned = ? WHERE key = ?",
+                (int(pinned), key))
+        return cursor.rowcount > 0
+
+    def unpin(self, key: str) -> bool:
+        return self.pin(key, False)
+
+    def remove(self, key: str) -> bool:
+        entry = self.peek(key)
+        if entry is None:
+            return False
+        with self._db:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        if os.path.exists(entry.path):
+            os.remove(entry.path)
+        return True
+
+    def evict(self, max_bytes: Optional[int] = None) -> List[str]:
+        """Drop least recently used unpinned entries until under budget."""
+        budget = self.max_bytes if max_bytes is None else max_bytes
+        total = self.total_bytes()
+        evicted = []
+        if total <= budget:
+            return evicted
+        rows = self._db.execute(
+            "SELECT key, size FROM entries WHERE pinned = 0 "
+            "ORDER BY last_used").fetchall()
+        for row in rows:
+            if total <= budget:
+                break
+            self.remove(row["key"])
+            total -= row["size"]
+            evicted.append(row["key"])
+        if evicted:
+            logger.info("Evicted %d cached video(s); %.1f MB in store",
+                        len(evicted), total / 1e6)
+        return evicted
+
+    # -- reporting -------------------------------------------------------
+
+    def total_bytes(self) -> int:
+        return self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def stats(self) -> Dict[str, float]:
+        row = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), "
+            "COALESCE(SUM(pinned), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": row[0],
+            "bytes": row[1],
+            "pinned": row[2],
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    @staticmethod
+    def _entry(row, **overrides) -> CacheEntry:
+        values = dict(row)
+        values.update(overrides)
+        values["pinned"] = bool(values["pinned"])
+        return CacheEntry(**values)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Inspect or maintain a generation cache.")
+    parser.add_argument("--cache-dir", default=os.environ.get(
+        "GENERATION_CACHE_DIR", os.path.join(os.environ.get("VIDEO_DIR",
+                                                            "videos"),
+                                             ".cache")))
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats")
+    for name in ("pin", "unpin", "remove"):
+        commands.add_parser(name).add_argument("key")
+    evict = commands.add_parser("evict")
+    evict.add_argument("--max-bytes", type=int, required=True)
+    args = parser.parse_args(argv)
+
+    cache = GenerationCache(args.cache_dir)
+    try:
+        if args.command == "stats":
+            print(json.dumps(cache.stats(), indent=2))
+        elif args.command == "evict":
+            print("\n".join(cache.evict(args.max_bytes)))
+        else:
+            if not getattr(cache, args.command)(args.key):
+                raise SystemExit(f"{args.key}: not cached")
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
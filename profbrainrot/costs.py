@@ -0,0 +1,265 @@
+"""
+Video generation costs and budget caps.
+
+Wan 2.5 bills each second of generated video at a rate set by its
+resolution: $0.05 at 480p, $0.10 at 720p and $0.15 at 1080p (see
+``docs/WAN25_SETUP.md``). :func:`price_cents` turns a request's size,
+duration and audio setting into an exact cost in integer cents.
+
+:class:`BudgetGate` reserves that cost in ``budget_reservations`` before
+every submit and settles it at the billed duration once the task finishes
+(failed tasks release theirs). Reservations are taken under the daily and
+monthly caps in ``budget_caps``. When the requested resolution no longer
+fits, the gate retries one tier lower; when nothing fits it refuses and
+pauses submits until the capped period rolls over. :meth:`BudgetGate.report`
+gives the spend so far, the 24-hour burn rate and the month-end projection.
+
+Run ``python -m profbrainrot.costs`` for a spend report, or with
+``--daily-cap`` / ``--monthly-cap`` (dollars, ``none`` to lift) to set caps.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, Optional
+
+from . import db, metrics
+from .wan25 import GenerationParams
+
+logger = logging.getLogger(__name__)
+
+# Cents per second of video by resolution tier (the shorter side in pixels).
+PRICE_CENTS_PER_SECOND = {480: 5, 720: 10, 1080: 15}
+# The published rates include native audio; silent output costs the same.
+SILENT_PRICE_CENTS_PER_SECOND = dict(PRICE_CENTS_PER_SECOND)
+
+# Provider sizes per tier as (landscape, portrait).
+TIER_SIZES = {
+    1080: ("1920*1080", "1080*1920"),
+    720: ("1280*720", "720*1280"),
+    480: ("832*480", "480*832"),
+}
+
+
+def resolution_tier(size: str) -> int:
+    """Price tier of a ``"W*H"`` size: the listed tier nearest its short side."""
+    try:
+        width, height = (int(part) for part in size.split("*"))
+    except ValueError:
+        raise ValueError(f"bad video size {size!r}") from None
+    short = min(width, height)
+    return min(PRICE_CENTS_PER_SECOND, key=lambda tier: abs(tier - short))
+
+
+def price_cents(params: GenerationParams,
+                duration: Optional[int] = None) -> int:
+    """Cost of one video; ``duration`` overrides the requested seconds."""
+    rates = PRICE_CENTS_PER_SECOND if params.audio else SILENT_PRICE_CENTS_PER_SECOND
+    seconds = params.duration if duration is None else duration
+    return rates[resolution_tier(params.size)] * seconds
+
+
+def downtier(params: GenerationParams) -> Optional[GenerationParams]:
+    """The same request one resolution tier lower, or None at the bottom."""
+    lower = [tier for tier in TIER_SIZES if tier < resolution_tier(params.size)]
+    if not lower:
+        return None
+    width, height = (int(part) for part in params.size.split("*"))
+    landscape, portrait = TIER_SIZES[max(lower)]
+    return replace(params, size=portrait if height > width else landscape)
+
+
+@dataclass(frozen=True)
+class Reservation:
+    reservation_id: Optional[int]  # None when refused
+    params: GenerationParams       # possibly down-tiered
+    cents: int
+    limited_by: Optional[str] = None  # "day" / "month" when refused
+    retry_in: Optional[float] = None  # seconds until that period ends
+
+    @property
+    def granted(self) -> bool:
+        return self.reservation_id is not None
+
+
+@dataclass(frozen=True)
+class SpendReport:
+    day_cents: int
+    month_cents: int
+    outstanding_cents: int  # reserved for tasks still running
+    last_24h_cents: int
+    day_cap_cents: Optional[int]
+    month_cap_cents: Optional[int]
+    month_remaining_s: float
+
+    @property
+    def burn_rate_cents_per_hour(self) -> float:
+        return self.last_24h_cents / 24.0
+
+    @property
+    def projected_month_cents(self) -> float:
+        """Month-to-date spend plus the 24-hour burn rate to month end."""
+        return (self.month_cents
+                + self.burn_rate_cents_per_hour * self.month_remaining_s / 3600)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "day_cents": self.day_cents,
+            "month_cents": self.month_cents,
+            "outstanding_cents": self.outstanding_cents,
+            "day_cap_cents": self.day_cap_cents,
+            "month_cap_cents": self.month_cap_cents,
+            "burn_rate_cents_per_hour": self.burn_rate_cents_per_hour,
+            "projected_month_cents": self.projected_month_cents,
+        }
+
+
+class BudgetGate:
+    """Reserves, settles and releases the cost of each submit.
+
+    After a refusal :attr:`paused` stays true until the capped period rolls
+    over, or for at most ``recheck`` seconds so raised caps take effect.
+    With ``allow_downtier`` off a request that does not fit is refused outright.
+    """
+
+    def __init__(self, pool, allow_downtier: bool = True,
+                 recheck: float = 300.0,
+                 clock=time.monotonic):
+        self.pool = pool
+        self.allow_downtier = allow_downtier
+        self.recheck = recheck
+        self._clock = clock
+        self._paused_until = 0.0
+        self.reserved = 0
+        self.downtiered = 0
+        self.refused = 0
+        self.settled_cents = 0
+
+    @property
+    def paused(self) -> bool:
+        return self._clock() < self._paused_until
+
+    def stats(self) -> Dict[str, float]:
+        return {"reserved": self.reserved,
+                "downtiered": self.downtiered,
+                "refused": self.refused,
+                "settled_cents": self.settled_cents,
+                "paused_s": max(0.0, self._paused_until - self._clock())}
+
+    async def reserve(self, script_id: str,
+                      params: GenerationParams) -> Reservation:
+        """Reserve the cost of submitting ``script_id`` with ``params``.
+
+        A script that already holds an open reservation (say from a run that
+        died before submitting) gets that one back, with its parameters.
+        """
+        if self.paused:
+            self.refused += 1
+            metrics.BUDGET_RESERVATIONS.inc(outcome="refused")
+            return Reservation(None, params, price_cents(params))
+        candidate: Optional[GenerationParams] = params
+        async with self.pool.acquire() as conn:
+            while candidate is not None:
+                row = await db.reserve_budget(conn, script_id, candidate,
+                                              price_cents(candidate))
+                if row["reservation_id"] is not None:
+                    granted = replace(params, size=row["size"],
+                                      duration=row["duration"],
+                                      audio=row["audio"])
+                    self.reserved += 1
+                    if granted.size == params.size:
+                        metrics.BUDGET_RESERVATIONS.inc(outcome="granted")
+                    else:
+                        self.downtiered += 1
+                        metrics.BUDGET_RESERVATIONS.inc(outcome="downtiered")
+                        logger.info("Budget: %s down-tiered from %s to %s",
+                                    script_id, params.size, granted.size)
+                    return Reservation(row["reservation_id"], granted,
+                                       row["reserved_cents"])
+                candidate = downtier(candidate) if self.allow_downtier else None
+        self.refused += 1
+        metrics.BUDGET_RESERVATIONS.inc(outcome="refused")
+        pause = min(row["retry_in"], self.recheck)
+        self._paused_until = self._clock() + pause
+        logger.warning("Budget: %s cap reached; pausing submits for %.0fs",
+                       row["limited_by"], pause)
+        return Reservation(None, params, price_cents(params),
+                           row["limited_by"], row["retry_in"])
+
+    async def settle(self, script_id: str,
+                     video_duration: Optional[int] = None) -> Optional[int]:
+        """Charge the open reservation for the billed duration.
+
+        Returns the cost in cents, or None if the script had no open
+        reservation.
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await db.open_reservation(conn, script_id)
+                if row is None:
+                    return None
+                params = GenerationParams(size=row["size"],
+                                          duration=row["duration"],
+                                          audio=row["audio"])
+                cost = price_cents(params, video_duration or params.duration)
+                await db.settle_budget(conn, script_id, cost)
+        self.settled_cents += cost
+        metrics.COST_CENTS.inc(cost)
+        return cost
+
+    async def release(self, script_id: str) -> None:
+        """Drop the open reservation of a submit that was not billed."""
+        async with self.pool.acquire() as conn:
+            await db.settle_budget(conn, script_id, 0)
+
+    async def report(self) -> SpendReport:
+        async with self.pool.acquire() as conn:
+            row = await db.spend_summary(conn)
+        return SpendReport(**dict(row))
+
+
+def _cap_cents(value: str) -> Optional[int]:
+    if value.lower() == "none":
+        return None
+    return round(float(value) * 100)
+
+
+def _dollars(cents: Optional[float]) -> str:
+    return "none" if cents is None else f"${cents / 100:.2f}"
+
+
+async def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--daily-cap", type=_cap_cents, default=argparse.SUPPRESS,
+                        help="set the daily cap in dollars ('none' lifts it)")
+    parser.add_argument("--monthly-cap", type=_cap_cents,
+                        default=argparse.SUPPRESS,
+                        help="set the monthly cap in dollars ('none' lifts it)")
+    parser.add_argument("--dsn", default=None,
+                        help="Postgres DSN (default: DATABASE_URL / DB_POSTGRESDB_*)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    pool = await db.create_pool(args.dsn, max_size=1)
+    try:
+        async with pool.acquire() as conn:
+            # Absent options are left alone; None lifts the cap.
+            if hasattr(args, "daily_cap"):
+                await db.set_budget_cap(conn, "day", args.daily_cap)
+            if hasattr(args, "monthly_cap"):
+                await db.set_budget_cap(conn, "month", args.monthly_cap)
+        report = await BudgetGate(pool).report()
+    finally:
+        await pool.close()
+    print(f"today       {_dollars(report.day_cents):>10}  (cap {_dollars(report.day_cap_cents)})\n"
+          f"this month  {_dollars(report.month_cents):>10}  (cap {_dollars(report.month_cap_cents)})\n"
+          f"in flight   {_dollars(report.outstanding_cents):>10}\n"
+          f"burn rate   {_dollars(report.burn_rate_cents_per_hour):>10}/h\n"
+          f"projected   {_dollars(report.projected_month_cents):>10}  by month end")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
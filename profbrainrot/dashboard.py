@@ -0,0 +1,263 @@
+"""
+Dashboard API for ``web/index.html``.
+
+Serves queue counts, system totals and the most recent queue items from
+Postgres, plus the full record of a single item. The status aggregates are
+computed at most once per ``ttl`` seconds however many browser tabs are
+polling: concurrent requests that miss the cache wait for the one query in
+flight instead of issuing their own. Every JSON response carries an ETag
+and ``Cache-Control``, and a matching ``If-None-Match`` gets a 304 with no
+body.
+
+With an :class:`~profbrainrot.events.EventHub`, ``/api/events`` streams
+every new row and status change as Server-Sent Events, so open pages stay
+current without polling. A reconnecting browser sends ``Last-Event-ID``
+and is replayed the events it missed.
+
+``/metrics`` exposes this process's metrics in the Prometheus text format
+(see :mod:`profbrainrot.metrics`). Queue depth is copied from Postgres every
+``metrics_interval`` seconds, not on each scrape.
+
+Run with ``python -m profbrainrot.dashboard`` and open http://localhost:8080/.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiohttp import web
+
+from . import db, metrics
+from .events import EventHub
+
+logger = logging.getLogger(__name__)
+
+WEB_ROOT = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "web")
+QUEUE_STATUSES = ("queued", "processing", "completed", "failed", "cancelled")
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _encode(payload: Any) -> Tuple[bytes, str]:
+    """JSON body plus its (strong) ETag."""
+    body = json.dumps(payload, default=_json_default,
+                      separators=(",", ":")).encode("utf-8")
+    return body, '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def _etag_matches(request: web.Request, etag: str) -> bool:
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or "W/" + etag in tags
+
+
+class Dashboard:
+    """aiohttp handlers for the dashboard; see :meth:`app`."""
+
+    def __init__(self, pool, ttl: float = 5.0, recent_limit: int = 20,
+                 web_root: str = WEB_ROOT, events: Optional[EventHub] = None,
+                 heartbeat: float = 15.0, metrics_interval: float = 15.0):
+        self.pool = pool
+        self.events = events
+        self.heartbeat = heartbeat
+        self.ttl = ttl
+        self.recent_limit = recent_limit
+        self.web_root = web_root
+        self.metrics_interval = metrics_interval
+        self._cache: Dict[str, Tuple[float, bytes, str]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/", self.index)
+        app.router.add_get("/api/status", self.status)
+        app.router.add_get("/api/items/{script_id}", self.item)
+        app.router.add_get("/metrics", metrics.handle)
+        app.cleanup_ctx.append(self._refresh_metrics)
+        if self.events is not None:
+            app.router.add_get("/api/events", self.stream_events)
+        return app
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    # -- caching ---------------------------------------------------------
+
+    async def _cached(self, key: str,
+                      load: Callable[[], Awaitable[Any]]) -> Tuple[bytes, str]:
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1], entry[2]
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Another request may have refreshed the entry while we waited.
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+            body, etag = _encode(await load())
+            self._cache[key] = (time.monotonic() + self.ttl, body, etag)
+            return body, etag
+
+    def _respond(self, request: web.Request, body: bytes, etag: str,
+                 max_age: float) -> web.Response:
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"max-age={int(max_age)}, must-revalidate",
+            # The page is usually opened from file://.
+            "Access-Control-Allow-Origin": "*",
+        }
+        if _etag_matches(request, etag):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/json",
+                            headers=headers)
+
+    # -- metrics ---------------------------------------------------------
+
+    async def _refresh_metrics(self, app: web.Application):
+        """Keep queue depth current for the lifetime of ``app``."""
+        async def refresh() -> None:
+            while True:
+                try:
+                    async with self.pool.acquire() as conn:
+                        metrics.set_queue_depth(await db.queue_depth(conn))
+                except Exception:
+                    logger.exception("Queue depth refresh failed")
+                await asyncio.sleep(self.metrics_interval)
+
+        task = asyncio.create_task(refresh())
+        yield
+        task.cancel()
+
+    # -- handlers --------------------------------------------------------
+
+    async def index(self, request: web.Request) -> web.FileResponse:
+        return web.FileResponse(os.path.join(self.web_root, "index.html"))
+
+    async def status(self, request: web.Request) -> web.Response:
+        body, etag = await self._cached("status", self.load_status)
+        return self._respond(request, body, etag, self.ttl)
+
+    async def load_status(self) -> Dict[str, Any]:
+        # Taken before the queries: a client that subscribes from here gets
+        # every change the snapshot may have missed, however old it is.
+        event_id = self.events.last_event_id if self.events else None
+        async with self.pool.acquire() as conn:
+            counts = await db.queue_counts(conn)
+            totals = await db.system_totals(conn)
+            items = await db.recent_items(conn, self.recent_limit)
+        return {
+            "queue": {status: counts.get(status, 0)
+                      for status in QUEUE_STATUSES},
+            "system": {
+                "totalLessons": totals["total_lessons"],
+                "totalVideos": totals["total_videos"],
+                "lastUpdate": datetime.now().astimezone(),
+            },
+            "recentItems": [dict(row) for row in items],
+            "eventId": event_id,
+        }
+
+    async def item(self, request: web.Request) -> web.Response:
+        script_id = request.match_info["script_id"]
+        async with self.pool.acquire() as conn:
+            row = await db.queue_item(conn, script_id)
+        if row is None:
+            raise web.HTTPNotFound(
+                text=json.dumps({"error": f"no queue item {script_id}"}),
+                content_type="application/json",
+                headers={"Access-Control-Allow-Origin": "*"})
+        body, etag = _encode(dict(row))
+        return self._respond(request, body, etag, 0)
+
+    async def stream_events(self, request: web.Request) -> web.StreamResponse:
+        last_event_id = (request.headers.get("Last-Event-ID")
+                         or request.query.get("lastEventId"))
+        subscription, replay = self.events.subscribe(last_event_id)
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "Access-Control-Allow-Origin": "*",
+            # Keep reverse proxies from buffering the stream.
+            "X-Accel-Buffering": "no",
+        })
+        try:
+            await response.prepare(request)
+            await response.write(b"retry: 3000\n\n")
+            for event in replay:
+                await response.write(event.encode())
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(),
+                                                   self.heartbeat)
+                except asyncio.TimeoutError:
+                    # Comment line; also how a vanished client is noticed.
+                    await response.write(b": keepalive\n\n")
+                    continue
+                if event is None:
+                    break
+                await response.write(event.encode())
+        except ConnectionResetError:
+            pass
+        finally:
+            self.events.unsubscribe(subscription)
+        return response
+
+
+async def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default=os.environ.get("DASHBOARD_HOST",
+                                                         "127.0.0.1"))
+    parser.add_argument("--port", type=int,
+                        default=int(os.environ.get("DASHBOARD_PORT", "8080")))
+    parser.add_argument("--ttl", type=float, default=5.0,
+                        help="seconds the status aggregates are cached")
+    parser.add_argument("--recent", type=int, default=20,
+                        help="queue items shown in the recent list")
+    parser.add_argument("--metrics-interval", type=float, default=15.0,
+                        help="seconds between queue depth refreshes for /metrics")
+    parser.add_argument("--dsn", default=None,
+                        help="Postgres DSN (default: DATABASE_URL / DB_POSTGRESDB_*)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    pool = await db.create_pool(args.dsn, max_size=5)
+    events = EventHub(pool)
+    await events.start()
+    dashboard = Dashboard(pool, ttl=args.ttl, recent_limit=args.recent,
+                          events=events, metrics_interval=args.metrics_interval)
+    runner = web.AppRunner(dashboard.app())
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, args.host, args.port).start()
+        logger.info("Dashboard on http://%s:%d/", args.host, args.port)
+        await asyncio.Event().wait()
+    finally:
+        # Ends open event streams so the runner can shut down promptly.
+        await events.close()
+        await runner.cleanup()
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
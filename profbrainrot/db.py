@@ -0,0 +1,863 @@
+"""
+Postgres access for the Python pipeline.
+
+All queue and log SQL used by the worker lives here so the statements
+can be read side by side with ``database/schema.sql``. Every function
+takes an asyncpg connection (or pool) as its first argument.
+
+Statements are constant text with ``$n`` parameters, never interpolated
+values. asyncpg keeps a per-connection cache of server-side prepared
+statements keyed on that text, so on a pooled connection each statement
+is parsed and planned once and then only bound and executed.
+``python -m profbrainrot.bench_queries`` measures the difference against
+the literal SQL the n8n workflows used to build.
+"""
+
+import json
+import os
+import socket
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import asyncpg
+
+# Fired (statement level) by trg_video_queue_notify_insert.
+QUEUE_CHANNEL = "video_queue_insert"
+# One JSON payload per new row or status change (notify_video_queue_status).
+STATUS_CHANNEL = "video_queue_status"
+
+
+def dsn_from_env() -> str:
+    """``DATABASE_URL``, or a DSN built from the n8n ``DB_POSTGRESDB_*`` vars."""
+    url = os.environ.get("DATABASE_URL")
+    if url:
+        return url
+    host = os.environ.get("DB_POSTGRESDB_HOST", "localhost")
+    port = os.environ.get("DB_POSTGRESDB_PORT", "5432")
+    database = os.environ.get("DB_POSTGRESDB_DATABASE", "profbrainrot")
+    user = os.environ.get("DB_POSTGRESDB_USER", "profbrainrot")
+    password = os.environ.get("DB_POSTGRESDB_PASSWORD",
+                              os.environ.get("POSTGRES_PASSWORD",
+                                             "profbrainrot123"))
+    return f"postgresql://{user}:{password}@{host}:{port}/{database}"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def create_pool(dsn: Optional[str] = None, min_size: int = 1,
+                      max_size: int = 10, statement_cache_size: int = 256,
+                      **kwargs) -> asyncpg.Pool:
+    """Connection pool; ``statement_cache_size`` prepared statements are
+    kept per connection (0 disables statement caching)."""
+    return await asyncpg.create_pool(dsn or dsn_from_env(),
+                                     min_size=min_size, max_size=max_size,
+                                     statement_cache_size=statement_cache_size,
+                                     **kwargs)
+
+
+# -- queue lifecycle -----------------------------------------------------
+
+async def claim_batch(conn, worker_id: str, batch_size: int,
+                      lease_seconds: int = 900) -> List[asyncpg.Record]:
+    """Select, lock and mark up to ``batch_size`` rows in one round-trip."""
+    return await conn.fetch("SELECT * FROM claim_batch($1, $2, $3)",
+                            worker_id, batch_size, lease_seconds)
+
+
+async def renew_leases(conn, worker_id: str, script_ids: Iterable[str],
+                       lease_seconds: int = 900) -> int:
+    return await conn.fetchval("SELECT renew_leases($1, $2::text[], $3)",
+                               worker_id, list(script_ids), lease_seconds)
+
+
+async def claim_expired_leases(conn, worker_id: str, batch_size: int = 10,
+                               lease_seconds: int = 900) -> List[asyncpg.Record]:
+    return await conn.fetch("SELECT * FROM claim_expired_leases($1, $2, $3)",
+                            worker_id, batch_size, lease_seconds)
+
+
+async def requeue(conn, script_id: str) -> None:
+    """Hand a reclaimed row with no live provider task back to the queue."""
+    await conn.execute(
+        """
+        UPDATE video_queue
+        SET status = 'queued', processing_started_at = NULL, batch_id = NULL,
+            claimed_by = NULL, lease_expires_at = NULL,
+            metadata = COALESCE(metadata, '{}') - 'task_id'
+        WHERE script_id = $1 AND status = 'processing'
+        """, script_id)
+
+
+async def requeue_lost_task(conn, script_id: str,
+                            error_message: str) -> Optional[str]:
+    """Requeue a row whose provider task is gone (404 or UNKNOWN).
+
+    Closes the ledger row of the current attempt and counts a strike, so
+    the next claim records a fresh attempt instead of finding the dead
+    task id again; the third strike cancels the row. Returns the row's new
+    status, or None if it was no longer processing.
+    """
+    async with conn.transaction():
+        await conn.execute(
+            """
+            UPDATE generation_tasks gt
+            SET status = 'failed', error_message = $2,
+                finished_at = CURRENT_TIMESTAMP
+            FROM video_queue vq
+            WHERE vq.script_id = $1 AND gt.script_id = vq.script_id
+              AND gt.attempt = vq.error_count
+              AND gt.status IN ('intended', 'submitted')
+            """, script_id, error_message)
+        return await conn.fetchval(
+            """
+            UPDATE video_queue
+            SET status = CASE WHEN error_count + 1 >= 3 THEN 'cancelled'
+                              ELSE 'queued' END,
+                error_count = LEAST(error_count + 1, 3),
+                error_message = $2, processing_started_at = NULL,
+                batch_id = NULL, claimed_by = NULL, lease_expires_at = NULL,
+                metadata = COALESCE(metadata, '{}') - 'task_id'
+            WHERE script_id = $1 AND status = 'processing'
+            RETURNING status
+            """, script_id, error_message)
+
+
+async def save_task_id(conn, script_id: str, task_id: str) -> None:
+    await conn.execute(
+        """
+        UPDATE video_queue
+        SET metadata = jsonb_set(COALESCE(metadata, '{}'), '{task_id}',
+                                 to_jsonb($2::text))
+        WHERE script_id = $1
+        """, script_id, task_id)
+
+
+async def mark_completed(conn, script_id: str, video_url: str,
+                         video_duration: Optional[int],
+                         url_expires_at: Optional[float] = None) -> None:
+    """``url_expires_at`` is the epoch time the signed ``video_url`` expires.
+
+    ``video_duration`` is what the provider billed; without it the planned
+    duration is recorded.
+    """
+    await conn.execute(
+        """
+        UPDATE video_queue
+        SET status = 'completed', completed_at = CURRENT_TIMESTAMP,
+            video_url = $2, video_duration = COALESCE($3, planned_duration),
+            lease_expires_at = NULL,
+            video_url_expires_at = to_timestamp($4)::timestamp
+        WHERE script_id = $1
+        """, script_id, video_url, video_duration, url_expires_at)
+
+
+async def mark_failed(conn, script_id: str, error_message: str) -> str:
+    """Record a failure; the third strike cancels the row like n8n does.
+
+    Returns the row's new status.
+    """
+    return await conn.fetchval(
+        """
+        UPDATE video_queue
+        SET status = CASE WHEN error_count + 1 >= 3 THEN 'cancelled'
+                          ELSE 'failed' END,
+            error_count = LEAST(error_count + 1, 3),
+            error_message = $2, lease_expires_at = NULL
+        WHERE script_id = $1
+        RETURNING status
+        """, script_id, error_message)
+
+
+async def pending_downloads(conn, limit: int = 100) -> List[asyncpg.Record]:
+    """Completed rows not yet saved locally, soonest-expiring link first.
+
+    Rows whose link has already expired are left out.
+    """
+    return await conn.fetch(
+        """
+        SELECT script_id, video_url,
+               EXTRACT(EPOCH FROM video_url_expires_at::timestamptz) AS expires_at
+        FROM video_queue
+        WHERE status = 'completed' AND local_path IS NULL
+          AND video_url IS NOT NULL
+          AND (video_url_expires_at IS NULL
+               OR video_url_expires_at > CURRENT_TIMESTAMP)
+        ORDER BY video_url_expires_at NULLS LAST
+        LIMIT $1
+        """, limit)
+
+
+async def mark_downloaded(conn, script_id: str, local_path: str,
+                          sha256: str) -> Optional[asyncpg.Record]:
+    """Record the local copy of a finished video.
+
+    Returns the row's ``video_url`` and ``video_duration`` plus the
+    ``cache_key`` of the ledger request that produced it.
+    """
+    return await conn.fetchrow(
+        """
+        UPDATE video_queue vq
+        SET local_path = $2, video_sha256 = $3,
+            downloaded_at = CURRENT_TIMESTAMP
+        WHERE script_id = $1
+        RETURNING vq.video_url, vq.video_duration,
+                  (SELECT gt.request->>'cache_key' FROM generation_tasks gt
+                   WHERE gt.script_id = vq.script_id
+                     AND gt.status = 'succeeded'
+                   ORDER BY gt.attempt DESC LIMIT 1) AS cache_key
+        """, script_id, local_path, sha256)
+
+
+async def mark_cached(conn, script_id: str, cache_key: str,
+                      video_url: Optional[str], video_duration: Optional[int],
+                      local_path: str, sha256: str) -> None:
+    """Complete a row from the generation cache without calling the API."""
+    await conn.execute(
+        """
+        UPDATE video_queue
+        SET status = 'completed', completed_at = CURRENT_TIMESTAMP,
+            video_url = $3, video_duration = $4, lease_expires_at = NULL,
+            video_url_expires_at = NULL, local_path = $5, video_sha256 = $6,
+            downloaded_at = CURRENT_TIMESTAMP,
+            metadata = jsonb_set(COALESCE(metadata, '{}'), '{cache_key}',
+                                 to_jsonb($2::text))
+        WHERE script_id = $1
+        """, script_id, cache_key, video_url, video_duration, local_path,
+        sha256)
+
+
+async def recent_durations(conn, limit: int = 500) -> List[float]:
+    """Seconds from processing start to completion for recent videos."""
+    rows = await conn.fetch(
+        """
+        SELECT EXTRACT(EPOCH FROM completed_at - processing_started_at)
+        FROM video_queue
+        WHERE status = 'completed' AND processing_started_at IS NOT NULL
+        ORDER BY completed_at DESC
+        LIMIT $1
+        """, limit)
+    return [float(row[0]) for row in rows if row[0] is not None]
+
+
+# -- generation plans ----------------------------------------------------
+
+async def unplanned_scripts(conn, limit: int = 500) -> List[asyncpg.Record]:
+    """Queued rows without a generation plan, in claim order."""
+    return await conn.fetch(
+        """
+        SELECT script_id, content, script_type, target_platform,
+               estimated_attention_span
+        FROM video_queue
+        WHERE status = 'queued' AND planned_size IS NULL
+        ORDER BY priority, created_at
+        LIMIT $1
+        """, limit)
+
+
+async def save_plans(conn, plans: Iterable[Tuple[str, str, int]]) -> int:
+    """Store ``(script_id, size, duration)`` plans; returns rows updated."""
+    plans = list(plans)
+    result = await conn.execute(
+        """
+        UPDATE video_queue vq
+        SET planned_size = p.size, planned_duration = p.duration
+        FROM unnest($1::text[], $2::text[], $3::int[])
+             AS p(script_id, size, duration)
+        WHERE vq.script_id = p.script_id
+        """, [p[0] for p in plans], [p[1] for p in plans],
+        [p[2] for p in plans])
+    return int(result.split()[-1])
+
+
+# -- submission ledger ---------------------------------------------------
+
+async def record_intent(conn, script_id: str, attempt: int,
+                        request: str = "{}") -> asyncpg.Record:
+    """Insert (or fetch) the ledger row for ``script_id`` attempt ``attempt``.
+
+    The returned record has ``id``, ``task_id``, ``status`` and ``created``;
+    ``created`` is False when an earlier run already recorded this attempt.
+    """
+    return await conn.fetchrow(
+        """
+        INSERT INTO generation_tasks (script_id, attempt, idempotency_key,
+                                      request)
+        VALUES ($1, $2, $3, $4::jsonb)
+        ON CONFLICT (idempotency_key)
+            DO UPDATE SET idempotency_key = EXCLUDED.idempotency_key
+        RETURNING id, task_id, status, (xmax = 0) AS created
+        """, script_id, attempt, f"{script_id}:{attempt}", request)
+
+
+async def discard_intent(conn, script_id: str, attempt: int) -> bool:
+    """Drop an attempt's ledger row if it never reached the provider.
+
+    Used when the budget refuses a submit, so the next claim of the row does
+    not mistake the leftover intent for a submit that died half-way.
+    """
+    result = await conn.execute(
+        """
+        DELETE FROM generation_tasks
+        WHERE idempotency_key = $1 AND status = 'intended'
+          AND task_id IS NULL
+        """, f"{script_id}:{attempt}")
+    return result == "DELETE 1"
+
+
+async def record_submitted(conn, ledger_id: int, script_id: str,
+                           task_id: str) -> None:
+    async with conn.transaction():
+        await conn.execute(
+            """
+            UPDATE generation_tasks
+            SET task_id = $2, status = 'submitted',
+                submitted_at = CURRENT_TIMESTAMP
+            WHERE id = $1
+            """, ledger_id, task_id)
+        await save_task_id(conn, script_id, task_id)
+
+
+async def record_finished(conn, task_id: str, status: str,
+                          video_url: Optional[str] = None,
+                          error_message: Optional[str] = None) -> None:
+    await conn.execute(
+        """
+        UPDATE generation_tasks
+        SET status = $2, video_url = $3, error_message = $4,
+            finished_at = CURRENT_TIMESTAMP
+        WHERE task_id = $1
+        """, task_id, status, video_url, error_message)
+
+
+async def record_submit_failed(conn, ledger_id: int,
+                               error_message: str) -> None:
+    await conn.execute(
+        """
+        UPDATE generation_tasks
+        SET status = 'failed', error_message = $2,
+            finished_at = CURRENT_TIMESTAMP
+        WHERE id = $1
+        """, ledger_id, error_message)
+
+
+async def find_task(conn, task_id: str) -> Optional[asyncpg.Record]:
+    """Ledger row plus queue row for a provider task id (unique index hit)."""
+    return await conn.fetchrow(
+        """
+        SELECT gt.*, vq.status AS queue_status, vq.lesson_id
+        FROM generation_tasks gt
+        JOIN video_queue vq ON vq.script_id = gt.script_id
+        WHERE gt.task_id = $1
+        """, task_id)
+
+
+async def own_processing_rows(conn, worker_id: str) -> List[asyncpg.Record]:
+    """Rows a previous run under the same worker id left in processing."""
+    return await conn.fetch(
+        """
+        SELECT vq.script_id, gt.task_id
+        FROM video_queue vq
+        LEFT JOIN generation_tasks gt
+               ON gt.script_id = vq.script_id AND gt.attempt = vq.error_count
+        WHERE vq.claimed_by = $1 AND vq.status = 'processing'
+        """, worker_id)
+
+
+# -- near-duplicate index -----------------------------------------------
+
+async def load_signatures(conn, num_perm: int) -> List[asyncpg.Record]:
+    return await conn.fetch(
+        "SELECT script_id, signature FROM script_signatures "
+        "WHERE num_perm = $1", num_perm)
+
+
+async def unindexed_scripts(conn, limit: int = 500,
+                            queued_only: bool = False) -> List[asyncpg.Record]:
+    """Rows (oldest first) that have no stored MinHash signature yet."""
+    return await conn.fetch(
+        """
+        SELECT vq.script_id, vq.content
+        FROM video_queue vq
+        LEFT JOIN script_signatures ss ON ss.script_id = vq.script_id
+        WHERE ss.script_id IS NULL AND (NOT $2 OR vq.status = 'queued')
+        ORDER BY vq.id
+        LIMIT $1
+        """, limit, queued_only)
+
+
+async def save_signatures(conn, rows: Iterable[tuple], num_perm: int) -> None:
+    """Store (script_id, signature bytes) pairs."""
+    await conn.executemany(
+        """
+        INSERT INTO script_signatures (script_id, signature, num_perm)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (script_id) DO UPDATE
+            SET signature = EXCLUDED.signature, num_perm = EXCLUDED.num_perm
+        """, [(script_id, signature, num_perm) for script_id, signature in rows])
+
+
+async def flag_duplicate(conn, script_id: str, duplicate_of: str,
+                         similarity: float) -> None:
+    await conn.execute(
+        """
+        UPDATE video_queue
+        SET duplicate_of = $2, duplicate_similarity = $3
+        WHERE script_id = $1
+        """, script_id, duplicate_of, similarity)
+
+
+async def link_duplicate(conn, script_id: str, duplicate_of: str) -> bool:
+    """Complete a still-queued row with the video of a completed original.
+
+    Returns False (and changes nothing) if the row is no longer queued or
+    the original has no finished video.
+    """
+    result = await conn.execute(
+        """
+        UPDATE video_queue d
+        SET status = 'completed', completed_at = CURRENT_TIMESTAMP,
+            video_url = o.video_url, video_duration = o.video_duration,
+            video_url_expires_at = o.video_url_expires_at,
+            local_path = o.local_path, video_sha256 = o.video_sha256,
+            downloaded_at = o.downloaded_at
+        FROM video_queue o
+        WHERE d.script_id = $1 AND d.status = 'queued'
+          AND o.script_id = $2 AND o.status = 'completed'
+          AND o.video_url IS NOT NULL
+        """, script_id, duplicate_of)
+    return result == "UPDATE 1"
+
+
+# -- lessons -------------------------------------------------------------
+
+async def claim_pending_lessons(conn, limit: int,
+                                lease_seconds: int = 900) -> List[asyncpg.Record]:
+    """Mark up to ``limit`` pending lessons processing and return them.
+
+    Each claim is a lease of ``lease_seconds``, cleared when the lesson's
+    scripts are queued (``enqueue_scripts``) or it is marked failed.
+    Lessons whose lease ran out, left by a run that was interrupted, are
+    claimed again.
+    """
+    return await conn.fetch(
+        """
+        UPDATE lessons l
+        SET processing_status = 'processing', updated_at = CURRENT_TIMESTAMP,
+            claim_expires_at = CURRENT_TIMESTAMP + make_interval(secs => $2)
+        FROM (
+            SELECT id FROM lessons
+            WHERE processing_status = 'pending'
+               OR (processing_status = 'processing'
+                   AND claim_expires_at < CURRENT_TIMESTAMP)
+            ORDER BY created_at, id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        ) pending
+        WHERE l.id = pending.id
+        RETURNING l.lesson_id, l.title, l.subject, l.grade_level,
+                  l.original_content
+        """, limit, lease_seconds)
+
+
+async def create_lesson_staging(conn) -> None:
+    """Session-local staging table for :func:`upsert_staged_lessons`."""
+    await conn.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS lesson_import (
+            seq BIGINT,
+            lesson_id VARCHAR(100),
+            title VARCHAR(255),
+            subject VARCHAR(100),
+            grade_level VARCHAR(20),
+            original_content TEXT,
+            content_format VARCHAR(50),
+            source_type VARCHAR(50),
+            source_reference TEXT,
+            metadata JSONB
+        )
+        """)
+    await conn.execute("TRUNCATE lesson_import")
+
+
+async def upsert_staged_lessons(conn) -> tuple:
+    """Move ``lesson_import`` into lessons and empty it.
+
+    Only new lessons and lessons whose title, subject, grade level or
+    content changed are written; changed lessons go back to ``pending``
+    so their scripts are regenerated. A change also bumps the lesson's
+    ``content_revision`` (so the new scripts get new ids, see
+    ``enqueue_scripts``) and cancels its scripts that are still queued.
+    The last row wins when an id appears twice. Returns (inserted,
+    updated, distinct ids staged).
+    """
+    row = await conn.fetchrow(
+        """
+        WITH staged AS (
+            SELECT DISTINCT ON (lesson_id) *
+            FROM lesson_import
+            ORDER BY lesson_id, seq DESC
+        ), upserted AS (
+            INSERT INTO lessons AS l (lesson_id, title, subject, grade_level,
+                                      original_content, content_format,
+                                      source_type, source_reference, metadata)
+            SELECT lesson_id, title, subject, grade_level, original_content,
+                   COALESCE(content_format, 'text'),
+                   COALESCE(source_type, 'manual'), source_reference,
+                   COALESCE(metadata, '{}')
+            FROM staged
+            ON CONFLICT (lesson_id) DO UPDATE
+                SET title = EXCLUDED.title, subject = EXCLUDED.subject,
+                    grade_level = EXCLUDED.grade_level,
+                    original_content = EXCLUDED.original_content,
+                    content_format = EXCLUDED.content_format,
+                    source_type = EXCLUDED.source_type,
+                    source_reference = EXCLUDED.source_reference,
+                    metadata = l.metadata || EXCLUDED.metadata,
+                    processing_status = 'pending',
+                    content_revision = l.content_revision + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE (l.title, l.subject, l.grade_level, l.original_content)
+                      IS DISTINCT FROM
+                      (EXCLUDED.title, EXCLUDED.subject, EXCLUDED.grade_level,
+                       EXCLUDED.original_content)
+            RETURNING l.lesson_id, (xmax = 0) AS inserted
+        ), superseded AS (
+            UPDATE video_queue vq
+            SET status = 'cancelled',
+                error_message = 'Superseded: lesson content changed'
+            FROM upserted u
+            WHERE NOT u.inserted
+              AND vq.lesson_id = u.lesson_id
+              AND vq.status = 'queued'
+        )
+        SELECT COUNT(*) FILTER (WHERE inserted) AS inserted,
+               COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+               (SELECT COUNT(*) FROM staged) AS staged
+        FROM upserted
+        """)
+    await conn.execute("TRUNCATE lesson_import")
+    return row["inserted"], row["updated"], row["staged"]
+
+
+async def enqueue_scripts(conn, lesson_id: str, lesson_title: str,
+                          shorts: List[dict]) -> int:
+    """Queue a lesson's short scripts the way the lesson processor does.
+
+    Script ids are ``<lesson_id>_<platform>_<n>``; rows that already exist
+    are left alone. Returns the number of scripts for the lesson.
+    """
+    queued = await enqueue_script_batch(conn, [(lesson_id, lesson_title, shorts)])
+    return queued[lesson_id]
+
+
+async def enqueue_script_batch(
+        conn, lessons: Iterable[Tuple[str, str, List[dict]]]) -> Dict[str, int]:
+    """Queue scripts for many lessons in one statement.
+
+    ``lessons`` holds (lesson_id, lesson_title, shorts) tuples. Rows and
+    lesson counters are written by the ``enqueue_scripts`` SQL function in
+    a single round-trip. Returns the number of scripts per lesson.
+    """
+    batch = [{"lesson_id": lesson_id, "lesson_title": title, "shorts": shorts}
+             for lesson_id, title, shorts in lessons]
+    rows = await conn.fetch("SELECT * FROM enqueue_scripts($1::jsonb)",
+                            json.dumps(batch))
+    return {row["lesson_id"]: row["scripts"] for row in rows}
+
+
+async def mark_lesson_failed(conn, lesson_id: str, error_message: str) -> None:
+    async with conn.transaction():
+        await conn.execute(
+            """
+            UPDATE lessons
+            SET processing_status = 'failed', claim_expires_at = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE lesson_id = $1
+            """, lesson_id)
+        await log_error(conn, None, "script_generation", error_message,
+                        json.dumps({"lesson_id": lesson_id}))
+
+
+async def lesson_progress(conn, lesson_id: str) -> Optional[asyncpg.Record]:
+    return await conn.fetchrow(
+        "SELECT * FROM lesson_progress WHERE lesson_id = $1", lesson_id)
+
+
+async def lessons_with_failures(conn, limit: int = 100) -> List[asyncpg.Record]:
+    """Lessons with failed videos, most failures first."""
+    return await conn.fetch(
+        """
+        SELECT l.lesson_id, l.title, l.subject, p.videos_in_queue,
+               p.videos_completed, p.videos_failed
+        FROM lesson_progress_rollup p
+        JOIN lessons l ON l.lesson_id = p.lesson_id
+        WHERE p.videos_failed > 0
+        ORDER BY p.videos_failed DESC, p.lesson_id
+        LIMIT $1
+        """, limit)
+
+
+async def refresh_lesson_progress(conn, lesson_id: Optional[str] = None) -> int:
+    """Recompute the progress rollup of one lesson (or all); returns rows fixed."""
+    return await conn.fetchval("SELECT refresh_lesson_progress($1)", lesson_id)
+
+
+# -- script cache --------------------------------------------------------
+
+async def script_cache_lookup(conn, title: str, subject: str,
+                              grade_level: str, content: str, model: str,
+                              prompt_version: str) -> asyncpg.Record:
+    """``cache_key``, ``hit`` and (on a hit) ``scripts`` for a lesson."""
+    return await conn.fetchrow(
+        "SELECT * FROM script_cache_lookup($1, $2, $3, $4, $5, $6)",
+        title, subject, grade_level, content, model, prompt_version)
+
+
+async def script_cache_store(conn, cache_key: str, model: str,
+                             prompt_version: str, scripts: str,
+                             ttl: timedelta, max_bytes: int) -> int:
+    """Store parsed scripts (JSON text); returns entries evicted."""
+    return await conn.fetchval(
+        "SELECT script_cache_store($1, $2, $3, $4::jsonb, $5, $6)",
+        cache_key, model, prompt_version, scripts, ttl, max_bytes)
+
+
+async def script_cache_summary(conn) -> asyncpg.Record:
+    return await conn.fetchrow("SELECT * FROM script_cache_summary")
+
+
+# -- budget --------------------------------------------------------------
+
+async def reserve_budget(conn, script_id: str, params,
+                         cents: int) -> asyncpg.Record:
+    """Reserve ``cents`` for submitting ``script_id`` with ``params``.
+
+    ``reservation_id`` is None when a cap refused it; ``limited_by`` and
+    ``retry_in`` then say which cap and for how long.
+    """
+    return await conn.fetchrow(
+        "SELECT * FROM reserve_budget($1, $2, $3, $4, $5)",
+        script_id, params.size, params.duration, params.audio, cents)
+
+
+async def open_reservation(conn, script_id: str) -> Optional[asyncpg.Record]:
+    return await conn.fetchrow(
+        """
+        SELECT * FROM budget_reservations
+        WHERE script_id = $1 AND status = 'reserved'
+        FOR UPDATE
+        """, script_id)
+
+
+async def settle_budget(conn, script_id: str, cost_cents: int) -> Optional[int]:
+    """Close the open reservation at ``cost_cents`` (0 releases it)."""
+    return await conn.fetchval("SELECT settle_budget($1, $2)", script_id,
+                               cost_cents)
+
+
+async def set_budget_cap(conn, period: str, cap_cents: Optional[int]) -> None:
+    """Set the ``day`` or ``month`` cap; None removes it."""
+    await conn.execute(
+        """
+        UPDATE budget_caps SET cap_cents = $2, updated_at = CURRENT_TIMESTAMP
+        WHERE period = $1
+        """, period, cap_cents)
+
+
+async def spend_summary(conn) -> asyncpg.Record:
+    return await conn.fetchrow(
+        """
+        WITH bounds AS (
+            SELECT date_trunc('day', LOCALTIMESTAMP) AS day_start,
+                   date_trunc('month', LOCALTIMESTAMP) AS month_start
+        )
+        SELECT
+            COALESCE(SUM(budget_charge(r)) FILTER (
+                WHERE r.created_at >= b.day_start), 0)::int AS day_cents,
+            COALESCE(SUM(budget_charge(r)) FILTER (
+                WHERE r.created_at >= b.month_start), 0)::int AS month_cents,
+            COALESCE(SUM(r.reserved_cents) FILTER (
+                WHERE r.status = 'reserved'), 0)::int AS outstanding_cents,
+            COALESCE(SUM(budget_charge(r)) FILTER (
+                WHERE r.created_at >= LOCALTIMESTAMP - INTERVAL '24 hours'),
+                0)::int AS last_24h_cents,
+            (SELECT cap_cents FROM budget_caps
+             WHERE period = 'day') AS day_cap_cents,
+            (SELECT cap_cents FROM budget_caps
+             WHERE period = 'month') AS month_cap_cents,
+            EXTRACT(EPOCH FROM b.month_start + INTERVAL '1 month'
+                    - LOCALTIMESTAMP)::float8 AS month_remaining_s
+        FROM bounds b
+        LEFT JOIN budget_reservations r
+               ON r.created_at >= LEAST(b.month_start,
+                                        LOCALTIMESTAMP - INTERVAL '24 hours')
+        GROUP BY b.day_start, b.month_start
+        """)
+
+
+# -- dashboard -----------------------------------------------------------
+
+async def queue_counts(conn) -> Dict[str, int]:
+    rows = await conn.fetch(
+        "SELECT status, SUM(count)::bigint AS count FROM queue_status_counts "
+        "GROUP BY status")
+    return {row["status"]: row["count"] for row in rows}
+
+
+async def queue_depth(conn) -> List[asyncpg.Record]:
+    """Every non-empty ``(status, script_type, target_platform)`` count."""
+    return await conn.fetch(
+        "SELECT status, script_type, target_platform, count "
+        "FROM queue_status_counts WHERE count > 0")
+
+
+async def system_totals(conn) -> asyncpg.Record:
+    return await conn.fetchrow(
+        """
+        SELECT (SELECT COUNT(*) FROM lessons) AS total_lessons,
+               (SELECT COUNT(*) FROM video_queue
+                WHERE status = 'completed') AS total_videos
+        """)
+
+
+async def recent_items(conn, limit: int = 20) -> List[asyncpg.Record]:
+    return await conn.fetch(
+        """
+        SELECT script_id, lesson_id, lesson_title, script_type,
+               target_platform, status, created_at
+        FROM video_queue
+        ORDER BY id DESC
+        LIMIT $1
+        """, limit)
+
+
+async def queue_item(conn, script_id: str) -> Optional[asyncpg.Record]:
+    return await conn.fetchrow(
+        """
+        SELECT script_id, lesson_id, lesson_title, script_type,
+               target_platform, status, priority, hook_text, content,
+               created_at, processing_started_at, completed_at, video_url,
+               video_duration, video_url_expires_at, local_path,
+               downloaded_at, error_count, error_message, duplicate_of,
+               duplicate_similarity, metadata->>'task_id' AS task_id
+        FROM video_queue
+        WHERE script_id = $1
+        """, script_id)
+
+
+# -- logging -------------------------------------------------------------
+
+async def log_api_call(conn, script_id: str, api_endpoint: str,
+                       request_type: str, status_code: Optional[int],
+                       response_time: Optional[int],
+                       error_message: Optional[str] = None) -> None:
+    await conn.execute(
+        """
+        INSERT INTO api_usage_log (script_id, api_provider, api_endpoint,
+                                   request_type, status_code, response_time,
+                                   error_message)
+        VALUES ($1, 'wan2.5', $2, $3, $4, $5, $6)
+        """, script_id, api_endpoint, request_type, status_code,
+        response_time, error_message)
+
+
+async def log_api_start(conn, script_id: str, api_endpoint: str,
+                        request_type: str) -> int:
+    """Open an api_usage_log row before a request; returns its id."""
+    return await conn.fetchval(
+        """
+        INSERT INTO api_usage_log (script_id, api_provider, api_endpoint,
+                                   request_type)
+        VALUES ($1, 'wan2.5', $2, $3)
+        RETURNING id
+        """, script_id, api_endpoint, request_type)
+
+
+async def log_api_finish(conn, log_id: int, status_code: Optional[int],
+                         response_time: Optional[int],
+                         error_message: Optional[str] = None) -> None:
+    """Close the row opened by :func:`log_api_start`."""
+    await conn.execute(
+        """
+        UPDATE api_usage_log
+        SET status_code = $2, response_time = $3, error_message = $4,
+            completed_at = CURRENT_TIMESTAMP
+        WHERE id = $1
+        """, log_id, status_code, response_time, error_message)
+
+
+async def latest_api_call(conn, script_id: str) -> Optional[asyncpg.Record]:
+    return await conn.fetchrow(
+        """
+        SELECT * FROM api_usage_log
+        WHERE script_id = $1
+        ORDER BY id DESC
+        LIMIT 1
+        """, script_id)
+
+
+async def log_error(conn, script_id: str, error_type: str,
+                    error_message: str, error_context: str = "{}",
+                    retry_attempt: int = 0) -> None:
+    await conn.execute(
+        """
+        INSERT INTO error_log (script_id, error_type, error_message,
+                               error_context, retry_attempt)
+        VALUES ($1, $2, $3, $4::jsonb, $5)
+        """, script_id, error_type, error_message, error_context,
+        retry_attempt)
+
+
+async def insert_api_calls(conn, rows: List[tuple]) -> None:
+    """Insert finished requests in one statement (see :mod:`.logsink`).
+
+    Rows are ``(script_id, api_provider, api_endpoint, request_type,
+    status_code, response_time, error_message, created_at, completed_at,
+    cost_cents)``.
+    """
+    columns = list(zip(*rows))
+    await conn.execute(
+        """
+        INSERT INTO api_usage_log (script_id, api_provider, api_endpoint,
+                                   request_type, status_code, response_time,
+                                   error_message, created_at, completed_at,
+                                   cost_cents)
+        SELECT * FROM unnest($1::text[], $2::text[], $3::text[], $4::text[],
+                             $5::int[], $6::int[], $7::text[],
+                             $8::timestamptz[], $9::timestamptz[], $10::int[])
+        """, *columns)
+
+
+async def insert_errors(conn, rows: List[tuple]) -> None:
+    """Insert errors in one statement; rows are ``(script_id, error_type,
+    error_message, error_context, retry_attempt, created_at)``."""
+    columns = list(zip(*rows))
+    await conn.execute(
+        """
+        INSERT INTO error_log (script_id, error_type, error_message,
+                               error_context, retry_attempt, created_at)
+        SELECT s, t, m, c::jsonb, r, a
+        FROM unnest($1::text[], $2::text[], $3::text[], $4::text[],
+                    $5::int[], $6::timestamptz[]) AS e(s, t, m, c, r, a)
+        """, *columns)
+
+
+# -- maintenance ---------------------------------------------------------
+
+async def repair_queue_status_counts(conn) -> int:
+    """Recount ``queue_status_counts``; returns the groups that had drifted."""
+    return await conn.fetchval("SELECT repair_queue_status_counts()")
+
+
+async def ensure_log_partitions(conn, months_ahead: int = 2) -> int:
+    """Create missing monthly log partitions; returns how many were made."""
+    return await conn.fetchval("SELECT ensure_log_partitions($1)",
+                               months_ahead)
+
+
+async def drop_expired_log_partitions(conn, keep_months: int = 6) -> int:
+    """Drop log partitions older than ``keep_months``; returns the count."""
+    return await conn.fetchval("SELECT drop_expired_log_partitions($1)",
+                               keep_months)
@@ -0,0 +1,285 @@
+"""
+Parallel, resumable downloads for generated videos.
+
+Large files are split into byte ranges fetched over several pooled
+connections and written in place into a preallocated ``.part`` file.
+Finished ranges are recorded in a ``.part.json`` sidecar, so an
+interrupted transfer resumes where it stopped instead of starting over.
+A single :class:`RangeDownloader` can run many transfers at once under a
+shared connection cap and an optional bandwidth cap.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import aiohttp
+
+from .scheduler import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class DownloadError(Exception):
+    """Raised when a transfer cannot be completed or fails verification."""
+
+
+@dataclass(frozen=True)
+class DownloadResult:
+    path: str
+    size: int
+    elapsed: float
+    resumed_bytes: int = 0
+    segments: int = 1
+
+    @property
+    def bytes_per_sec(self) -> float:
+        transferred = self.size - self.resumed_bytes
+        return transferred / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class RangeDownloader:
+    """Downloads URLs with parallel HTTP Range requests.
+
+    ``max_connections`` caps open connections across every transfer,
+    ``max_segments`` caps how many of them one file may use, and
+    ``bandwidth`` (bytes/second) caps total throughput when set.
+    """
+
+    def __init__(self, max_connections: int = 8, max_segments: int = 4,
+                 segment_size: int = 4 << 20, chunk_size: int = 1 << 16,
+                 bandwidth: Optional[float] = None, retries: int = 3,
+                 connect_timeout: float = 10.0, read_timeout: float = 60.0):
+        self.max_segments = max_segments
+        self.segment_size = segment_size
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self._connections = asyncio.Semaphore(max_connections)
+        self._bandwidth = (TokenBucket(bandwidth, max(bandwidth, chunk_size))
+                           if bandwidth else None)
+        self._max_connections = max_connections
+        self._timeout = aiohttp.ClientTimeout(total=None,
+                                              sock_connect=connect_timeout,
+                                              sock_read=read_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._max_connections),
+                timeout=self._timeout,
+                auto_decompress=False,
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> "RangeDownloader":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    # -- public API ------------------------------------------------------
+
+    async def download(self, url: str, path: str) -> DownloadResult:
+        """Fetch ``url`` into ``path``, resuming a previous partial run."""
+        started = time.monotonic()
+        size, etag, ranged = await self._probe(url)
+        part, sidecar = path + ".part", path + ".part.json"
+
+        done = self._load_state(sidecar, size, etag) if ranged else []
+        if done and not (os.path.exists(part)
+                         and os.path.getsize(part) == size):
+            # The sidecar outlived (or does not match) its .part file, so
+            # the ranges it lists are not actually on disk.
+            done = []
+        if not done and os.path.exists(part):
+            os.remove(part)
+        self._preallocate(part, size)
+        resumed = sum(end - start + 1 for start, end in done)
+
+        if ranged and size > 0:
+            todo = self._missing(size, done)
+            workers = max(1, min(self.max_segments, len(todo)))
+            queue = asyncio.Queue()
+            for segment in todo:
+                queue.put_nowait(segment)
+            tasks = [asyncio.ensure_future(self._segment_worker(
+                         url, part, sidecar, size, etag, queue, done))
+                     for _ in range(workers)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # Stop the other segments before the error propagates;
+                # finished ranges are already in the sidecar for a resume.
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            segments = len(todo)
+        else:
+            await self._fetch_whole(url, part, size)
+            segments = 1
+
+        actual = os.path.getsize(part)
+        if size and actual != size:
+            raise DownloadError(f"{url}: expected {size} bytes, got {actual}")
+        os.replace(part, path)
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+
+        result = DownloadResult(path, actual, time.monotonic() - started,
+                                resumed, segments)
+        logger.info("Downloaded %s: %.1f MB in %.1fs (%.1f MB/s, %d segments)",
+                    path, actual / 1e6, result.elapsed,
+                    result.bytes_per_sec / 1e6, segments)
+        return result
+
+    # -- probing and state ----------------------------------------------
+
+    async def _probe(self, url: str) -> Tuple[int, Optional[str], bool]:
+        """Return (size, etag, supports_ranges).
+
+        Uses a one-byte ranged GET rather than HEAD: signed OSS URLs are
+        signed for GET only.
+        """
+        async with self._connections:
+            async with self.session.get(
+                    url, headers={"Range": "bytes=0-0"}) as response:
+                etag = response.headers.get("ETag")
+                if response.status == 206:
+                    match = _CONTENT_RANGE.match(
+                        response.headers.get("Content-Range", ""))
+                    if match and match.group(3) != "*":
+                        return int(match.group(3)), etag, True
+                if response.status in (200, 206):
+                    length = response.headers.get("Content-Length")
+                    return int(length) if length else 0, etag, False
+                raise DownloadError(f"{url}: HTTP {response.status}")
+
+    @staticmethod
+    def _load_state(sidecar: str, size: int,
+                    etag: Optional[str]) -> List[List[int]]:
+        try:
+            with open(sidecar) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if state.get("size") != size or state.get("etag") != etag:
+            return []  # the remote file changed; start over
+        return state.get("done", [])
+
+    @staticmethod
+    def _save_state(sidecar: str, size: int, etag: Optional[str],
+                    done: List[List[int]]) -> None:
+        tmp = sidecar + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"size": size, "etag": etag, "done": done}, f)
+        os.replace(tmp, sidecar)
+
+    @staticmethod
+    def _preallocate(part: str, size: int) -> None:
+        mode = "r+b" if os.path.exists(part) else "wb"
+        with open(part, mode) as f:
+            if size and os.path.getsize(part) != size:
+                f.truncate(size)
+                if hasattr(os, "posix_fallocate"):
+                    try:
+                        os.posix_fallocate(f.fileno(), 0, size)
+                    except OSError:
+                        pass  # e.g. unsupported filesystem; truncate is enough
+
+    def _missing(self, size: int,
+                 done: List[List[int]]) -> List[Tuple[int, int]]:
+        """Split the byte ranges not yet in ``done`` into segments."""
+        segment = max(self.segment_size,
+                      -(-size // max(1, self.max_segments * 4)))
+        covered = sorted(tuple(r) for r in done)
+        todo, position = [], 0
+        for start, end in covered + [(size, size)]:
+            while position < start:
+                stop = min(start, position + segment) - 1
+                todo.append((position, stop))
+                position = stop + 1
+            position = max(position, end + 1)
+        return todo
+
+    # -- transfer --------------------------------------------------------
+
+    async def _segment_worker(self, url, part, sidecar, size, etag, queue,
+                              done) -> None:
+        with open(part, "r+b") as f:
+            while not queue.empty():
+                start, end = queue.get_nowait()
+                await self._fetch_range(url, f, start, end)
+                done.append([start, end])
+                self._save_state(sidecar, size, etag, done)
+
+    async def _fetch_range(self, url: str, f, start: int, end: int) -> None:
+        position, attempt = start, 0
+        while position <= end:
+            try:
+                async with self._connections:
+                    async with self.session.get(
+                            url, headers={"Range": f"bytes={position}-{end}"}
+                    ) as response:
+                        self._check_range(url, response, position, end)
+                        f.seek(position)
+                        async for chunk in response.content.iter_chunked(
+                                self.chunk_size):
+                            if position + len(chunk) > end + 1:
+                                raise DownloadError(
+                                    f"{url}: server sent past byte {end}")
+                            if self._bandwidth is not None:
+                                await self._bandwidth.acquire(len(chunk))
+                            f.write(chunk)
+                            position += len(chunk)
+                if position <= end:
+                    raise DownloadError(f"{url}: short read at {position}")
+            except (aiohttp.ClientError, asyncio.TimeoutError,
+                    DownloadError) as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise DownloadError(f"{url}: range {start}-{end} failed: "
+                                        f"{e}") from e
+                logger.warning("Retrying %s from byte %d: %s", url, position, e)
+                await asyncio.sleep(2 ** attempt)
+
+    @staticmethod
+    def _check_range(url: str, response: aiohttp.ClientResponse, start: int,
+                     end: int) -> None:
+        if response.status != 206:
+            raise DownloadError(f"{url}: HTTP {response.status} for range "
+                                f"{start}-{end}")
+        match = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+        if not match or int(match.group(1)) != start:
+            raise DownloadError(f"{url}: unexpected Content-Range "
+                                f"{response.headers.get('Content-Range')!r}")
+        length = response.headers.get("Content-Length")
+        if length is not None and int(length) != end - start + 1:
+            raise DownloadError(f"{url}: Content-Length {length} does not "
+                                f"match range {start}-{end}")
+
+    async def _fetch_whole(self, url: str, part: str, size: int) -> None:
+        async with self._connections:
+            async with self.session.get(url) as response:
+                if response.status != 200:
+                    raise DownloadError(f"{url}: HTTP {response.status}")
+                with open(part, "wb") as f:
+                    async for chunk in response.content.iter_chunked(
+                            self.chunk_size):
+                        if self._bandwidth is not None:
+                            await self._bandwidth.acquire(len(chunk))
+                        f.write(chunk)
@@ -0,0 +1,293 @@
+"""
+Expiry-ordered download queue for finished videos.
+
+Wan 2.5 returns ``video_url`` as a signed OSS link that stops working at
+its ``Expires=`` time; a video nobody fetched before then is paid for and
+lost. :class:`DownloadQueue` keeps pending downloads in a heap ordered by
+that deadline (earliest first), fetches them with a shared
+:class:`~profbrainrot.downloader.RangeDownloader`, and predicts from
+observed transfer times whether the backlog will drain before each link
+expires, warning as soon as one will not.
+"""
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from . import metrics
+from .downloader import DownloadError, DownloadResult, RangeDownloader
+
+logger = logging.getLogger(__name__)
+
+# Assumed transfer time until the first download has been measured.
+DEFAULT_DOWNLOAD_SECONDS = 10.0
+
+
+def parse_expiry(url: str) -> Optional[float]:
+    """Epoch seconds at which a signed OSS URL stops working, if known.
+
+    Handles V1 signatures (``Expires=<epoch>``) and V4 signatures
+    (``x-oss-date`` plus ``x-oss-expires`` seconds).
+    """
+    query = {key.lower(): values[0]
+             for key, values in parse_qs(urlsplit(url).query).items()}
+    try:
+        if "expires" in query:
+            return float(query["expires"])
+        if "x-oss-expires" in query and "x-oss-date" in query:
+            signed = datetime.strptime(query["x-oss-date"], "%Y%m%dT%H%M%SZ")
+            signed = signed.replace(tzinfo=timezone.utc)
+            return signed.timestamp() + float(query["x-oss-expires"])
+    except ValueError:
+        logger.warning("Unparseable expiry in %s", url)
+    return None
+
+
+def sha256_file(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class DownloadJob:
+    url: str
+    path: str
+    context: Any = None
+    expires_at: Optional[float] = None
+    queued_at: float = field(default_factory=time.time)
+    alerted: bool = False
+
+    def seconds_left(self, now: Optional[float] = None) -> float:
+        if self.expires_at is None:
+            return math.inf
+        return self.expires_at - (time.time() if now is None else now)
+
+
+DownloadCallback = Callable[[DownloadJob, DownloadResult, str], Awaitable[None]]
+AlertCallback = Callable[[DownloadJob, float], Any]
+
+
+class DownloadQueue:
+    """Downloads jobs earliest-expiry first with ``workers`` transfers.
+
+    ``on_downloaded`` is awaited with the job, the :class:`DownloadResult`
+    and the file's sha256 hex digest. ``on_alert`` is called (once per
+    job) with the job and its predicted finish time when the backlog is
+    not expected to drain ``margin`` seconds before the link expires.
+    """
+
+    def __init__(self, downloader: RangeDownloader, workers: int = 2,
+                 on_downloaded: Optional[DownloadCallback] = None,
+                 on_alert: Optional[AlertCallback] = None,
+                 margin: float = 60.0, smoothing: float = 0.3,
+                 clock=time.time):
+        self.downloader = downloader
+        self.workers = workers
+        self.on_downloaded = on_downloaded
+        self.on_alert = on_alert
+        self.margin = margin
+        self.smoothing = smoothing
+        self._clock = clock
+        self._heap = []
+        self._seq = itertools.count()
+        self._queued: Dict[str, DownloadJob] = {}
+        self._active: Dict[str, float] = {}
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._workers = []
+        self.mean_seconds = DEFAULT_DOWNLOAD_SECONDS
+        self.mean_bytes_per_sec = 0.0
+        self.downloaded = 0
+        self.expired = 0
+        self.failed = 0
+        self.alerts = 0
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._queued or path in self._active
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queued": len(self._queued),
+            "active": len(self._active),
+            "downloaded": self.downloaded,
+            "expired": self.expired,
+            "failed": self.failed,
+            "alerts": self.alerts,
+            "mean_seconds": self.mean_seconds,
+            "mean_bytes_per_sec": self.mean_bytes_per_sec,
+            "drain_seconds": self.drain_seconds(),
+        }
+
+    # -- queueing --------------------------------------------------------
+
+    def put(self, url: str, path: str, context: Any = None,
+            expires_at: Optional[float] = None) -> Optional[DownloadJob]:
+        """Queue ``url`` for download to ``path``.
+
+        Returns None if ``path`` is already being downloaded; a path that
+        is already queued returns the existing job.
+        """
+        if path in self._active:
+            return None
+        job = self._queued.get(path)
+        if job is not None:
+            return job
+        if expires_at is None:
+            expires_at = parse_expiry(url)
+        job = DownloadJob(url, path, context, expires_at, self._clock())
+        self._queued[path] = job
+        deadline = expires_at if expires_at is not None else math.inf
+        heapq.heappush(self._heap, (deadline, next(self._seq), job))
+        self._wake.set()
+        self.check_deadlines()
+        return job
+
+    # -- prediction ------------------------------------------------------
+
+    def drain_seconds(self) -> float:
+        """Predicted seconds until everything queued now has downloaded."""
+        waves = math.ceil((len(self._queued) + len(self._active))
+                          / max(1, self.workers))
+        return waves * self.mean_seconds
+
+    def predicted_finishes(self) -> List[tuple]:
+        """(job, predicted finish epoch) for queued jobs in download order.
+
+        Transfers in progress are assumed to finish after one mean
+        transfer time from their start; each queued job then takes the
+        next free worker.
+        """
+        now = self._clock()
+        free_at = sorted(max(now, started + self.mean_seconds)
+                         for started in self._active.values())
+        free_at += [now] * max(0, self.workers - len(free_at))
+        heapq.heapify(free_at)
+        result = []
+        for _, _, job in sorted(self._heap, key=lambda e: e[:2]):
+            if self._queued.get(job.path) is not job:
+                continue
+            finish = heapq.heappop(free_at) + self.mean_seconds
+            heapq.heappush(free_at, finish)
+            result.append((job, finish))
+        return result
+
+    def check_deadlines(self) -> List[DownloadJob]:
+        """Alert for queued jobs predicted to finish too close to expiry."""
+        at_risk = []
+        for job, finish in self.predicted_finishes():
+            if job.expires_at is None or finish + self.margin < job.expires_at:
+                continue
+            at_risk.append(job)
+            if job.alerted:
+                continue
+            job.alerted = True
+            self.alerts += 1
+            logger.warning(
+                "Download backlog will not drain before %s expires: predicted "
+                "finish in %.0fs, link expires in %.0fs (%d queued)",
+                job.path, finish - self._clock(), job.seconds_left(self._clock()),
+                len(self._queued))
+            if self.on_alert is not None:
+                try:
+                    self.on_alert(job, finish)
+                except Exception:
+                    logger.exception("Download alert handler failed")
+        return at_risk
+
+    # -- main loop -------------------------------------------------------
+
+    def stop(self) -> None:
+        """Stop downloading; interrupted transfers resume on the next run."""
+        self._stopping = True
+        for worker in self._workers:
+            worker.cancel()
+
+    async def run(self) -> None:
+        """Download until :meth:`stop` is called."""
+        self._stopping = False
+        self._workers = [asyncio.ensure_future(self._work())
+                         for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        finally:
+            for worker in self._workers:
+                worker.cancel()
+            self._workers = []
+
+    async def _work(self) -> None:
+        while not self._stopping:
+            job = self._pop()
+            if job is None:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            await self._download(job)
+
+    def _pop(self) -> Optional[DownloadJob]:
+        while self._heap:
+            _, _, job = heapq.heappop(self._heap)
+            if self._queued.get(job.path) is job:
+                del self._queued[job.path]
+                return job
+        return None
+
+    async def _download(self, job: DownloadJob) -> None:
+        if job.seconds_left(self._clock()) <= 0:
+            self.expired += 1
+            logger.error("Link for %s expired before it could be downloaded",
+                         job.path)
+            return
+        self._active[job.path] = self._clock()
+        try:
+            directory = os.path.dirname(job.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            result = await self.downloader.download(job.url, job.path)
+            digest = await asyncio.get_running_loop().run_in_executor(
+                None, sha256_file, job.path)
+        except (DownloadError, OSError, asyncio.TimeoutError) as e:
+            self.failed += 1
+            logger.error("Download of %s failed: %s", job.path, e)
+            return
+        except Exception:
+            # Say a malformed response; one bad URL must not take the
+            # worker down with it.
+            self.failed += 1
+            logger.exception("Download of %s failed", job.path)
+            return
+        finally:
+            self._active.pop(job.path, None)
+        self._observe(result)
+        self.downloaded += 1
+        metrics.WAN_PHASE_SECONDS.observe(result.elapsed, phase="download")
+        if self.on_downloaded is not None:
+            try:
+                await self.on_downloaded(job, result, digest)
+            except Exception:
+                logger.exception("Download handler failed for %s", job.path)
+        self.check_deadlines()
+
+    def _observe(self, result: DownloadResult) -> None:
+        a = self.smoothing
+        if self.downloaded == 0:
+            self.mean_seconds = result.elapsed
+            self.mean_bytes_per_sec = result.bytes_per_sec
+        else:
+            self.mean_seconds += a * (result.elapsed - self.mean_seconds)
+            self.mean_bytes_per_sec += a * (result.bytes_per_sec
+                                            - self.mean_bytes_per_sec)
@@ -0,0 +1,201 @@
+"""
+Live queue events for dashboard clients.
+
+:class:`EventHub` holds a single ``LISTEN video_queue_status`` connection and
+fans every notification (one per new row or status change, see
+``notify_video_queue_status`` in the schema) out to any number of
+subscribers. Recent events stay in a ring buffer under ids of the form
+``<epoch>-<seq>``, so a client that reconnects with ``Last-Event-ID`` is
+sent exactly the events it missed. When that is not possible (the id is
+from an earlier process, has fallen out of the buffer, or the listener lost
+its connection in between) the client gets a ``reset`` event and should
+reload the full status instead.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Event:
+    id: str
+    type: str
+    data: str  # single-line JSON
+
+    def encode(self) -> bytes:
+        """The event in ``text/event-stream`` framing."""
+        return (f"id: {self.id}\nevent: {self.type}\n"
+                f"data: {self.data}\n\n").encode("utf-8")
+
+
+class Subscription:
+    """One client's queue of pending events.
+
+    :meth:`get` returns None once the subscription is closed, either by
+    :meth:`EventHub.close` or because the client fell ``maxsize`` events
+    behind; it should reconnect and resume from its last event id.
+    """
+
+    def __init__(self, maxsize: int):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.closed = False
+
+    async def get(self) -> Optional[Event]:
+        return await self._queue.get()
+
+    def _put(self, event: Event) -> bool:
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def _close(self) -> None:
+        self.closed = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+
+class EventHub:
+    """Fans one Postgres LISTEN out to many :class:`Subscription` objects."""
+
+    def __init__(self, pool, channel: str = db.STATUS_CHANNEL,
+                 buffer_size: int = 1000, client_queue: int = 256,
+                 reconnect_delay: float = 2.0):
+        self.pool = pool
+        self.channel = channel
+        self.client_queue = client_queue
+        self.reconnect_delay = reconnect_delay
+        # Ids from an earlier process never resume into this one.
+        self.epoch = str(int(time.time() * 1000))
+        self._seq = 0
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._subscribers: set = set()
+        self._conn = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.published = 0
+        self.dropped = 0
+
+    def stats(self) -> Dict[str, float]:
+        return {"subscribers": len(self._subscribers),
+                "published": self.published,
+                "dropped_subscribers": self.dropped,
+                "buffered": len(self._buffer),
+                "listening": self._conn is not None}
+
+    # -- listener --------------------------------------------------------
+
+    async def start(self) -> None:
+        conn = await self.pool.acquire()
+        try:
+            await conn.add_listener(self.channel, self._on_notify)
+        except Exception:
+            await self.pool.release(conn)
+            raise
+        conn.add_termination_listener(self._on_terminate)
+        self._conn = conn
+        logger.info("Listening on %s for dashboard events", self.channel)
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.remove_termination_listener(self._on_terminate)
+            try:
+                await conn.remove_listener(self.channel, self._on_notify)
+            finally:
+                await self.pool.release(conn)
+        for subscription in list(self._subscribers):
+            subscription._close()
+        self._subscribers.clear()
+
+    def _on_notify(self, conn, pid, channel, payload: str) -> None:
+        self.publish("status", payload)
+
+    def _on_terminate(self, conn) -> None:
+        if self._closing or conn is not self._conn:
+            return
+        logger.warning("Event listener connection lost; reconnecting")
+        self._conn = None
+        self._reconnect_task = asyncio.ensure_future(self._reconnect(conn))
+
+    async def _reconnect(self, old) -> None:
+        try:
+            await self.pool.release(old)
+        except Exception:
+            pass
+        while not self._closing:
+            try:
+                await self.start()
+            except Exception as e:
+                logger.warning("Event listener reconnect failed: %s", e)
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            # Notifications sent while we were away are gone for good.
+            self.publish("reset", "{}")
+            return
+
+    # -- fan-out ---------------------------------------------------------
+
+    def _event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    @property
+    def last_event_id(self) -> str:
+        """Id of the newest event; subscribe with it to get only later ones."""
+        return self._event_id(self._seq)
+
+    def publish(self, event_type: str, data: str) -> Event:
+        self._seq += 1
+        event = Event(self._event_id(self._seq), event_type, data)
+        self._buffer.append((self._seq, event))
+        self.published += 1
+        for subscription in list(self._subscribers):
+            if not subscription._put(event):
+                self.dropped += 1
+                self._subscribers.discard(subscription)
+                subscription._close()
+        return event
+
+    def since(self, last_event_id: Optional[str]) -> Optional[List[Event]]:
+        """Buffered events after ``last_event_id``; None if it can't resume."""
+        if not last_event_id:
+            return []
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq >= self._seq:
+            return []
+        if not self._buffer or seq < self._buffer[0][0] - 1:
+            return None
+        return [event for n, event in self._buffer if n > seq]
+
+    def subscribe(self, last_event_id: Optional[str] = None
+                  ) -> Tuple[Subscription, List[Event]]:
+        """Register a subscriber; returns it with the events to replay first.
+
+        The replay is a single ``reset`` event when ``last_event_id`` cannot
+        be resumed.
+        """
+        subscription = Subscription(self.client_queue)
+        replay = self.since(last_event_id)
+        if replay is None:
+            replay = [Event(self._event_id(self._seq), "reset", "{}")]
+        self._subscribers.add(subscription)
+        return subscription, replay
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
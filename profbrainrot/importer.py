@@ -0,0 +1,252 @@
+"""
+Bulk lesson import.
+
+Streams lessons from CSV or JSONL files, or from a directory of PDF/DOCX/
+text files, into the ``lessons`` table. Rows are loaded in fixed-size
+chunks with ``COPY`` into a temporary staging table and upserted on
+``lesson_id`` from there, so memory stays constant however large the
+input is. New lessons, and existing lessons whose title, subject, grade
+level or content changed, are left ``pending`` for script generation
+(the changed ones' still-queued scripts are cancelled); unchanged lessons
+are not touched.
+
+Run with ``python -m profbrainrot.importer lessons.jsonl``. PDF and DOCX
+files need the optional ``pypdf`` and ``python-docx`` packages.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_SUFFIXES = (".pdf", ".docx", ".txt", ".md")
+
+# Input field -> lessons column; anything else goes into metadata.
+_ALIASES = {
+    "lesson_id": "lesson_id",
+    "id": "lesson_id",
+    "title": "title",
+    "subject": "subject",
+    "grade_level": "grade_level",
+    "grade": "grade_level",
+    "content": "original_content",
+    "original_content": "original_content",
+    "format": "content_format",
+    "content_format": "content_format",
+    "source_type": "source_type",
+    "source_reference": "source_reference",
+}
+
+_STAGING_COLUMNS = ("seq", "lesson_id", "title", "subject", "grade_level",
+                    "original_content", "content_format", "source_type",
+                    "source_reference", "metadata")
+
+_SLUG = re.compile(r"[^a-z0-9]+")
+
+
+class LessonImportError(ValueError):
+    """Raised for input that cannot be imported (bad row, missing parser)."""
+
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+
+# -- readers ---------------------------------------------------------------
+
+def _normalize(record: Dict[str, object], defaults: Dict[str, str],
+               where: str) -> Dict[str, object]:
+    lesson: Dict[str, object] = dict(defaults)
+    metadata = {}
+    for key, value in record.items():
+        column = _ALIASES.get(str(key).strip().lower())
+        if column is None:
+            metadata[key] = value
+        elif value not in (None, ""):
+            lesson[column] = str(value)
+    for required in ("lesson_id", "title", "original_content"):
+        if not lesson.get(required):
+            raise LessonImportError(f"{where}: missing {required}")
+    lesson.setdefault("subject", "general")
+    lesson.setdefault("grade_level", "unknown")
+    lesson["metadata"] = json.dumps(metadata) if metadata else "{}"
+    return lesson
+
+
+def read_csv(path: str, defaults: Dict[str, str]) -> Iterator[Dict[str, object]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line, record in enumerate(csv.DictReader(f), start=2):
+            yield _normalize(record, defaults, f"{path}:{line}")
+
+
+def read_jsonl(path: str, defaults: Dict[str, str]) -> Iterator[Dict[str, object]]:
+    with open(path, encoding="utf-8") as f:
+        for line, text in enumerate(f, start=1):
+            if text.strip():
+                yield _normalize(json.loads(text), defaults, f"{path}:{line}")
+
+
+def _document_text(path: str) -> Tuple[str, str]:
+    """(text, content_format) for a PDF, DOCX or plain-text file."""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise LessonImportError("PDF import needs the 'pypdf' package") from None
+        pages = (page.extract_text() or "" for page in PdfReader(path).pages)
+        return "\n".join(pages), "pdf"
+    if suffix == ".docx":
+        try:
+            import docx
+        except ImportError:
+            raise LessonImportError(
+                "DOCX import needs the 'python-docx' package") from None
+        paragraphs = (p.text for p in docx.Document(path).paragraphs)
+        return "\n".join(paragraphs), "docx"
+    with open(path, encoding="utf-8") as f:
+        return f.read(), "text"
+
+
+def read_documents(directory: str,
+                   defaults: Dict[str, str]) -> Iterator[Dict[str, object]]:
+    """One lesson per document; the file name gives the id and title."""
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            stem, suffix = os.path.splitext(name)
+            if suffix.lower() not in DOCUMENT_SUFFIXES:
+                continue
+            path = os.path.join(root, name)
+            text, content_format = _document_text(path)
+            relative = os.path.relpath(os.path.join(root, stem), directory)
+            record = {
+                "lesson_id": _SLUG.sub("_", relative.lower()).strip("_"),
+                "title": stem.replace("_", " ").strip(),
+                "content": text,
+                "format": content_format,
+                "source_reference": path,
+            }
+            yield _normalize(record, defaults, path)
+
+
+def read_lessons(path: str, defaults: Dict[str, str],
+                 fmt: str = "auto") -> Iterator[Dict[str, object]]:
+    if fmt == "auto":
+        if os.path.isdir(path):
+            fmt = "documents"
+        elif path.lower().endswith((".jsonl", ".ndjson")):
+            fmt = "jsonl"
+        else:
+            fmt = "csv"
+    readers = {"csv": read_csv, "jsonl": read_jsonl,
+               "documents": read_documents}
+    return readers[fmt](path, defaults)
+
+
+# -- loading ---------------------------------------------------------------
+
+def _chunks(rows: Iterable[Dict[str, object]],
+            size: int) -> Iterator[List[tuple]]:
+    chunk = []
+    for seq, lesson in enumerate(rows):
+        chunk.append((seq,) + tuple(lesson.get(c) for c in _STAGING_COLUMNS[1:]))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def import_lessons(conn, rows: Iterable[Dict[str, object]],
+                         chunk_size: int = 10000) -> ImportStats:
+    """COPY ``rows`` through a staging table and upsert them into lessons."""
+    stats = ImportStats()
+    started = time.monotonic()
+    await db.create_lesson_staging(conn)
+    for chunk in _chunks(rows, chunk_size):
+        async with conn.transaction():
+            await conn.copy_records_to_table("lesson_import", records=chunk,
+                                             columns=_STAGING_COLUMNS)
+            inserted, updated, distinct = await db.upsert_staged_lessons(conn)
+        stats.read += len(chunk)
+        stats.inserted += inserted
+        stats.updated += updated
+        stats.unchanged += distinct - inserted - updated
+        logger.info("Imported %d lessons (%d new, %d changed)", stats.read,
+                    stats.inserted, stats.updated)
+    stats.elapsed = time.monotonic() - started
+    return stats
+
+
+async def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="+",
+                        help="CSV/JSONL files or directories of documents")
+    parser.add_argument("--format", choices=("auto", "csv", "jsonl",
+                                             "documents"), default="auto")
+    parser.add_argument("--subject", help="subject for rows that have none")
+    parser.add_argument("--grade-level", help="grade level for rows that have none")
+    parser.add_argument("--source-type", default="import",
+                        help="lessons.source_type for rows that have none")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="rows per COPY/upsert round")
+    parser.add_argument("--generate", action="store_true",
+                        help="generate scripts for new/changed lessons afterwards")
+    parser.add_argument("--dsn", default=None,
+                        help="Postgres DSN (default: DATABASE_URL / DB_POSTGRESDB_*)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    defaults = {"source_type": args.source_type}
+    if args.subject:
+        defaults["subject"] = args.subject
+    if args.grade_level:
+        defaults["grade_level"] = args.grade_level
+
+    pool = await db.create_pool(args.dsn)
+    try:
+        async with pool.acquire() as conn:
+            for path in args.paths:
+                try:
+                    stats = await import_lessons(
+                        conn, read_lessons(path, defaults, args.format),
+                        args.chunk_size)
+                except (LessonImportError, ValueError, OSError) as e:
+                    sys.exit(f"{path}: {e}")
+                logger.info("%s: %d read, %d new, %d changed, %d unchanged "
+                            "in %.1fs (%.0f rows/s)", path, stats.read,
+                            stats.inserted, stats.updated, stats.unchanged,
+                            stats.elapsed, stats.rows_per_sec)
+        if args.generate:
+            from .batchgen import BatchScriptGenerator
+            from .scriptgen import ScriptGenerator
+            async with ScriptGenerator.from_env(pool) as generator:
+                batch = BatchScriptGenerator(generator, pool)
+                logger.info("Script generation: %s", await batch.run())
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
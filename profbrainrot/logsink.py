@@ -0,0 +1,291 @@
+"""
+Buffered writer for ``api_usage_log`` and ``error_log``.
+
+Logging an API call or an error used to cost the worker a round-trip
+(or two) on the path of every generation. :class:`LogSink` takes events
+without waiting: :meth:`~LogSink.api_call` and :meth:`~LogSink.error` only
+append to an in-memory buffer, and :meth:`~LogSink.run` flushes it in one
+multi-row insert per table whenever ``max_batch`` events are waiting or
+``flush_interval`` seconds have passed. Each event keeps the time it
+happened as its ``created_at``, however late it is written.
+
+Memory is bounded by ``max_buffer`` events. Past that, or whenever Postgres
+cannot be reached, events are appended to a JSON-lines spill file instead
+and replayed once a flush succeeds again. Delivery is at least once: a
+crash in the middle of a replay can write some events twice. Without a
+spill file the oldest events are dropped (and counted) instead.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+
+from . import db, metrics
+
+logger = logging.getLogger(__name__)
+
+API_TABLE = "api_usage_log"
+ERROR_TABLE = "error_log"
+# Row positions holding datetimes, restored when a spill file is replayed.
+_TIMESTAMPS = {API_TABLE: (7, 8), ERROR_TABLE: (5,)}
+# Row lengths; shorter rows spilled by an older version are padded with None.
+_WIDTHS = {API_TABLE: 10, ERROR_TABLE: 6}
+# A record that Postgres rejects on its own; retrying cannot help.
+_BAD_RECORD = (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError)
+
+Record = Tuple[str, tuple]  # (table, row in db.insert_* column order)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class LogSink:
+    """Buffers log rows and writes them in batches; see the module docstring."""
+
+    def __init__(self, pool, max_batch: int = 500, flush_interval: float = 1.0,
+                 max_buffer: int = 10000, spill_path: Optional[str] = None,
+                 clock=time.monotonic):
+        if max_buffer < max_batch:
+            raise ValueError("max_buffer must be at least max_batch")
+        self.pool = pool
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.spill_path = spill_path
+        self._clock = clock
+        self._buffer: deque = deque()
+        self._wake = asyncio.Event()
+        self._flushing = asyncio.Lock()
+        self._closed = False
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.last_flush_s = 0.0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def stats(self) -> Dict[str, float]:
+        return {"buffered": len(self._buffer),
+                "written": self.written,
+                "batches": self.batches,
+                "spilled": self.spilled,
+                "replayed": self.replayed,
+                "dropped": self.dropped,
+                "rejected": self.rejected,
+                "last_flush_s": self.last_flush_s}
+
+    # -- producers -------------------------------------------------------
+
+    def api_call(self, script_id: Optional[str], api_endpoint: str,
+                 request_type: str, status_code: Optional[int],
+                 response_time: Optional[int],
+                 error_message: Optional[str] = None,
+                 api_provider: str = "wan2.5",
+                 cost_cents: Optional[int] = None) -> None:
+        """Record a finished request; ``response_time`` is in milliseconds
+        and ``cost_cents`` what the request was billed, if anything."""
+        completed_at = _now()
+        created_at = completed_at - timedelta(milliseconds=response_time or 0)
+        self._add(API_TABLE, (script_id, api_provider, api_endpoint,
+                              request_type, status_code, response_time,
+                              error_message, created_at, completed_at,
+                              cost_cents))
+
+    def error(self, script_id: Optional[str], error_type: str,
+              error_message: str, error_context: str = "{}",
+              retry_attempt: int = 0) -> None:
+        self._add(ERROR_TABLE, (script_id, error_type, error_message,
+                                error_context, retry_attempt, _now()))
+
+    def _add(self, table: str, row: tuple) -> None:
+        if self._closed:
+            raise RuntimeError("log sink is closed")
+        if len(self._buffer) >= self.max_buffer:
+            # Make room without waiting on the database.
+            self._spill(self._take(self.max_batch))
+        self._buffer.append((table, row))
+        if len(self._buffer) >= self.max_batch:
+            self._wake.set()
+
+    def _take(self, n: int) -> List[Record]:
+        return [self._buffer.popleft()
+                for _ in range(min(n, len(self._buffer)))]
+
+    # -- flushing --------------------------------------------------------
+
+    async def run(self) -> None:
+        """Flush on the size/time trigger until :meth:`close`."""
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Log flush failed")
+
+    async def flush(self) -> None:
+        """Write everything buffered, then replay any spilled events."""
+        async with self._flushing:
+            started = self._clock()
+            while self._buffer:
+                left = await self._write(self._take(self.max_batch))
+                if left:
+                    # Postgres is unavailable: free the memory and retry
+                    # from disk on a later flush.
+                    self._spill(left)
+                    self._spill(self._take(len(self._buffer)))
+                    return
+            await self._replay()
+            self.last_flush_s = self._clock() - started
+
+    async def close(self) -> None:
+        """Stop :meth:`run` and write (or spill) whatever is left."""
+        self._closed = True
+        self._wake.set()
+        await self.flush()
+
+    async def _write(self, batch: List[Record]) -> List[Record]:
+        """Insert ``batch``; returns the records that could not be written."""
+        if not batch:
+            return []
+        try:
+            async with self.pool.acquire() as conn:
+                try:
+                    async with conn.transaction():
+                        await self._insert(conn, batch)
+                except _BAD_RECORD:
+                    # One bad record (say an unknown script_id) must not
+                    # hold up the rest of the batch.
+                    return await self._write_each(conn, batch)
+        except Exception as e:
+            logger.warning("Cannot write %d log record(s): %s", len(batch), e)
+            return batch
+        self.written += len(batch)
+        self.batches += 1
+        metrics.LOG_RECORDS.inc(len(batch), outcome="written")
+        return []
+
+    async def _write_each(self, conn, batch: List[Record]) -> List[Record]:
+        for n, record in enumerate(batch):
+            try:
+                await self._insert(conn, [record])
+            except _BAD_RECORD as e:
+                self.rejected += 1
+                metrics.LOG_RECORDS.inc(outcome="rejected")
+                logger.warning("Dropping %s record %r: %s", record[0],
+                               record[1][:3], e)
+            except Exception as e:
+                logger.warning("Cannot write %d log record(s): %s",
+                               len(batch) - n, e)
+                return batch[n:]
+            else:
+                self.written += 1
+                metrics.LOG_RECORDS.inc(outcome="written")
+        return []
+
+    @staticmethod
+    async def _insert(conn, batch: List[Record]) -> None:
+        calls = [row for table, row in batch if table == API_TABLE]
+        errors = [row for table, row in batch if table == ERROR_TABLE]
+        if calls:
+            await db.insert_api_calls(conn, calls)
+        if errors:
+            await db.insert_errors(conn, errors)
+
+    # -- spill file ------------------------------------------------------
+
+    def _spill(self, records: List[Record], respill: bool = False) -> None:
+        """Append ``records`` to the spill file; ``respill`` for ones that
+        were already counted when first spilled."""
+        if not records:
+            return
+        if self.spill_path is None:
+            self.dropped += len(records)
+            metrics.LOG_RECORDS.inc(len(records), outcome="dropped")
+            logger.warning("Dropped %d log record(s) (no spill file)",
+                           len(records))
+            return
+        lines = [json.dumps({"table": table, "row": row},
+                            default=datetime.isoformat) + "\n"
+                 for table, row in records]
+        try:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            self.dropped += len(records)
+            metrics.LOG_RECORDS.inc(len(records), outcome="dropped")
+            logger.error("Dropped %d log record(s): cannot spill to %s: %s",
+                         len(records), self.spill_path, e)
+            return
+        if not respill:
+            self.spilled += len(records)
+            metrics.LOG_RECORDS.inc(len(records), outcome="spilled")
+
+    @staticmethod
+    def _decode(line: str) -> Optional[Record]:
+        try:
+            record = json.loads(line)
+            table, row = record["table"], list(record["row"])
+            for i in _TIMESTAMPS[table]:
+                row[i] = datetime.fromisoformat(row[i])
+            row.extend([None] * (_WIDTHS[table] - len(row)))
+        except (ValueError, KeyError, TypeError, IndexError):
+            return None  # e.g. a line cut short by a crash
+        return table, tuple(row)
+
+    async def _replay(self) -> None:
+        if self.spill_path is None:
+            return
+        replaying = self.spill_path + ".replay"
+        # A .replay file left over from a crash is finished first.
+        if not os.path.exists(replaying):
+            if not os.path.exists(self.spill_path):
+                return
+            os.replace(self.spill_path, replaying)
+        with open(replaying, encoding="utf-8") as f:
+            batch: List[Record] = []
+            for line in f:
+                record = self._decode(line)
+                if record is None:
+                    logger.warning("Skipping unreadable spill line")
+                    continue
+                batch.append(record)
+                if len(batch) >= self.max_batch:
+                    if not await self._replay_batch(batch, f):
+                        break
+                    batch = []
+            else:
+                await self._replay_batch(batch, f)
+        os.remove(replaying)
+
+    async def _replay_batch(self, batch: List[Record], rest) -> bool:
+        """Write one replayed batch; on failure move it and ``rest`` back."""
+        left = await self._write(batch)
+        self.replayed += len(batch) - len(left)
+        metrics.LOG_RECORDS.inc(len(batch) - len(left), outcome="replayed")
+        if not left:
+            return True
+        self._spill(left, respill=True)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.writelines(rest)
+            f.flush()
+            os.fsync(f.fileno())
+        return False
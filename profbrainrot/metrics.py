@@ -0,0 +1,272 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+The pipeline components update the module-level metrics below as things
+happen (a submit, a 429, a finished poll, a download, a settled cost), so
+a scrape only formats numbers already in memory. The one database-backed
+series, queue depth by status and platform, is copied from
+``queue_status_counts`` on a timer by whoever serves it (see
+:func:`set_queue_depth`), never on scrape.
+
+Updates are plain dict operations on the event loop: no locks, and no
+``await`` between reading and writing a value.
+
+``/metrics`` is served by the dashboard, and by the queue worker when it
+is started with ``--metrics-port``.
+"""
+
+import bisect
+import logging
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans a fast poll up to a slow 1080p generation.
+PHASE_BUCKETS = (1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+LLM_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 180)
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+class Registry:
+    """The metrics one ``/metrics`` endpoint exposes."""
+
+    def __init__(self):
+        self._metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric") -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"duplicate metric {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional["Metric"]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, "
+                             f"got {tuple(labels)}")
+        try:
+            return tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError:
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, "
+                             f"got {tuple(labels)}") from None
+
+    def _series(self, key: Tuple[str, ...], suffix: str = "",
+                extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"'
+                 for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        labels = "{" + ",".join(pairs) + "}" if pairs else ""
+        return self.name + suffix + labels
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self._series(key)} {_format(value)}"
+
+
+class Counter(Metric):
+    """A count that only goes up; names end in ``_total``."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if amount < 0:
+            raise ValueError("counters cannot decrease")
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def replace(self, values: Dict[Tuple[str, ...], float]) -> None:
+        """Swap in a full set of series (label tuples in ``labelnames`` order).
+
+        Series missing from ``values`` disappear rather than keep a stale
+        number.
+        """
+        self._values = {tuple(str(v) for v in key): value
+                        for key, value in values.items()}
+
+
+class _Buckets:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    """Distribution of observations over fixed ``buckets`` (upper bounds)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = PHASE_BUCKETS,
+                 registry: Optional[Registry] = REGISTRY):
+        super().__init__(name, help, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = _Buckets(len(self.buckets) + 1)
+        # Counts per bucket; made cumulative when rendered.
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def value(self, **labels) -> float:
+        """Number of observations (use :meth:`total` for their sum)."""
+        series = self._values.get(self._key(labels))
+        return series.count if series is not None else 0
+
+    def total(self, **labels) -> float:
+        series = self._values.get(self._key(labels))
+        return series.sum if series is not None else 0.0
+
+    def samples(self) -> Iterable[str]:
+        for key, series in sorted(self._values.items(),
+                                  key=lambda item: item[0]):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series.counts):
+                cumulative += count
+                le = 'le="' + _format(bound) + '"'
+                yield f"{self._series(key, '_bucket', le)} {cumulative}"
+            yield f"{self._series(key, '_sum')} {_format(series.sum)}"
+            yield f"{self._series(key, '_count')} {series.count}"
+
+
+# -- pipeline metrics ----------------------------------------------------
+
+QUEUE_ITEMS = Gauge(
+    "profbrainrot_queue_items", "video_queue rows by status",
+    ("status", "script_type", "target_platform"))
+QUEUE_REFRESHED = Gauge(
+    "profbrainrot_queue_items_refreshed_timestamp_seconds",
+    "When profbrainrot_queue_items was last copied from Postgres")
+
+WAN_SUBMITS = Counter(
+    "profbrainrot_wan_submits_total",
+    "Wan 2.5 submit attempts by outcome (accepted, rate_limited, error)",
+    ("outcome",))
+WAN_SLOTS_IN_USE = Gauge(
+    "profbrainrot_wan_slots_in_use", "Wan 2.5 concurrency slots held")
+WAN_SLOTS = Gauge(
+    "profbrainrot_wan_slots", "Wan 2.5 concurrency slots available in total")
+WAN_POLLS = Counter(
+    "profbrainrot_wan_polls_total", "Wan 2.5 status checks by outcome",
+    ("outcome",))
+WAN_TASKS = Counter(
+    "profbrainrot_wan_tasks_total", "Wan 2.5 tasks finished by final status",
+    ("status",))
+WAN_PHASE_SECONDS = Histogram(
+    "profbrainrot_wan_phase_seconds",
+    "Seconds per task phase (pending, running, download)", ("phase",))
+
+LLM_SECONDS = Histogram(
+    "profbrainrot_llm_request_seconds",
+    "OpenAI chat completion latency by outcome", ("model", "outcome"),
+    buckets=LLM_BUCKETS)
+LLM_TOKENS = Counter(
+    "profbrainrot_llm_tokens_total", "OpenAI tokens used (prompt, completion)",
+    ("model", "kind"))
+
+COST_CENTS = Counter(
+    "profbrainrot_cost_cents_total", "Settled generation cost in cents")
+BUDGET_RESERVATIONS = Counter(
+    "profbrainrot_budget_reservations_total",
+    "Budget reservations by outcome (granted, downtiered, refused)",
+    ("outcome",))
+
+LOG_RECORDS = Counter(
+    "profbrainrot_log_records_total",
+    "api_usage_log / error_log rows by outcome "
+    "(written, spilled, replayed, dropped, rejected)", ("outcome",))
+
+
+def set_queue_depth(rows) -> None:
+    """Load :data:`QUEUE_ITEMS` from ``db.queue_depth`` rows."""
+    QUEUE_ITEMS.replace({
+        (row["status"], row["script_type"] or "", row["target_platform"] or ""):
+            row["count"]
+        for row in rows})
+    QUEUE_REFRESHED.set(time.time())
+
+
+# -- exposition ----------------------------------------------------------
+
+async def handle(request: web.Request) -> web.Response:
+    """aiohttp handler for ``GET /metrics``."""
+    return web.Response(body=REGISTRY.render().encode("utf-8"),
+                        headers={"Content-Type": CONTENT_TYPE})
+
+
+async def serve(host: str, port: int) -> web.AppRunner:
+    """Serve ``/metrics`` on its own port; ``cleanup()`` the runner to stop."""
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics on http://%s:%d/metrics", host, port)
+    return runner
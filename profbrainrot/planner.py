@@ -0,0 +1,172 @@
+"""
+Per-script generation planning.
+
+Every script used to be generated as 10 seconds of 1280*720, however short
+its narration and whichever platform it is for. :class:`VideoPlanner`
+picks the cheapest valid request per script instead:
+
+- the duration is the shortest Wan 2.5 accepts (5 or 10 seconds) that
+  covers the spoken length of the script, estimated from its word count
+  and capped at ``estimated_attention_span`` when the row has one;
+- the size matches the platform's aspect ratio (9:16 for TikTok, Shorts and
+  Reels, 16:9 otherwise) at the configured quality tier, so nothing is
+  cropped afterwards.
+
+The plan is stored in ``video_queue.planned_size`` / ``planned_duration``,
+which the worker and the n8n queue workflow both submit with.
+
+Run ``python -m profbrainrot.planner`` to plan queued rows ahead of time,
+e.g. for a deployment that only runs the n8n workflow.
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import re
+from dataclasses import dataclass, replace
+from typing import Dict, Optional
+
+from . import db
+from .costs import PRICE_CENTS_PER_SECOND, TIER_SIZES, price_cents
+from .wan25 import GenerationParams
+
+logger = logging.getLogger(__name__)
+
+DURATIONS = (5, 10)  # seconds Wan 2.5 can generate
+WORDS_PER_SECOND = 2.5  # ~150 wpm narration
+
+PORTRAIT = "9:16"
+LANDSCAPE = "16:9"
+PLATFORM_ASPECTS = {
+    "tiktok": PORTRAIT,
+    "youtube_shorts": PORTRAIT,
+    "instagram_reels": PORTRAIT,
+    "youtube": LANDSCAPE,
+}
+
+_WORD = re.compile(r"\w+(?:['’]\w+)*")
+
+
+@dataclass(frozen=True)
+class Plan:
+    size: str
+    duration: int
+    spoken_seconds: float
+    cents: int
+
+
+class VideoPlanner:
+    """Chooses (duration, size) for a script; see the module docstring.
+
+    ``tier`` is the resolution (480, 720 or 1080) every video is made at;
+    ``platform_tiers`` overrides it per ``target_platform``.
+    """
+
+    def __init__(self, tier: int = 720,
+                 words_per_second: float = WORDS_PER_SECOND,
+                 platform_tiers: Optional[Dict[str, int]] = None):
+        if tier not in TIER_SIZES:
+            raise ValueError(f"unknown quality tier {tier}")
+        self.tier = tier
+        self.words_per_second = words_per_second
+        self.platform_tiers = dict(platform_tiers or {})
+        self.planned = 0
+        self.planned_seconds = 0
+
+    def stats(self) -> Dict[str, float]:
+        return {"planned": self.planned,
+                "planned_seconds": self.planned_seconds,
+                # Against the old flat 10 seconds per script.
+                "seconds_saved": self.planned * max(DURATIONS)
+                                 - self.planned_seconds}
+
+    def spoken_seconds(self, content: str) -> float:
+        return len(_WORD.findall(content or "")) / self.words_per_second
+
+    @staticmethod
+    def aspect(target_platform: Optional[str],
+               script_type: Optional[str] = None) -> str:
+        aspect = PLATFORM_ASPECTS.get((target_platform or "").lower())
+        if aspect is None:
+            aspect = PORTRAIT if script_type == "short" else LANDSCAPE
+        return aspect
+
+    def plan(self, content: str, target_platform: Optional[str],
+             script_type: Optional[str] = None,
+             attention_span: Optional[int] = None,
+             audio: bool = True) -> Plan:
+        spoken = self.spoken_seconds(content)
+        needed = spoken if not attention_span else min(spoken, attention_span)
+        long_enough = [d for d in DURATIONS if d >= math.ceil(needed)]
+        durations = long_enough or [max(DURATIONS)]
+        tier = self.platform_tiers.get(target_platform, self.tier)
+        landscape, portrait = TIER_SIZES[tier]
+        size = portrait if self.aspect(target_platform,
+                                       script_type) == PORTRAIT else landscape
+        duration, cents = min(
+            ((d, price_cents(GenerationParams(size=size, duration=d,
+                                              audio=audio)))
+             for d in durations),
+            key=lambda candidate: candidate[1])
+        self.planned += 1
+        self.planned_seconds += duration
+        return Plan(size, duration, spoken, cents)
+
+    def plan_row(self, row) -> Plan:
+        """Plan a ``video_queue`` / ``claim_batch`` record."""
+        return self.plan(row["content"], row["target_platform"],
+                         row["script_type"], row["estimated_attention_span"])
+
+    @staticmethod
+    def params(row, base: GenerationParams = GenerationParams()
+               ) -> Optional[GenerationParams]:
+        """Request parameters from a row's stored plan, or None if unplanned."""
+        if not row["planned_size"] or not row["planned_duration"]:
+            return None
+        return replace(base, size=row["planned_size"],
+                       duration=row["planned_duration"])
+
+
+async def plan_queued(pool, planner: VideoPlanner,
+                      limit: int = 500) -> int:
+    """Plan up to ``limit`` queued rows that have no plan yet."""
+    async with pool.acquire() as conn:
+        rows = await db.unplanned_scripts(conn, limit)
+        if not rows:
+            return 0
+        plans = []
+        for row in rows:
+            plan = planner.plan_row(row)
+            plans.append((row["script_id"], plan.size, plan.duration))
+        return await db.save_plans(conn, plans)
+
+
+async def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tier", type=int, default=720,
+                        choices=sorted(PRICE_CENTS_PER_SECOND),
+                        help="resolution tier videos are generated at")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="stop after this many rows (default: all unplanned)")
+    parser.add_argument("--dsn", default=None,
+                        help="Postgres DSN (default: DATABASE_URL / DB_POSTGRESDB_*)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    planner = VideoPlanner(tier=args.tier)
+    pool = await db.create_pool(args.dsn, max_size=1)
+    try:
+        while args.limit is None or planner.planned < args.limit:
+            page = 500 if args.limit is None else min(
+                500, args.limit - planner.planned)
+            if not await plan_queued(pool, planner, page):
+                break
+    finally:
+        await pool.close()
+    logger.info("Planned: %s", planner.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
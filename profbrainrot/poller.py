@@ -0,0 +1,323 @@
+"""
+Adaptive status polling for in-flight Wan 2.5 tasks.
+
+A single :class:`TaskPoller` tracks every task id in one table and one
+timer heap, replacing the fixed 30s/60s waits in the n8n workflow. Each
+task is polled on a schedule derived from observed PENDING and RUNNING
+durations: one poll at the earliest plausible finish, dense polls through
+the likely completion window, then jittered exponential backoff for
+stragglers, capped at ``max_interval``.
+
+A task the provider reports as UNKNOWN (expired, or never created) for
+``max_unknown_polls`` checks in a row is finished with that status rather
+than polled forever; the caller decides what to do with it.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from . import metrics
+from .wan25 import Task, TaskStatus, Wan25Client, Wan25Error
+
+logger = logging.getLogger(__name__)
+
+# Seed distributions (seconds) until real observations arrive; the Wan docs
+# quote 30-120 seconds of processing per video.
+PENDING_PRIOR = (1.0, 3.0, 5.0, 10.0, 20.0, 40.0)
+RUNNING_PRIOR = (30.0, 45.0, 60.0, 75.0, 90.0, 120.0)
+
+
+class DurationModel:
+    """Rolling window of phase durations used to predict completion."""
+
+    def __init__(self, prior: Iterable[float], window: int = 500):
+        self._prior = sorted(prior)
+        self._samples = deque(maxlen=window)
+        self._sorted = None
+
+    def observe(self, seconds: float) -> None:
+        if seconds >= 0:
+            self._samples.append(seconds)
+            self._sorted = None
+
+    def seed(self, samples: Iterable[float]) -> None:
+        for seconds in samples:
+            self.observe(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> float:
+        if self._sorted is None:
+            self._sorted = sorted(self._samples) if self._samples else self._prior
+        values = self._sorted
+        index = min(len(values) - 1, max(0, int(q * len(values))))
+        return values[index]
+
+
+class _Entry:
+    __slots__ = ("task_id", "status", "phase_started", "last_poll",
+                 "next_poll", "overdue", "polls", "unknown_polls",
+                 "pending_seconds", "context", "future")
+
+    def __init__(self, task_id, status, phase_started, context, future):
+        self.task_id = task_id
+        self.status = status
+        self.phase_started = phase_started
+        self.last_poll = phase_started
+        self.next_poll = 0.0
+        self.overdue = 0
+        self.polls = 0
+        self.unknown_polls = 0
+        self.pending_seconds = None
+        self.context = context
+        self.future = future
+
+
+CompletionCallback = Callable[[Task, Any], Awaitable[None]]
+
+
+class TaskPoller:
+    """Polls many in-flight tasks from one event loop.
+
+    ``track`` registers a task id and returns a future that resolves with
+    the terminal :class:`Task` (or an UNKNOWN one, see the module
+    docstring). ``on_complete`` is awaited with the same task and the
+    caller-supplied context when a task finishes.
+    """
+
+    def __init__(self, client: Wan25Client,
+                 on_complete: Optional[CompletionCallback] = None,
+                 pending_model: Optional[DurationModel] = None,
+                 running_model: Optional[DurationModel] = None,
+                 min_interval: float = 2.0, max_interval: float = 60.0,
+                 dense_polls: int = 6, jitter: float = 0.2,
+                 max_concurrent_polls: int = 16, max_unknown_polls: int = 3,
+                 clock=time.monotonic):
+        self.client = client
+        self.on_complete = on_complete
+        if pending_model is None:
+            pending_model = DurationModel(PENDING_PRIOR)
+        if running_model is None:
+            running_model = DurationModel(RUNNING_PRIOR)
+        self.pending_model = pending_model
+        self.running_model = running_model
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.dense_polls = dense_polls
+        self.jitter = jitter
+        self.max_unknown_polls = max_unknown_polls
+        # Backoff doublings after which min_interval reaches max_interval.
+        self._max_doublings = max(0, math.ceil(math.log2(
+            max_interval / min_interval))) if min_interval > 0 else 0
+        self._clock = clock
+        self._entries: Dict[str, _Entry] = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._poll_slots = asyncio.Semaphore(max_concurrent_polls)
+        self._inflight_polls = set()
+        self._stopping = False
+        self.polls = 0
+        self.completed = 0
+        self.poll_errors = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self._entries
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "tracked": len(self._entries),
+            "polls": self.polls,
+            "completed": self.completed,
+            "poll_errors": self.poll_errors,
+            "polls_per_task": self.polls / self.completed if self.completed else 0.0,
+            "expected_pending_s": self.pending_model.quantile(0.5),
+            "expected_running_s": self.running_model.quantile(0.5),
+        }
+
+    # -- registration ----------------------------------------------------
+
+    def track(self, task_id: str, context: Any = None,
+              status: TaskStatus = TaskStatus.PENDING,
+              elapsed: float = 0.0) -> "asyncio.Future[Task]":
+        """Start polling ``task_id``.
+
+        ``elapsed`` is how long the task has already spent in ``status``,
+        for tasks resumed after a restart.
+        """
+        entry = self._entries.get(task_id)
+        if entry is not None:
+            return entry.future
+        now = self._clock()
+        future = asyncio.get_running_loop().create_future()
+        entry = _Entry(task_id, status, now - elapsed, context, future)
+        self._entries[task_id] = entry
+        self._schedule(entry, now)
+        return future
+
+    def untrack(self, task_id: str) -> None:
+        entry = self._entries.pop(task_id, None)
+        if entry is not None and not entry.future.done():
+            entry.future.cancel()
+
+    # -- scheduling ------------------------------------------------------
+
+    def completion_window(self, status: TaskStatus):
+        """(earliest, latest) plausible seconds from entering ``status`` to done.
+
+        A PENDING task still has its whole RUNNING phase ahead of it, so
+        its window spans both phases.
+        """
+        early = self.running_model.quantile(0.1)
+        late = self.running_model.quantile(0.9)
+        if status != TaskStatus.RUNNING:
+            early += self.pending_model.quantile(0.1)
+            late += self.pending_model.quantile(0.9)
+        return early, late
+
+    def next_delay(self, status: TaskStatus, elapsed: float,
+                   overdue: int = 0) -> float:
+        """Seconds until the next poll for a task ``elapsed`` into ``status``."""
+        early, late = self.completion_window(status)
+        if elapsed < early:
+            delay = early - elapsed
+        elif elapsed < late:
+            delay = (late - early) / self.dense_polls
+        else:
+            delay = self.min_interval * (2 ** min(overdue, self._max_doublings))
+        delay = min(self.max_interval, max(self.min_interval, delay))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _schedule(self, entry: _Entry, now: float) -> None:
+        elapsed = now - entry.phase_started
+        delay = self.next_delay(entry.status, elapsed, entry.overdue)
+        if elapsed >= self.completion_window(entry.status)[1]:
+            entry.overdue += 1
+        entry.next_poll = now + delay
+        earliest = not self._heap or entry.next_poll < self._heap[0][0]
+        heapq.heappush(self._heap, (entry.next_poll, next(self._seq),
+                                    entry.task_id))
+        if earliest:
+            self._wake.set()
+
+    # -- main loop -------------------------------------------------------
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._wake.set()
+
+    async def run(self) -> None:
+        """Poll until :meth:`stop` is called."""
+        self._stopping = False
+        try:
+            while not self._stopping:
+                now = self._clock()
+                while self._heap and self._heap[0][0] <= now:
+                    due, _, task_id = heapq.heappop(self._heap)
+                    entry = self._entries.get(task_id)
+                    if entry is None or entry.next_poll != due:
+                        continue  # untracked or rescheduled
+                    await self._poll_slots.acquire()
+                    poll = asyncio.create_task(self._poll(entry))
+                    self._inflight_polls.add(poll)
+                    poll.add_done_callback(self._inflight_polls.discard)
+                timeout = self._heap[0][0] - self._clock() if self._heap else None
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for poll in list(self._inflight_polls):
+                poll.cancel()
+
+    async def _poll(self, entry: _Entry) -> None:
+        try:
+            try:
+                task = await self.client.get_task(entry.task_id)
+            except (Wan25Error, OSError, asyncio.TimeoutError) as e:
+                self.poll_errors += 1
+                metrics.WAN_POLLS.inc(outcome="error")
+                logger.warning("Status check for %s failed: %s",
+                               entry.task_id, e)
+                self._schedule(entry, self._clock())
+                return
+            finally:
+                self.polls += 1
+                entry.polls += 1
+            metrics.WAN_POLLS.inc(outcome="ok")
+            if self._entries.get(entry.task_id) is not entry:
+                return
+            now = self._clock()
+            if task.status == TaskStatus.UNKNOWN:
+                entry.unknown_polls += 1
+                entry.last_poll = now
+                if entry.unknown_polls >= self.max_unknown_polls:
+                    logger.warning("Task %s is unknown to the provider; "
+                                   "giving up on it", entry.task_id)
+                    await self._finish(entry, task)
+                else:
+                    self._schedule(entry, now)
+                return
+            entry.unknown_polls = 0
+            if task.status != entry.status:
+                self._advance(entry, task.status, now)
+            entry.last_poll = now
+            if task.status.is_terminal:
+                await self._finish(entry, task)
+            else:
+                self._schedule(entry, now)
+        finally:
+            self._poll_slots.release()
+
+    def _advance(self, entry: _Entry, status: TaskStatus, now: float) -> None:
+        # The change happened somewhere since the previous poll; split the
+        # difference rather than charging the whole gap to the old phase.
+        changed_at = (entry.last_poll + now) / 2
+        if entry.status == TaskStatus.PENDING:
+            entry.pending_seconds = changed_at - entry.phase_started
+        entry.status = status
+        entry.phase_started = changed_at
+        entry.overdue = 0
+
+    async def _finish(self, entry: _Entry, task: Task) -> None:
+        del self._entries[entry.task_id]
+        self.completed += 1
+        metrics.WAN_TASKS.inc(status=task.status.value.lower())
+        if task.status == TaskStatus.SUCCEEDED:
+            self._learn(entry, task)
+        if not entry.future.done():
+            entry.future.set_result(task)
+        if self.on_complete is not None:
+            try:
+                await self.on_complete(task, entry.context)
+            except Exception:
+                logger.exception("Completion handler failed for %s",
+                                 task.task_id)
+
+    def _learn(self, entry: _Entry, task: Task) -> None:
+        # Provider timestamps are exact, so prefer them over our own
+        # detection times whenever the response carries them.
+        if task.submit_time and task.scheduled_time and task.end_time:
+            pending = (task.scheduled_time - task.submit_time).total_seconds()
+            running = (task.end_time - task.scheduled_time).total_seconds()
+        elif entry.pending_seconds is not None:
+            pending = entry.pending_seconds
+            running = entry.last_poll - entry.phase_started
+        else:
+            return
+        self.pending_model.observe(pending)
+        self.running_model.observe(running)
+        metrics.WAN_PHASE_SECONDS.observe(pending, phase="pending")
+        metrics.WAN_PHASE_SECONDS.observe(running, phase="running")
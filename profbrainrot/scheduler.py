@@ -0,0 +1,236 @@
+"""
+Submission scheduling for the Wan 2.5 API.
+
+The provider allows 5 submissions per second and 5 tasks in flight. The
+scheduler enforces both limits on the client side: a token bucket paces
+submits and a pool of concurrency slots is held from submit until the
+task reaches a terminal state, so we never spend a request on a 429.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from . import metrics
+from .wan25 import (
+    DEFAULT_MODEL,
+    DEFAULT_NEGATIVE_PROMPT,
+    GenerationParams,
+    RateLimitError,
+    Task,
+    Wan25Client,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at ``rate`` tokens/second."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until ``tokens`` are available and take them.
+
+        Waiters are served in FIFO order so a large request cannot be
+        starved by a stream of small ones.
+        """
+        if tokens > self.capacity:
+            raise ValueError("cannot acquire more tokens than the capacity")
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def adjust(self, tokens: float) -> None:
+        """Charge (or, if negative, refund) ``tokens`` without waiting.
+
+        Lets a caller that acquired an estimate settle up once the real
+        cost is known; the balance may go negative, which delays later
+        acquires accordingly.
+        """
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - tokens)
+
+    def drain(self, seconds: float) -> None:
+        """Empty the bucket and push the next refill ``seconds`` ahead.
+
+        Used to back off when the provider tells us we are over the limit.
+        """
+        self._tokens = 0.0
+        self._updated = max(self._updated, self._clock() + seconds)
+
+
+class SubmissionScheduler:
+    """Paces Wan 2.5 submits and tracks concurrent-task slots.
+
+    ``submit`` blocks until both a slot and a rate token are available.
+    The slot stays taken until :meth:`release` (or :meth:`observe` with a
+    terminal task) is called for the returned task id.
+    """
+
+    def __init__(self, client: Wan25Client, rate: float = 5.0,
+                 max_concurrent: int = 5, burst: Optional[float] = None,
+                 max_retries: int = 3, clock=time.monotonic):
+        self.client = client
+        self.bucket = TokenBucket(rate, burst if burst is not None else 1.0,
+                                  clock=clock)
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self._clock = clock
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._slot_freed = asyncio.Event()
+        self._in_flight: Dict[str, float] = {}
+        self._started = clock()
+        self._last_change = self._started
+        self._busy_slot_seconds = 0.0
+        self.submitted = 0
+        self.throttled = 0
+        self.failed_submits = 0
+        metrics.WAN_SLOTS.set(max_concurrent)
+
+    # -- slot accounting -------------------------------------------------
+
+    def _account(self) -> None:
+        now = self._clock()
+        self._busy_slot_seconds += len(self._in_flight) * (now - self._last_change)
+        self._last_change = now
+
+    def _occupied(self) -> None:
+        metrics.WAN_SLOTS_IN_USE.set(len(self._in_flight))
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    @property
+    def available(self) -> int:
+        return self.max_concurrent - len(self._in_flight)
+
+    def utilization(self) -> float:
+        """Fraction of slots currently occupied."""
+        return len(self._in_flight) / self.max_concurrent
+
+    def mean_utilization(self) -> float:
+        """Time-weighted slot occupancy since the scheduler was created."""
+        self._account()
+        elapsed = self._last_change - self._started
+        if elapsed <= 0:
+            return self.utilization()
+        return self._busy_slot_seconds / (elapsed * self.max_concurrent)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "slots_in_use": self.in_flight,
+            "slots_total": self.max_concurrent,
+            "utilization": self.utilization(),
+            "mean_utilization": self.mean_utilization(),
+            "submitted": self.submitted,
+            "throttled": self.throttled,
+            "failed_submits": self.failed_submits,
+        }
+
+    async def wait_for_slot(self) -> None:
+        """Return once at least one slot is free (without taking it)."""
+        while self.available <= 0:
+            self._slot_freed.clear()
+            await self._slot_freed.wait()
+
+    async def adopt(self, task_id: str) -> None:
+        """Take a slot for a task submitted elsewhere, e.g. before a restart."""
+        if task_id in self._in_flight:
+            return
+        await self._slots.acquire()
+        self._account()
+        self._in_flight[task_id] = self._clock()
+        self._occupied()
+
+    def release(self, task_id: str) -> bool:
+        """Free the slot held by ``task_id``; returns False if none was held."""
+        if self._in_flight.get(task_id) is None:
+            return False
+        self._account()
+        del self._in_flight[task_id]
+        self._occupied()
+        self._slots.release()
+        self._slot_freed.set()
+        return True
+
+    def observe(self, task: Task) -> None:
+        """Release the task's slot once it reaches SUCCEEDED/FAILED/CANCELED."""
+        if task.status.is_terminal:
+            self.release(task.task_id)
+
+    # -- submission ------------------------------------------------------
+
+    async def submit(self, prompt: str,
+                     params: GenerationParams = GenerationParams(),
+                     negative_prompt: Optional[str] = DEFAULT_NEGATIVE_PROMPT,
+                     model: str = DEFAULT_MODEL) -> Task:
+        """Submit a task once a slot and a rate token are both available."""
+        await self._slots.acquire()
+        try:
+            task = await self._submit_paced(prompt, params, negative_prompt,
+                                            model)
+        except BaseException:
+            self._slots.release()
+            self._slot_freed.set()
+            raise
+        self._account()
+        self._in_flight[task.task_id] = self._clock()
+        self._occupied()
+        if task.status.is_terminal:
+            self.release(task.task_id)
+        return task
+
+    async def _submit_paced(self, prompt, params, negative_prompt, model):
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                task = await self.client.submit(prompt, params,
+                                                negative_prompt, model)
+            except RateLimitError as e:
+                # Shouldn't happen while we are the only submitter, but
+                # another process sharing the key can still push us over.
+                self.throttled += 1
+                metrics.WAN_SUBMITS.inc(outcome="rate_limited")
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.failed_submits += 1
+                    raise
+                delay = e.retry_after or 2.0 ** attempt / self.bucket.rate
+                logger.warning("Wan 2.5 rate limited, backing off %.1fs", delay)
+                self.bucket.drain(delay)
+                continue
+            except Exception:
+                self.failed_submits += 1
+                metrics.WAN_SUBMITS.inc(outcome="error")
+                raise
+            self.submitted += 1
+            metrics.WAN_SUBMITS.inc(outcome="accepted")
+            return task
@@ -0,0 +1,265 @@
+"""
+Lesson-to-script generation with the OpenAI chat completions API.
+
+Uses the same prompt as the "OpenAI - Generate Scripts" node in
+``n8n/workflows/lesson_processor.json``. Results are cached in Postgres
+(``script_cache``) under a hash of the normalized lesson, the model and
+:data:`PROMPT_VERSION`, so re-uploading a lesson returns the stored
+scripts without another completion. Bump :data:`PROMPT_VERSION` (here and
+in the workflow) whenever the prompt changes.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from string import Template
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from . import db, metrics
+
+logger = logging.getLogger(__name__)
+
+OPENAI_URL = "https://api.openai.com/v1"
+DEFAULT_MODEL = "gpt-4"
+PROMPT_VERSION = "v1"
+DEFAULT_CACHE_TTL = timedelta(days=30)
+DEFAULT_CACHE_MAX_BYTES = 256 << 20
+
+SYSTEM_PROMPT = (
+    "You are an expert educational content creator specializing in "
+    "ADHD-friendly short-form videos. Convert lesson plans into engaging "
+    "scripts following the 30/60/10 rule: 30% hook, 60% educational "
+    "content, 10% call-to-action. Each script should be 30-60 seconds when "
+    "spoken."
+)
+
+USER_PROMPT = Template(
+    "Convert this lesson into 3 short-form video scripts (30-60 seconds "
+    "each) for different platforms (TikTok, YouTube Shorts, Instagram "
+    "Reels). Also create 1 longer script (8-10 minutes) for YouTube.\n\n"
+    "Lesson Title: $title\nSubject: $subject\nGrade Level: $grade_level\n"
+    "Content: $content\n\n"
+    "Requirements:\n- ADHD-optimized with natural pause points\n"
+    "- Platform-specific hooks\n- Clear learning objectives\n"
+    "- Engaging but educational tone\n"
+    "- Include estimated attention span (seconds)\n\n"
+    "Return JSON format:\n{\n  \"shorts\": [\n    {\n"
+    "      \"platform\": \"tiktok\",\n      \"hook\": \"hook text\",\n"
+    "      \"content\": \"full script\",\n      \"duration\": 30,\n"
+    "      \"pause_points\": [10, 20]\n    }\n  ],\n  \"long_form\": {\n"
+    "    \"content\": \"full script\",\n    \"duration\": 540,\n"
+    "    \"chapter_markers\": [60, 180, 300, 420]\n  }\n}"
+)
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class ScriptGenerationError(Exception):
+    """Raised when scripts cannot be produced for a lesson."""
+
+
+class OpenAIError(ScriptGenerationError):
+    """Raised when the API answers with a non-success status.
+
+    ``retry_after`` is in seconds when the API sent one (HTTP 429).
+    """
+
+    def __init__(self, status: int, message: Optional[str] = None,
+                 code: Optional[str] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}: {code or 'error'} - {message or ''}")
+        self.status = status
+        self.code = code
+        self.message = message
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class Lesson:
+    lesson_id: str
+    title: str
+    subject: str
+    grade_level: str
+    content: str
+
+
+@dataclass(frozen=True)
+class ScriptSet:
+    """Parsed model output: short scripts plus the long-form script."""
+
+    shorts: List[Dict[str, Any]]
+    long_form: Optional[Dict[str, Any]] = None
+    cache_key: Optional[str] = None
+    cached: bool = False
+    usage: Dict[str, int] = field(default_factory=dict, compare=False)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"shorts": self.shorts, "long_form": self.long_form}
+
+    @classmethod
+    def parse(cls, text: str, **kwargs) -> "ScriptSet":
+        """Parse the model's JSON reply (optionally wrapped in a code fence)."""
+        try:
+            body = json.loads(_FENCE.sub("", text.strip()))
+        except ValueError as e:
+            raise ScriptGenerationError(f"model returned invalid JSON: {e}") from e
+        if not isinstance(body, dict) or not isinstance(body.get("shorts"), list):
+            raise ScriptGenerationError("model reply has no 'shorts' list")
+        return cls(body["shorts"], body.get("long_form"), **kwargs)
+
+
+class ScriptGenerator:
+    """Generates scripts for lessons, through the cache when a pool is given.
+
+    Use as an async context manager, or call :meth:`close` when done.
+    """
+
+    def __init__(self, api_key: str, pool=None, model: str = DEFAULT_MODEL,
+                 temperature: float = 0.7, base_url: str = OPENAI_URL,
+                 cache_ttl: timedelta = DEFAULT_CACHE_TTL,
+                 cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+                 pool_size: int = 16, request_timeout: float = 180.0):
+        if not api_key:
+            raise ValueError("an OpenAI API key is required")
+        self.pool = pool
+        self.model = model
+        self.temperature = temperature
+        self.base_url = base_url.rstrip("/")
+        self.cache_ttl = cache_ttl
+        self.cache_max_bytes = cache_max_bytes
+        self._auth = {"Authorization": f"Bearer {api_key}"}
+        self._pool_size = pool_size
+        self._timeout = aiohttp.ClientTimeout(total=request_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, pool=None, **kwargs) -> "ScriptGenerator":
+        """Build a generator from ``OPENAI_API_KEY`` (and ``OPENAI_MODEL``)."""
+        kwargs.setdefault("model", os.environ.get("OPENAI_MODEL", DEFAULT_MODEL))
+        return cls(os.environ.get("OPENAI_API_KEY", ""), pool, **kwargs)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_size),
+                timeout=self._timeout,
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> "ScriptGenerator":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    # -- generation ------------------------------------------------------
+
+    async def generate(self, lesson: Lesson) -> ScriptSet:
+        """Scripts for ``lesson``, from the cache when it has them."""
+        key, cached = await self.lookup(lesson)
+        if cached is not None:
+            return cached
+        scripts = await self.complete(lesson)
+        await self.store(key, scripts)
+        return ScriptSet(scripts.shorts, scripts.long_form, cache_key=key,
+                         usage=scripts.usage)
+
+    async def lookup(self, lesson: Lesson):
+        """(cache_key, cached ScriptSet or None); no lookup without a pool."""
+        if self.pool is None:
+            return None, None
+        async with self.pool.acquire() as conn:
+            row = await db.script_cache_lookup(
+                conn, lesson.title, lesson.subject, lesson.grade_level,
+                lesson.content, self.model, PROMPT_VERSION)
+        key = row["cache_key"].strip()
+        if not row["hit"]:
+            self.misses += 1
+            return key, None
+        self.hits += 1
+        logger.debug("Script cache hit for %s", lesson.lesson_id)
+        scripts = json.loads(row["scripts"])
+        return key, ScriptSet(scripts["shorts"], scripts.get("long_form"),
+                              cache_key=key, cached=True)
+
+    async def store(self, key: Optional[str], scripts: ScriptSet) -> None:
+        if self.pool is None or key is None:
+            return
+        async with self.pool.acquire() as conn:
+            await db.script_cache_store(
+                conn, key, self.model, PROMPT_VERSION,
+                json.dumps(scripts.to_json()), self.cache_ttl,
+                self.cache_max_bytes)
+
+    def messages(self, lesson: Lesson) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": USER_PROMPT.substitute(
+                title=lesson.title, subject=lesson.subject,
+                grade_level=lesson.grade_level, content=lesson.content)},
+        ]
+
+    async def complete(self, lesson: Lesson) -> ScriptSet:
+        """Call the model for ``lesson``, bypassing the cache."""
+        body = {"model": self.model, "messages": self.messages(lesson),
+                "temperature": self.temperature}
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            async with self.session.post(self.base_url + "/chat/completions",
+                                         json=body,
+                                         headers=self._auth) as response:
+                reply = await self._read_json(response)
+            outcome = "ok"
+        except OpenAIError as e:
+            outcome = "rate_limited" if e.status == 429 else "error"
+            raise
+        finally:
+            metrics.LLM_SECONDS.observe(time.monotonic() - started,
+                                        model=self.model, outcome=outcome)
+        usage = reply.get("usage") or {}
+        for kind in ("prompt", "completion"):
+            metrics.LLM_TOKENS.inc(usage.get(f"{kind}_tokens") or 0,
+                                   model=self.model, kind=kind)
+        try:
+            text = reply["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            raise ScriptGenerationError("completion has no message content")
+        return ScriptSet.parse(text, usage=usage)
+
+    @staticmethod
+    async def _read_json(response: aiohttp.ClientResponse) -> Dict[str, Any]:
+        try:
+            body = await response.json(content_type=None)
+        except ValueError:
+            body = {"error": {"message": (await response.text())[:500]}}
+        if response.status == 200:
+            return body
+        error = body.get("error") or {}
+        retry_after = None
+        if response.status == 429:
+            try:
+                retry_after = float(response.headers["Retry-After"])
+            except (KeyError, ValueError):
+                pass
+        raise OpenAIError(response.status, error.get("message"),
+                          error.get("code") or error.get("type"), retry_after)
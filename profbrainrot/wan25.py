@@ -0,0 +1,273 @@
+"""
+Async client for the Wan 2.5 (DashScope) video generation API.
+
+One client owns one pooled aiohttp session, so submits, status polls and
+downloads reuse keep-alive connections instead of paying a TCP+TLS
+handshake per call the way the scripts in ``tests/`` do.
+"""
+
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+
+ENDPOINTS = {
+    "intl": "https://dashscope-intl.aliyuncs.com",
+    "cn": "https://dashscope.aliyuncs.com",
+}
+SYNTHESIS_PATH = "/api/v1/services/aigc/video-generation/video-synthesis"
+TASK_PATH = "/api/v1/tasks/{task_id}"
+
+DEFAULT_MODEL = "wan2.5-t2v-preview"
+DEFAULT_NEGATIVE_PROMPT = (
+    "blurry, low quality, distracting elements, watermark, logo, "
+    "text overlay, shaky camera, poor lighting, inappropriate content"
+)
+
+
+class TaskStatus(str, Enum):
+    """Task states reported in ``output.task_status``."""
+
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+    CANCELED = "CANCELED"
+    UNKNOWN = "UNKNOWN"
+
+    @classmethod
+    def parse(cls, value: Optional[str]) -> "TaskStatus":
+        try:
+            return cls(value)
+        except ValueError:
+            return cls.UNKNOWN
+
+    @property
+    def is_terminal(self) -> bool:
+        return self in (TaskStatus.SUCCEEDED, TaskStatus.FAILED,
+                        TaskStatus.CANCELED)
+
+
+class Wan25Error(Exception):
+    """Raised when the API answers with a non-success status."""
+
+    def __init__(self, status: int, code: Optional[str] = None,
+                 message: Optional[str] = None,
+                 request_id: Optional[str] = None):
+        super().__init__(f"HTTP {status}: {code or 'error'} - {message or ''}")
+        self.status = status
+        self.code = code
+        self.message = message
+        self.request_id = request_id
+
+
+class RateLimitError(Wan25Error):
+    """HTTP 429 from the API; ``retry_after`` is in seconds when given."""
+
+    def __init__(self, *args, retry_after: Optional[float] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class GenerationParams:
+    """The ``parameters`` block of a video-synthesis request."""
+
+    size: str = "1280*720"
+    duration: int = 10
+    audio: bool = True
+    prompt_extend: bool = True
+    watermark: bool = False
+    seed: Optional[int] = None
+
+    def to_payload(self) -> Dict[str, Any]:
+        payload = {
+            "size": self.size,
+            "duration": self.duration,
+            "audio": self.audio,
+            "prompt_extend": self.prompt_extend,
+            "watermark": self.watermark,
+        }
+        if self.seed is not None:
+            payload["seed"] = self.seed
+        return payload
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    # DashScope reports times as "2025-11-02 17:36:52.345" (Asia/Shanghai)
+    if not value:
+        return None
+    for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+@dataclass(frozen=True)
+class Task:
+    """A video-synthesis task as returned by submit or status calls."""
+
+    task_id: str
+    status: TaskStatus
+    video_url: Optional[str] = None
+    code: Optional[str] = None
+    message: Optional[str] = None
+    request_id: Optional[str] = None
+    submit_time: Optional[datetime] = None
+    scheduled_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    video_duration: Optional[int] = None
+    video_ratio: Optional[str] = None
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False,
+                                compare=False)
+
+    @classmethod
+    def from_response(cls, body: Dict[str, Any]) -> "Task":
+        output = body.get("output") or {}
+        usage = body.get("usage") or {}
+        return cls(
+            task_id=output.get("task_id", ""),
+            status=TaskStatus.parse(output.get("task_status")),
+            video_url=output.get("video_url"),
+            code=output.get("code"),
+            message=output.get("message"),
+            request_id=body.get("request_id"),
+            submit_time=_parse_time(output.get("submit_time")),
+            scheduled_time=_parse_time(output.get("scheduled_time")),
+            end_time=_parse_time(output.get("end_time")),
+            video_duration=usage.get("video_duration"),
+            video_ratio=usage.get("video_ratio"),
+            raw=body,
+        )
+
+
+class Wan25Client:
+    """Pooled async client for submit, status and result download calls.
+
+    Use as an async context manager, or call :meth:`close` when done.
+    """
+
+    def __init__(self, api_key: str, region: str = "intl",
+                 base_url: Optional[str] = None, pool_size: int = 32,
+                 connect_timeout: float = 10.0, request_timeout: float = 30.0,
+                 download_timeout: float = 600.0,
+                 keepalive_timeout: float = 60.0):
+        if not api_key:
+            raise ValueError("a DashScope API key is required")
+        if base_url is None:
+            try:
+                base_url = ENDPOINTS[region]
+            except KeyError:
+                raise ValueError(f"unknown Wan 2.5 region: {region!r}") from None
+        self.base_url = base_url.rstrip("/")
+        self._auth = {"Authorization": f"Bearer {api_key}"}
+        self._pool_size = pool_size
+        self._keepalive_timeout = keepalive_timeout
+        self._timeout = aiohttp.ClientTimeout(total=request_timeout,
+                                              sock_connect=connect_timeout)
+        self._download_timeout = aiohttp.ClientTimeout(
+            total=download_timeout, sock_connect=connect_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "Wan25Client":
+        """Build a client from ``WAN25_API_KEY`` and ``WAN25_REGION``."""
+        return cls(os.environ.get("WAN25_API_KEY", ""),
+                   region=os.environ.get("WAN25_REGION", "intl"), **kwargs)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._pool_size,
+                limit_per_host=self._pool_size,
+                keepalive_timeout=self._keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self._timeout,
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> "Wan25Client":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def submit(self, prompt: str,
+                     params: GenerationParams = GenerationParams(),
+                     negative_prompt: Optional[str] = DEFAULT_NEGATIVE_PROMPT,
+                     model: str = DEFAULT_MODEL) -> Task:
+        """Create a video-synthesis task and return it (usually PENDING)."""
+        body = {
+            "model": model,
+            "input": {"prompt": prompt},
+            "parameters": params.to_payload(),
+        }
+        if negative_prompt:
+            body["input"]["negative_prompt"] = negative_prompt
+        async with self.session.post(
+                self.base_url + SYNTHESIS_PATH, json=body,
+                headers={**self._auth, "X-DashScope-Async": "enable"}
+        ) as response:
+            return Task.from_response(await self._read_json(response))
+
+    async def get_task(self, task_id: str) -> Task:
+        """Fetch the current state of a task."""
+        url = self.base_url + TASK_PATH.format(task_id=task_id)
+        async with self.session.get(url, headers=self._auth) as response:
+            return Task.from_response(await self._read_json(response))
+
+    async def download(self, video_url: str, output_path: str,
+                       chunk_size: int = 1 << 16) -> int:
+        """Stream a finished video to ``output_path``; returns bytes written.
+
+        Result URLs are pre-signed OSS links, so no Authorization header
+        is sent with them.
+        """
+        async with self.session.get(
+                video_url, timeout=self._download_timeout) as response:
+            if response.status != 200:
+                raise Wan25Error(response.status,
+                                 message=(await response.text())[:500])
+            written = 0
+            with open(output_path, "wb") as f:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+        return written
+
+    @staticmethod
+    async def _read_json(response: aiohttp.ClientResponse) -> Dict[str, Any]:
+        try:
+            body = await response.json(content_type=None)
+        except ValueError:
+            body = {"message": (await response.text())[:500]}
+        if not isinstance(body, dict):
+            # Valid JSON but not an object (say ``null`` from a proxy).
+            body = {"message": str(body)[:500]}
+        if response.status in (200, 201):
+            return body
+        error = dict(status=response.status, code=body.get("code"),
+                     message=body.get("message"),
+                     request_id=body.get("request_id"))
+        if response.status == 429:
+            try:
+                retry_after = float(response.headers["Retry-After"])
+            except (KeyError, ValueError):
+                retry_after = None
+            raise RateLimitError(**error, retry_after=retry_after)
+        raise Wan25Error(**error)
@@ -0,0 +1,659 @@
+"""
+Long-running video queue worker.
+
+Runs the queue processor lifecycle natively (claim a batch, submit to
+Wan 2.5, poll, mark completed/failed) instead of the n8n cron. The worker
+sleeps on a Postgres LISTEN for new ``video_queue`` rows and falls back
+to a slow periodic sweep in case a notification is missed.
+
+Claimed rows carry a lease that the worker renews while their tasks are
+in flight. Rows whose owner died are reclaimed once the lease expires:
+the stored task id is checked with the provider first, so a task that is
+still running (or already finished) is adopted rather than resubmitted.
+Every submit is recorded in ``generation_tasks`` before the API call, and a
+worker restarted under the same ``--worker-id`` resumes its own rows
+immediately.
+
+Finished videos are downloaded to ``VIDEO_DIR`` as soon as their task
+succeeds, earliest-expiring signed link first; the local path and sha256
+are stored on the row. Saved videos also go into a content-addressed
+generation cache, so a script whose exact request was generated before is
+completed from disk without calling the API. New scripts are also checked
+against a MinHash index of every earlier script; near-duplicates are
+flagged and, with ``--link-duplicates``, completed with the original's
+video instead of being generated again.
+
+Every submit first reserves its exact cost against the daily and monthly
+budget caps (see :mod:`profbrainrot.costs`). Near a cap the request drops to
+a cheaper resolution; at the cap the worker stops claiming until the period
+rolls over. Each script is generated at the shortest duration that covers
+its narration and in its platform's aspect ratio (see
+:mod:`profbrainrot.planner`).
+
+API calls and errors are logged through a :class:`~profbrainrot.logsink.LogSink`,
+which writes them in batches off the submit path and spills them to
+``--log-spill`` while Postgres is unreachable. With ``--metrics-port`` the
+worker serves Prometheus metrics (see :mod:`profbrainrot.metrics`).
+
+Run with ``python -m profbrainrot.worker``.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from typing import Optional
+
+from . import db, metrics
+from .cache import DEFAULT_MAX_BYTES, CacheEntry, GenerationCache, cache_key
+from .costs import BudgetGate
+from .downloader import DownloadResult, RangeDownloader
+from .dedup import DuplicateIndex
+from .downloads import DownloadJob, DownloadQueue, parse_expiry
+from .logsink import LogSink
+from .planner import VideoPlanner, plan_queued
+from .poller import TaskPoller
+from .scheduler import SubmissionScheduler
+from .wan25 import (
+    DEFAULT_MODEL,
+    SYNTHESIS_PATH,
+    TASK_PATH,
+    GenerationParams,
+    Task,
+    TaskStatus,
+    Wan25Client,
+    Wan25Error,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class QueueWorker:
+    """Drains ``video_queue`` through the scheduler and poller.
+
+    Rows are taken with ``claim_batch`` so several workers (and the n8n
+    workflow) can share the queue. The worker only claims as many rows as
+    it has free concurrency slots, so queued rows stay available to other
+    consumers until they can actually be submitted.
+    """
+
+    def __init__(self, pool, client: Wan25Client,
+                 scheduler: Optional[SubmissionScheduler] = None,
+                 poller: Optional[TaskPoller] = None, batch_size: int = 3,
+                 sweep_interval: float = 300.0,
+                 worker_id: Optional[str] = None, lease_seconds: int = 120,
+                 downloads: Optional[DownloadQueue] = None,
+                 video_dir: str = "videos",
+                 cache: Optional[GenerationCache] = None,
+                 dedup: Optional[DuplicateIndex] = None,
+                 link_duplicates: bool = False,
+                 maintenance_interval: float = 3600.0,
+                 log_retention_months: int = 6,
+                 budget: Optional[BudgetGate] = None,
+                 planner: Optional[VideoPlanner] = None,
+                 logs: Optional[LogSink] = None,
+                 metrics_interval: Optional[float] = None):
+        self.pool = pool
+        self.worker_id = worker_id or db.default_worker_id()
+        self.client = client
+        if scheduler is None:
+            scheduler = SubmissionScheduler(client)
+        if poller is None:
+            poller = TaskPoller(client)
+        self.scheduler = scheduler
+        self.poller = poller
+        self.poller.on_complete = self._on_complete
+        self.batch_size = batch_size
+        self.sweep_interval = sweep_interval
+        self.lease_seconds = lease_seconds
+        self.maintenance_interval = maintenance_interval
+        self.log_retention_months = log_retention_months
+        self.downloads = downloads
+        self.video_dir = video_dir
+        self.cache = cache
+        self.dedup = dedup
+        self.link_duplicates = link_duplicates
+        self.budget = budget
+        self.planner = planner if planner is not None else VideoPlanner()
+        self.logs = logs if logs is not None else LogSink(pool)
+        self.metrics_interval = metrics_interval
+        self._indexing = asyncio.Lock()
+        if downloads is not None:
+            downloads.on_downloaded = self._on_downloaded
+            downloads.on_alert = self._on_download_alert
+        self._held = set()
+        self._adoptions = set()
+        self._wake = asyncio.Event()
+        self._stopped = asyncio.Event()
+
+    def wake(self, *args) -> None:
+        """Request a drain pass; also the LISTEN callback."""
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+
+    async def run(self) -> None:
+        async with self.pool.acquire() as conn:
+            durations = await db.recent_durations(conn)
+            resumable = await db.own_processing_rows(conn, self.worker_id)
+        self.poller.running_model.seed(durations)
+        if self.dedup is not None:
+            await self._load_signatures()
+        for row in resumable:
+            await self._recover(row["script_id"], row["task_id"])
+
+        log_writer = asyncio.create_task(self.logs.run())
+        listener = await self.pool.acquire()
+        await listener.add_listener(db.QUEUE_CHANNEL, self.wake)
+        background = [
+            asyncio.create_task(self.poller.run()),
+            asyncio.create_task(self._every(self.lease_seconds / 3,
+                                            self._heartbeat)),
+            asyncio.create_task(self._every(self.lease_seconds / 2,
+                                            self._reap)),
+            asyncio.create_task(self._every(self.maintenance_interval,
+                                            self._maintenance)),
+            asyncio.create_task(self._every(self.sweep_interval,
+                                            self._plan_queued)),
+        ]
+        if self.dedup is not None:
+            background.append(asyncio.create_task(
+                self._every(self.sweep_interval, self._backfill_signatures)))
+        if self.metrics_interval:
+            background.append(asyncio.create_task(
+                self._every(self.metrics_interval, self._refresh_metrics)))
+        if self.downloads is not None:
+            background += [
+                asyncio.create_task(self.downloads.run()),
+                asyncio.create_task(self._every(self.sweep_interval,
+                                                self._queue_downloads)),
+            ]
+        logger.info("Worker %s listening on %s (sweep every %.0fs)",
+                    self.worker_id, db.QUEUE_CHANNEL, self.sweep_interval)
+        try:
+            while not self._stopped.is_set():
+                self._wake.clear()
+                await self._drain()
+                try:
+                    await asyncio.wait_for(self._wake.wait(),
+                                           self.sweep_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._stopped.set()
+            await listener.remove_listener(db.QUEUE_CHANNEL, self.wake)
+            await self.pool.release(listener)
+            self.poller.stop()
+            if self.downloads is not None:
+                self.downloads.stop()
+            await asyncio.gather(*background, return_exceptions=True)
+            # Last, so whatever the tasks above logged on the way out is kept.
+            await self.logs.close()
+            await log_writer
+
+    async def _every(self, interval: float, job) -> None:
+        while not self._stopped.is_set():
+            try:
+                await job()
+            except Exception:
+                logger.exception("%s failed", job.__name__)
+            try:
+                await asyncio.wait_for(self._stopped.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self) -> None:
+        if self._held:
+            await db.renew_leases(self.pool, self.worker_id, self._held,
+                                  self.lease_seconds)
+
+    async def _reap(self) -> None:
+        rows = await db.claim_expired_leases(self.pool, self.worker_id,
+                                             lease_seconds=self.lease_seconds)
+        for row in rows:
+            logger.warning("Reclaimed %s from %s (lease expired)",
+                           row["script_id"], row["previous_owner"])
+            await self._recover(row["script_id"], row["task_id"])
+
+    async def _maintenance(self) -> None:
+        async with self.pool.acquire() as conn:
+            drifted = await db.repair_queue_status_counts(conn)
+            stale = await db.refresh_lesson_progress(conn)
+            created = await db.ensure_log_partitions(conn)
+            dropped = await db.drop_expired_log_partitions(
+                conn, self.log_retention_months)
+        if drifted:
+            logger.warning("Repaired %d drifted queue_status_counts group(s)",
+                           drifted)
+        if stale:
+            logger.warning("Refreshed %d drifted lesson_progress row(s)", stale)
+        if created or dropped:
+            logger.info("Log partitions: %d created, %d expired dropped",
+                        created, dropped)
+
+    async def _plan_queued(self) -> None:
+        # Plans rows ahead of claiming, including those n8n will submit.
+        while not self._stopped.is_set():
+            if not await plan_queued(self.pool, self.planner):
+                return
+
+    async def _recover(self, script_id: str, task_id: Optional[str]) -> None:
+        # Only rows whose task is adopted or completed stay held; anything
+        # else stops heartbeating so the lease can lapse.
+        task = None
+        if task_id:
+            try:
+                task = await self.client.get_task(task_id)
+            except Wan25Error as e:
+                if e.status != 404:
+                    # The reaper tries again once the lease runs out.
+                    self._held.discard(script_id)
+                    return
+            except (OSError, asyncio.TimeoutError):
+                self._held.discard(script_id)
+                return
+        if task is None or task.status == TaskStatus.UNKNOWN:
+            self._held.discard(script_id)
+        if not task_id:
+            # Never submitted (or the submit never returned): try again.
+            async with self.pool.acquire() as conn:
+                await db.requeue(conn, script_id)
+            self.wake()
+        elif task is None or task.status == TaskStatus.UNKNOWN:
+            # The provider lost the task. Close this attempt so the next
+            # claim submits afresh rather than finding the same task id.
+            message = (f"Task {task_id} not found" if task is None else
+                       "Task unknown to the provider (expired or lost)")
+            async with self.pool.acquire() as conn:
+                status = await db.requeue_lost_task(conn, script_id, message)
+            logger.warning("%s -> %s: %s", script_id, status, message)
+            self.wake()
+        elif task.status.is_terminal:
+            self._held.add(script_id)
+            await self._on_complete(task, script_id)
+        else:
+            self._held.add(script_id)
+            adoption = asyncio.create_task(self._adopt(task, script_id))
+            self._adoptions.add(adoption)
+            adoption.add_done_callback(self._adoptions.discard)
+
+    async def _adopt(self, task: Task, script_id: str) -> None:
+        # The orphaned task still counts against the provider's limit.
+        await self.scheduler.adopt(task.task_id)
+        self.poller.track(task.task_id, context=script_id, status=task.status)
+
+    # -- near-duplicates -------------------------------------------------
+
+    async def _load_signatures(self) -> None:
+        async with self.pool.acquire() as conn:
+            rows = await db.load_signatures(conn, self.dedup.num_perm)
+        for row in rows:
+            self.dedup.add(row["script_id"],
+                           self.dedup.from_bytes(row["signature"]))
+        logger.info("Loaded %d script signatures", len(rows))
+
+    async def _backfill_signatures(self) -> None:
+        while not self._stopped.is_set():
+            if not await self._index_scripts(limit=100):
+                return
+
+    async def _index_scripts(self, limit: int = 500,
+                             queued_only: bool = False) -> int:
+        """Sign, index and check scripts that have no signature yet."""
+        async with self._indexing:
+            async with self.pool.acquire() as conn:
+                rows = await db.unindexed_scripts(conn, limit, queued_only)
+            if not rows:
+                return 0
+            signatures = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: [self.dedup.signature(row["content"])
+                               for row in rows])
+            async with self.pool.acquire() as conn:
+                for row, signature in zip(rows, signatures):
+                    matches = [match for match in self.dedup.query(signature)
+                               if match[0] != row["script_id"]]
+                    self.dedup.add(row["script_id"], signature)
+                    if matches:
+                        await self._flag_duplicate(conn, row["script_id"],
+                                                   matches)
+                await db.save_signatures(
+                    conn, [(row["script_id"], signature.tobytes())
+                           for row, signature in zip(rows, signatures)],
+                    self.dedup.num_perm)
+            return len(rows)
+
+    async def _flag_duplicate(self, conn, script_id: str, matches) -> None:
+        original, similarity = matches[0]
+        linked = False
+        if self.link_duplicates:
+            for candidate, score in matches:
+                if await db.link_duplicate(conn, script_id, candidate):
+                    original, similarity, linked = candidate, score, True
+                    break
+        await db.flag_duplicate(conn, script_id, original, similarity)
+        logger.info("%s is a near-duplicate of %s (%.2f similar)%s",
+                    script_id, original, similarity,
+                    "; reusing its video" if linked else "")
+
+    async def _drain(self) -> None:
+        if self.dedup is not None:
+            while await self._index_scripts(queued_only=True):
+                pass
+        while await self._wait_for_slot():
+            if self.budget is not None and self.budget.paused:
+                return
+            limit = min(self.batch_size, self.scheduler.available)
+            rows = await db.claim_batch(self.pool, self.worker_id, limit,
+                                        self.lease_seconds)
+            if not rows:
+                return
+            self._held.update(row["script_id"] for row in rows)
+            logger.info("Claimed %d queued script(s) as %s",
+                        len(rows), rows[0]["batch_id"])
+            results = await asyncio.gather(
+                *(self._submit(row) for row in rows), return_exceptions=True)
+            for row, result in zip(rows, results):
+                if isinstance(result, Exception):
+                    # Stop heartbeating so the lease lapses and the reaper
+                    # sorts the row out against the ledger.
+                    self._held.discard(row["script_id"])
+                    logger.error("Submitting %s failed", row["script_id"],
+                                 exc_info=result)
+
+    async def _wait_for_slot(self) -> bool:
+        """Wait for a free slot; False if the worker is stopped first."""
+        slot = asyncio.ensure_future(self.scheduler.wait_for_slot())
+        stopped = asyncio.ensure_future(self._stopped.wait())
+        done, pending = await asyncio.wait(
+            {slot, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        for future in pending:
+            future.cancel()
+        return slot in done and not self._stopped.is_set()
+
+    async def _submit(self, row) -> None:
+        script_id = row["script_id"]
+        planned = VideoPlanner.params(row)
+        params = planned
+        if params is None:
+            plan = self.planner.plan_row(row)
+            params = GenerationParams(size=plan.size, duration=plan.duration)
+        key = cache_key(row["content"], params)
+        if self.cache is not None:
+            entry = self.cache.get(key)
+            if entry is not None:
+                await self._complete_from_cache(script_id, key, entry)
+                return
+        if self.budget is not None:
+            reservation = await self.budget.reserve(script_id, params)
+            if not reservation.granted:
+                # Over budget: leave the row for when the cap allows it.
+                # An interrupted submit keeps its reservation open and is
+                # granted it again, so an intent here never reached the
+                # provider; drop it so it is not resubmitted as one.
+                async with self.pool.acquire() as conn:
+                    async with conn.transaction():
+                        await db.discard_intent(conn, script_id,
+                                                row["error_count"])
+                        await db.requeue(conn, script_id)
+                self._held.discard(script_id)
+                return
+            if reservation.params != params:
+                params = reservation.params
+                key = cache_key(row["content"], params)
+        if params != planned:
+            async with self.pool.acquire() as conn:
+                await db.save_plans(conn, [(script_id, params.size,
+                                            params.duration)])
+        request = json.dumps({"model": DEFAULT_MODEL,
+                              "parameters": params.to_payload(),
+                              "cache_key": key})
+        async with self.pool.acquire() as conn:
+            ledger = await db.record_intent(conn, script_id,
+                                            row["error_count"], request)
+        if ledger["task_id"]:
+            # Submitted by an earlier run that died before finishing the
+            # row; pick the task up again instead of paying for another.
+            logger.info("Resuming %s (task %s)", script_id, ledger["task_id"])
+            await self._recover(script_id, ledger["task_id"])
+            return
+        if not ledger["created"]:
+            logger.warning("Resubmitting %s: an earlier submit was recorded "
+                           "but never returned a task id", script_id)
+        started = time.monotonic()
+        try:
+            task = await self.scheduler.submit(row["content"], params)
+        except (Wan25Error, OSError, asyncio.TimeoutError) as e:
+            status = getattr(e, "status", None)
+            async with self.pool.acquire() as conn:
+                await db.record_submit_failed(conn, ledger["id"], str(e))
+            if self.budget is not None:
+                await self.budget.release(script_id)
+            await self._fail(script_id, f"API request failed: {e}",
+                             "api_error", status, started)
+            return
+        async with self.pool.acquire() as conn:
+            await db.record_submitted(conn, ledger["id"], script_id,
+                                      task.task_id)
+        self.logs.api_call(script_id, SYNTHESIS_PATH, "create", 201,
+                           _elapsed_ms(started))
+        if task.status.is_terminal:
+            await self._on_complete(task, script_id)
+        else:
+            self.poller.track(task.task_id, context=script_id)
+
+    async def _complete_from_cache(self, script_id: str, key: str,
+                                   entry: CacheEntry) -> None:
+        path = self._video_path(script_id)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.cache.materialize, entry, path)
+        async with self.pool.acquire() as conn:
+            await db.mark_cached(conn, script_id, key, entry.video_url,
+                                 entry.video_duration, path, entry.sha256)
+        self._held.discard(script_id)
+        logger.info("Completed %s from cache (%s)", script_id, key[:12])
+
+    async def _on_complete(self, task: Task, script_id: str) -> None:
+        self.scheduler.observe(task)
+        if task.status == TaskStatus.UNKNOWN:
+            # Given up on by the poller (expired or lost); no longer running.
+            self.scheduler.release(task.task_id)
+        self._held.discard(script_id)
+        if task.status == TaskStatus.SUCCEEDED and task.video_url:
+            expires_at = parse_expiry(task.video_url)
+            async with self.pool.acquire() as conn:
+                await db.record_finished(conn, task.task_id, "succeeded",
+                                         task.video_url)
+                await db.mark_completed(conn, script_id, task.video_url,
+                                        task.video_duration, expires_at)
+            cost = None
+            if self.budget is not None:
+                cost = await self.budget.settle(script_id, task.video_duration)
+            self.logs.api_call(script_id, TASK_PATH, "status", 200, None,
+                               cost_cents=cost)
+            logger.info("Completed %s (task %s)", script_id, task.task_id)
+            self._download(script_id, task.video_url, expires_at)
+        else:
+            if task.status == TaskStatus.UNKNOWN:
+                message = "Task unknown to the provider (expired or lost)"
+            elif task.status == TaskStatus.SUCCEEDED:
+                message = "Task succeeded without a video_url"
+            else:
+                message = f"Task failed: {task.code} - {task.message}"
+            async with self.pool.acquire() as conn:
+                await db.record_finished(conn, task.task_id, "failed",
+                                         error_message=message)
+            if self.budget is not None:
+                await self.budget.release(script_id)
+            await self._fail(script_id, message, "task_failed", 200, None,
+                             task)
+        self.wake()
+
+    async def _refresh_metrics(self) -> None:
+        async with self.pool.acquire() as conn:
+            metrics.set_queue_depth(await db.queue_depth(conn))
+
+    # -- downloads -------------------------------------------------------
+
+    def _download(self, script_id: str, url: str,
+                  expires_at: Optional[float]) -> None:
+        if self.downloads is not None:
+            self.downloads.put(url, self._video_path(script_id), script_id,
+                               expires_at)
+
+    def _video_path(self, script_id: str) -> str:
+        return os.path.join(self.video_dir, f"{script_id}.mp4")
+
+    async def _queue_downloads(self) -> None:
+        """Re-queue finished videos a previous run did not save."""
+        if self.downloads is None:
+            return
+        rows = await db.pending_downloads(self.pool)
+        for row in rows:
+            expires_at = row["expires_at"]
+            self._download(row["script_id"], row["video_url"],
+                           float(expires_at) if expires_at is not None
+                           else None)
+
+    async def _on_downloaded(self, job: DownloadJob, result: DownloadResult,
+                             sha256: str) -> None:
+        async with self.pool.acquire() as conn:
+            row = await db.mark_downloaded(conn, job.context, job.path, sha256)
+        if self.cache is not None and row is not None and row["cache_key"]:
+            self.cache.put(row["cache_key"], job.path, sha256,
+                           row["video_url"], row["video_duration"])
+
+    def _on_download_alert(self, job: DownloadJob, finish: float) -> None:
+        message = (f"Link expires {job.expires_at - finish:.0f}s after the "
+                   f"predicted download finish (margin "
+                   f"{self.downloads.margin:.0f}s)")
+        context = json.dumps({"path": job.path, "expires_at": job.expires_at,
+                              "queued": len(self.downloads)})
+        self.logs.error(job.context, "download_deadline", message, context)
+
+    async def _fail(self, script_id: str, message: str, error_type: str,
+                    status_code: Optional[int], started: Optional[float],
+                    task: Optional[Task] = None) -> None:
+        self._held.discard(script_id)
+        context = {"task_id": task.task_id, "code": task.code} if task else {}
+        request_type, endpoint = (("status", TASK_PATH) if task
+                                  else ("create", SYNTHESIS_PATH))
+        self.logs.api_call(script_id, endpoint, request_type, status_code,
+                           _elapsed_ms(started) if started else None, message)
+        self.logs.error(script_id, error_type, message, json.dumps(context))
+        async with self.pool.acquire() as conn:
+            status = await db.mark_failed(conn, script_id, message)
+        logger.warning("%s -> %s: %s", script_id, status, message)
+
+
+def _elapsed_ms(started: float) -> int:
+    return int((time.monotonic() - started) * 1000)
+
+
+async def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--batch-size", type=int, default=3)
+    parser.add_argument("--sweep-interval", type=float, default=300.0,
+                        help="seconds between fallback queue sweeps")
+    parser.add_argument("--rate", type=float, default=5.0,
+                        help="Wan 2.5 submissions per second")
+    parser.add_argument("--max-concurrent", type=int, default=5,
+                        help="Wan 2.5 tasks in flight")
+    parser.add_argument("--worker-id", default=None,
+                        help="name recorded on claimed batches (default: host:pid)")
+    parser.add_argument("--lease", type=int, default=120,
+                        help="seconds a claimed row stays leased between heartbeats")
+    parser.add_argument("--video-dir", default=os.environ.get("VIDEO_DIR",
+                                                              "videos"),
+                        help="where finished videos are saved (default: VIDEO_DIR or ./videos)")
+    parser.add_argument("--download-workers", type=int, default=2,
+                        help="concurrent video downloads (0 disables downloading)")
+    parser.add_argument("--cache-dir", default=os.environ.get(
+                            "GENERATION_CACHE_DIR"),
+                        help="generation cache (default: GENERATION_CACHE_DIR or <video-dir>/.cache)")
+    parser.add_argument("--cache-size", type=float,
+                        default=DEFAULT_MAX_BYTES / (1 << 30),
+                        help="generation cache size limit in GiB")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always submit, even for previously generated requests")
+    parser.add_argument("--duplicate-threshold", type=float, default=0.8,
+                        help="MinHash similarity at which scripts count as near-duplicates (0 disables)")
+    parser.add_argument("--link-duplicates", action="store_true",
+                        help="complete near-duplicates with the original's video instead of generating")
+    parser.add_argument("--maintenance-interval", type=float, default=3600.0,
+                        help="seconds between database maintenance passes (counters, rollups, log partitions)")
+    parser.add_argument("--log-retention", type=int, default=6,
+                        help="months of api_usage_log / error_log partitions to keep")
+    parser.add_argument("--tier", type=int, default=720, choices=(480, 720, 1080),
+                        help="resolution tier videos are planned at")
+    parser.add_argument("--no-downtier", action="store_true",
+                        help="pause at a budget cap instead of dropping to a cheaper resolution first")
+    parser.add_argument("--log-spill", default=os.environ.get("LOG_SPILL_PATH"),
+                        help="file API/error log rows are spilled to while Postgres is down (default: LOG_SPILL_PATH or <video-dir>/.log-spill.jsonl)")
+    parser.add_argument("--metrics-port", type=int,
+                        default=int(os.environ.get("METRICS_PORT", "0")),
+                        help="serve Prometheus /metrics on this port (default: METRICS_PORT; 0 disables)")
+    parser.add_argument("--metrics-host", default=os.environ.get(
+                            "METRICS_HOST", "127.0.0.1"))
+    parser.add_argument("--dsn", default=None,
+                        help="Postgres DSN (default: DATABASE_URL / DB_POSTGRESDB_*)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    pool = await db.create_pool(args.dsn, max_size=args.max_concurrent + 3)
+    async with Wan25Client.from_env() as client, RangeDownloader() as downloader:
+        scheduler = SubmissionScheduler(client, rate=args.rate,
+                                        max_concurrent=args.max_concurrent)
+        downloads = (DownloadQueue(downloader, workers=args.download_workers)
+                     if args.download_workers > 0 else None)
+        cache = None
+        if not args.no_cache:
+            cache = GenerationCache(
+                args.cache_dir or os.path.join(args.video_dir, ".cache"),
+                int(args.cache_size * (1 << 30)))
+        worker = QueueWorker(pool, client, scheduler,
+                             batch_size=args.batch_size,
+                             sweep_interval=args.sweep_interval,
+                             worker_id=args.worker_id,
+                             lease_seconds=args.lease,
+                             downloads=downloads, video_dir=args.video_dir,
+                             cache=cache,
+                             dedup=(DuplicateIndex(threshold=args.duplicate_threshold)
+                                    if args.duplicate_threshold > 0 else None),
+                             link_duplicates=args.link_duplicates,
+                             maintenance_interval=args.maintenance_interval,
+                             log_retention_months=args.log_retention,
+                             budget=BudgetGate(
+                                 pool, allow_downtier=not args.no_downtier,
+                                 recheck=args.sweep_interval),
+                             planner=VideoPlanner(tier=args.tier),
+                             logs=LogSink(pool, spill_path=args.log_spill
+                                          or os.path.join(args.video_dir,
+                                                          ".log-spill.jsonl")),
+                             metrics_interval=15.0 if args.metrics_port else None)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, worker.stop)
+            except NotImplementedError:  # Windows
+                pass
+        exporter = None
+        if args.metrics_port:
+            exporter = await metrics.serve(args.metrics_host, args.metrics_port)
+        try:
+            await worker.run()
+        finally:
+            if exporter is not None:
+                await exporter.cleanup()
+            await pool.close()
+            if cache is not None:
+                cache.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,42 @@
+"""
+Shared fixtures for the ``profbrainrot`` unit tests.
+
+Run with ``python -m pytest tests/unit``. Tests marked with the ``dsn``
+fixture need a scratch Postgres database loaded from
+``database/schema.sql``; point ``PROFBRAINROT_TEST_DSN`` at it, otherwise
+they are skipped.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+
+class FakeClock:
+    """A ``clock=`` stand-in that only moves when told to."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def dsn():
+    value = os.environ.get("PROFBRAINROT_TEST_DSN")
+    if not value:
+        pytest.skip("PROFBRAINROT_TEST_DSN is not set")
+    return value
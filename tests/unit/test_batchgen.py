@@ -0,0 +1,126 @@
+import asyncio
+
+import asyncpg
+import pytest
+
+from profbrainrot import db
+from profbrainrot.batchgen import BatchScriptGenerator
+from profbrainrot.scheduler import TokenBucket
+from profbrainrot.scriptgen import Lesson, OpenAIError, ScriptSet
+
+LESSON = Lesson("test_batchgen_1", "Fractions", "math", "5", "Halves.")
+
+
+class _FlakyGenerator:
+    """Fails with each of ``errors`` in turn, then returns a script set."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def messages(self, lesson):
+        return [{"role": "user", "content": lesson.content}]
+
+    async def complete(self, lesson):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return ScriptSet([{"platform": "tiktok", "content": "x"}],
+                         usage={"total_tokens": 100})
+
+
+def _complete(generator, clock, monkeypatch):
+    batch = BatchScriptGenerator(generator, None)
+    # Power-of-two rates keep the fake clock's arithmetic exact.
+    batch.requests = TokenBucket(64, 64, clock=clock)
+    batch.tokens = TokenBucket(8192, 8192, clock=clock)
+    slept = []
+
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+        clock.advance(seconds)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    started = clock()
+    scripts = asyncio.run(batch._complete(LESSON))
+    return batch, scripts, clock() - started, slept
+
+
+def test_rate_limit_backs_off_once(clock, monkeypatch):
+    generator = _FlakyGenerator(OpenAIError(429, retry_after=0.25))
+    batch, scripts, waited, slept = _complete(generator, clock, monkeypatch)
+    assert generator.calls == 2 and scripts.shorts
+    assert batch.throttled == 1
+    # Only the drained buckets hold the retry back, not an extra sleep.
+    assert 0.25 <= waited < 0.5
+    assert 1.0 not in slept
+
+
+def test_server_errors_back_off_exponentially(clock, monkeypatch):
+    generator = _FlakyGenerator(OpenAIError(500), OpenAIError(503))
+    batch, _, _, slept = _complete(generator, clock, monkeypatch)
+    assert generator.calls == 3 and batch.throttled == 0
+    assert slept == [1.0, 2.0]
+
+
+def test_client_errors_are_not_retried(clock, monkeypatch):
+    generator = _FlakyGenerator(OpenAIError(400))
+    with pytest.raises(OpenAIError):
+        _complete(generator, clock, monkeypatch)
+    assert generator.calls == 1
+
+
+def test_interrupted_claim_is_reclaimed_after_its_lease(dsn):
+    async def scenario():
+        conn = await asyncpg.connect(dsn)
+        other = await asyncpg.connect(dsn)
+        try:
+            await conn.execute(
+                """
+                INSERT INTO lessons (lesson_id, title, subject, grade_level,
+                                     original_content)
+                VALUES ($1, 'Fractions', 'math', '5', 'Halves.')
+                """, LESSON.lesson_id)
+            async with other.transaction():
+                # SKIP LOCKED passes over lessons another transaction holds.
+                await other.execute(
+                    "SELECT id FROM lessons WHERE lesson_id <> $1 FOR UPDATE",
+                    LESSON.lesson_id)
+
+                claimed = await db.claim_pending_lessons(conn, 5, 60)
+                assert [r["lesson_id"] for r in claimed] == [LESSON.lesson_id]
+                assert await db.claim_pending_lessons(conn, 5) == []
+
+                # The run dies; once the lease passes the lesson is claimed
+                # again.
+                await conn.execute(
+                    "UPDATE lessons SET claim_expires_at = CURRENT_TIMESTAMP "
+                    "- INTERVAL '1 second' WHERE lesson_id = $1",
+                    LESSON.lesson_id)
+                claimed = await db.claim_pending_lessons(conn, 5, 60)
+                assert [r["lesson_id"] for r in claimed] == [LESSON.lesson_id]
+
+                await db.enqueue_scripts(conn, LESSON.lesson_id, "Fractions",
+                                         [{"platform": "tiktok",
+                                           "content": "x"}])
+                lesson = await conn.fetchrow(
+                    "SELECT processing_status, claim_expires_at FROM lessons "
+                    "WHERE lesson_id = $1", LESSON.lesson_id)
+                assert tuple(lesson) == ("processing", None)
+                # Queued lessons are never claimed again.
+                await conn.execute(
+                    "UPDATE lessons SET updated_at = CURRENT_TIMESTAMP "
+                    "- INTERVAL '1 day' WHERE lesson_id = $1",
+                    LESSON.lesson_id)
+                assert await db.claim_pending_lessons(conn, 5) == []
+        finally:
+            await other.close()
+            await conn.execute("DELETE FROM video_queue WHERE lesson_id = $1",
+                               LESSON.lesson_id)
+            await conn.execute("DELETE FROM error_log WHERE error_context->>"
+                               "'lesson_id' = $1", LESSON.lesson_id)
+            await conn.execute("DELETE FROM lessons WHERE lesson_id = $1",
+                               LESSON.lesson_id)
+            await conn.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,85 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from profbrainrot import cache as cache_module
+from profbrainrot.cache import GenerationCache, cache_key
+from profbrainrot.wan25 import GenerationParams
+
+
+@pytest.fixture
+def store(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(time=clock))
+    cache = GenerationCache(str(tmp_path / "cache"), max_bytes=250)
+    yield cache
+    cache.close()
+
+
+def _video(tmp_path, name, size=100):
+    path = tmp_path / f"{name}.mp4"
+    path.write_bytes(name.encode()[:1] * size)
+    return str(path)
+
+
+def test_cache_key_covers_every_generation_input():
+    base = cache_key("A cat", GenerationParams())
+    assert cache_key("A cat", GenerationParams()) == base
+    assert cache_key("A cat ", GenerationParams()) != base
+    assert cache_key("A cat", GenerationParams(duration=5)) != base
+    assert cache_key("A cat", GenerationParams(seed=7)) != base
+    assert cache_key("A cat", negative_prompt="") != base
+    assert cache_key("A cat", model="other") != base
+
+
+def test_same_key_is_stored_once(store, tmp_path):
+    key = cache_key("A cat")
+    store.put(key, _video(tmp_path, "a"), "sha-a")
+    store.put(key, _video(tmp_path, "a"), "sha-a")
+    assert store.stats()["entries"] == 1
+    assert store.total_bytes() == 100
+
+    entry = store.get(key)
+    target = str(tmp_path / "out" / "copy.mp4")
+    store.materialize(entry, target)
+    assert os.path.samefile(target, entry.path)
+    assert store.get(cache_key("A dog")) is None
+    assert (store.hits, store.misses) == (1, 1)
+
+
+def test_least_recently_used_is_evicted_first(store, tmp_path, clock):
+    for name in ("a", "b"):
+        store.put(name, _video(tmp_path, name), name)
+        clock.advance(1)
+    store.get("a")  # now b is the least recently used
+    clock.advance(1)
+    store.put("c", _video(tmp_path, "c"), "c")
+
+    assert "b" not in store
+    assert "a" in store and "c" in store
+    assert not os.path.exists(store._object_path("b"))
+
+
+def test_pinned_entries_are_never_evicted(store, tmp_path, clock):
+    store.put("a", _video(tmp_path, "a"), "a", pin=True)
+    clock.advance(1)
+    store.put("b", _video(tmp_path, "b"), "b")
+    clock.advance(1)
+    store.put("c", _video(tmp_path, "c"), "c")
+    assert "a" in store and "b" not in store
+
+    assert store.evict(0) == ["c"]
+    assert "a" in store
+    assert store.unpin("a") and store.evict(0) == ["a"]
+
+
+def test_video_larger_than_the_store_is_not_kept(store, tmp_path):
+    assert store.put("huge", _video(tmp_path, "huge", 300), "h") is None
+    assert store.total_bytes() == 0
+
+
+def test_missing_object_is_dropped_on_lookup(store, tmp_path):
+    entry = store.put("a", _video(tmp_path, "a"), "a")
+    os.remove(entry.path)
+    assert store.get("a") is None
+    assert "a" not in store
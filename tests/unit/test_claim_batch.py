@@ -0,0 +1,107 @@
+import asyncio
+
+import asyncpg
+
+from profbrainrot import db
+
+ROWS = 20
+
+
+async def _insert_scripts(conn, prefix, n):
+    await conn.execute(
+        """
+        INSERT INTO video_queue (lesson_id, lesson_title, script_id,
+                                 script_type, content, target_platform)
+        SELECT 'math_algebra_01', 'Test', $1 || n, 'short', 'Script ' || n,
+               'tiktok'
+        FROM generate_series(1, $2) n
+        """, prefix, n)
+
+
+async def _hide_other_rows(conn, prefix):
+    """Lock every other queued row so SKIP LOCKED claims only ours.
+
+    Call inside a transaction on a connection of its own.
+    """
+    await conn.execute(
+        """
+        SELECT id FROM video_queue
+        WHERE status = 'queued' AND script_id NOT LIKE $1 || '%'
+        FOR UPDATE
+        """, prefix)
+
+
+async def _cleanup(conn, prefix):
+    await conn.execute(
+        """
+        DELETE FROM processing_batches WHERE batch_id IN (
+            SELECT batch_id FROM video_queue WHERE script_id LIKE $1 || '%')
+        """, prefix)
+    await conn.execute("DELETE FROM video_queue WHERE script_id LIKE $1 || '%'",
+                       prefix)
+
+
+def test_concurrent_claims_never_share_a_row(dsn):
+    async def scenario():
+        prefix = "test_concurrent_"
+        conn = await asyncpg.connect(dsn)
+        other = await asyncpg.connect(dsn)
+        hidden = other.transaction()
+        workers = [await asyncpg.connect(dsn) for _ in range(5)]
+        try:
+            await _insert_scripts(conn, prefix, ROWS)
+            await hidden.start()
+            await _hide_other_rows(other, prefix)
+            batches = await asyncio.gather(
+                *(db.claim_batch(worker, f"w{n}", ROWS // len(workers))
+                  for n, worker in enumerate(workers)))
+            claimed = [row["script_id"] for rows in batches for row in rows]
+            assert sorted(claimed) == sorted(f"{prefix}{n}"
+                                             for n in range(1, ROWS + 1))
+            for n, rows in enumerate(batches):
+                assert len({row["batch_id"] for row in rows}) == 1
+                owners = await conn.fetch(
+                    "SELECT status, claimed_by FROM video_queue "
+                    "WHERE script_id = ANY($1::text[])",
+                    [row["script_id"] for row in rows])
+                assert {(r["status"], r["claimed_by"]) for r in owners} == {
+                    ("processing", f"w{n}")}
+            assert await conn.fetchval(
+                "SELECT count(*) FROM video_queue "
+                "WHERE script_id LIKE $1 || '%' AND status = 'queued'",
+                prefix) == 0
+        finally:
+            await other.close()
+            await _cleanup(conn, prefix)
+            for worker in workers:
+                await worker.close()
+            await conn.close()
+
+    asyncio.run(scenario())
+
+
+def test_claim_records_its_batch(dsn):
+    async def scenario():
+        prefix = "test_claim_batch_"
+        conn = await asyncpg.connect(dsn)
+        other = await asyncpg.connect(dsn)
+        try:
+            await _insert_scripts(conn, prefix, 3)
+            async with other.transaction():
+                await _hide_other_rows(other, prefix)
+                rows = await db.claim_batch(conn, "w1", 3)
+            assert [row["script_id"] for row in rows] == [
+                f"{prefix}{n}" for n in (1, 2, 3)]
+            batch = await conn.fetchrow(
+                "SELECT batch_type, total_items, status, metadata "
+                "FROM processing_batches WHERE batch_id = $1",
+                rows[0]["batch_id"])
+            assert (batch["batch_type"], batch["total_items"],
+                    batch["status"]) == ("shorts_only", 3, "processing")
+            assert '"worker_id": "w1"' in batch["metadata"]
+        finally:
+            await other.close()
+            await _cleanup(conn, prefix)
+            await conn.close()
+
+    asyncio.run(scenario())
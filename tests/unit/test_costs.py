@@ -0,0 +1,44 @@
+import pytest
+
+from profbrainrot.costs import downtier, price_cents, resolution_tier
+from profbrainrot.wan25 import GenerationParams
+
+
+def test_resolution_tier_uses_the_short_side():
+    assert resolution_tier("1920*1080") == 1080
+    assert resolution_tier("720*1280") == 720
+    assert resolution_tier("832*480") == 480
+
+
+def test_resolution_tier_rejects_malformed_sizes():
+    with pytest.raises(ValueError):
+        resolution_tier("1280x720")
+
+
+def test_price_cents_per_tier():
+    assert price_cents(GenerationParams(size="832*480", duration=10)) == 50
+    assert price_cents(GenerationParams(size="1280*720", duration=10)) == 100
+    assert price_cents(GenerationParams(size="1080*1920", duration=5)) == 75
+
+
+def test_price_cents_billed_duration_overrides_request():
+    params = GenerationParams(size="1280*720", duration=10)
+    assert price_cents(params, 7) == 70
+    assert price_cents(params, 0) == 0
+
+
+def test_price_cents_silent_costs_the_same():
+    params = GenerationParams(size="1280*720", duration=5, audio=False)
+    assert price_cents(params) == 50
+
+
+def test_downtier_keeps_orientation_and_other_params():
+    landscape = GenerationParams(size="1920*1080", duration=5, audio=False)
+    lower = downtier(landscape)
+    assert lower == GenerationParams(size="1280*720", duration=5, audio=False)
+    assert downtier(lower).size == "832*480"
+    assert downtier(GenerationParams(size="1080*1920")).size == "720*1280"
+
+
+def test_downtier_bottoms_out_at_480p():
+    assert downtier(GenerationParams(size="480*832")) is None
@@ -0,0 +1,79 @@
+import pytest
+
+from profbrainrot.dedup import DuplicateIndex, shingles
+
+SCRIPT = (
+    "Wait, did you know fractions are just pizza slices in disguise? Cut a "
+    "pizza into eight equal slices and eat three of them. You just ate "
+    "three eighths of the pizza. The bottom number tells you how many "
+    "slices there are in total, and the top number tells you how many you "
+    "took. Now cut another pizza into four slices and take two. That is "
+    "two quarters, which is exactly half the pizza. Same amount of food, "
+    "different names. Follow for more math that you can actually eat.")
+UNRELATED = (
+    "Photosynthesis is how plants turn sunlight into food. Leaves catch "
+    "light with chlorophyll, pull carbon dioxide from the air and water "
+    "from the roots, and build sugar while they breathe out oxygen for us. "
+    "Every breath you take today was made by a plant somewhere.")
+
+
+def test_shingles_fold_case_and_punctuation():
+    assert shingles("The CAT sat, on the mat!") == shingles(
+        "the cat sat on the mat")
+    assert shingles("One two", size=3) == {"one two"}
+
+
+def test_near_duplicate_is_found_and_unrelated_is_not():
+    index = DuplicateIndex()
+    index.add("original", index.signature(SCRIPT))
+    index.add("other", index.signature(UNRELATED))
+
+    edited = SCRIPT.replace("Follow for more", "Subscribe for more")
+    matches = index.query(index.signature(edited))
+    assert [script_id for script_id, _ in matches] == ["original"]
+    assert 0.8 <= matches[0][1] < 1.0
+    assert index.query(index.signature(
+        "Volcanoes erupt when magma pushes up through the crust.")) == []
+
+
+def test_identical_text_matches_exactly():
+    index = DuplicateIndex()
+    signature = index.signature(SCRIPT)
+    assert index.signature(SCRIPT.upper()) == signature
+    index.add("a", signature)
+    assert index.query(signature) == [("a", 1.0)]
+
+
+def test_matches_are_best_first():
+    index = DuplicateIndex()
+    index.add("edited", index.signature(SCRIPT.replace("eat.", "enjoy.")))
+    index.add("extended", index.signature(SCRIPT + " Seriously."))
+    index.add("same", index.signature(SCRIPT))
+    scores = index.query(index.signature(SCRIPT), threshold=0.5)
+    assert scores[0] == ("same", 1.0)
+    assert [s for _, s in scores] == sorted((s for _, s in scores),
+                                            reverse=True)
+
+
+def test_remove_and_readd():
+    index = DuplicateIndex()
+    signature = index.signature(SCRIPT)
+    index.add("a", signature)
+    index.add("a", signature)
+    assert len(index) == 1
+    index.remove("a")
+    assert "a" not in index and index.query(signature) == []
+    assert all(not bucket for bucket in index._buckets)
+
+
+def test_signature_bytes_round_trip():
+    index = DuplicateIndex()
+    signature = index.signature(SCRIPT)
+    assert index.from_bytes(signature.tobytes()) == signature
+    with pytest.raises(ValueError):
+        DuplicateIndex(num_perm=64).from_bytes(signature.tobytes())
+
+
+def test_bands_must_divide_num_perm():
+    with pytest.raises(ValueError):
+        DuplicateIndex(num_perm=100, bands=16)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+import re
+
+from aiohttp import web
+
+from profbrainrot.downloader import RangeDownloader
+
+BODY = bytes(range(256)) * 256  # 64 KiB
+SEGMENT = 8192
+ETAG = '"v1"'
+
+
+async def _serve(requests):
+    """A local server honouring Range requests; ``requests`` logs them."""
+    async def handle(request):
+        header = request.headers.get("Range")
+        requests.append(header)
+        match = re.match(r"bytes=(\d+)-(\d+)", header or "")
+        if not match:
+            return web.Response(body=BODY, headers={"ETag": ETAG})
+        start, end = int(match.group(1)), int(match.group(2))
+        return web.Response(
+            status=206, body=BODY[start:end + 1],
+            headers={"ETag": ETAG,
+                     "Content-Range": f"bytes {start}-{end}/{len(BODY)}"})
+
+    app = web.Application()
+    app.router.add_get("/video.mp4", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/video.mp4"
+
+
+def _download(path, prepare=None):
+    requests = []
+
+    async def scenario():
+        runner, url = await _serve(requests)
+        try:
+            async with RangeDownloader(max_segments=2,
+                                       segment_size=SEGMENT) as downloader:
+                return await downloader.download(url, path)
+        finally:
+            await runner.cleanup()
+
+    result = asyncio.run(scenario())
+    with open(path, "rb") as f:
+        assert f.read() == BODY
+    assert not os.path.exists(path + ".part")
+    assert not os.path.exists(path + ".part.json")
+    # The first request is the one-byte probe.
+    return result, requests[1:]
+
+
+def _write_sidecar(path, done):
+    with open(path + ".part.json", "w") as f:
+        json.dump({"size": len(BODY), "etag": ETAG, "done": done}, f)
+
+
+def test_download_fetches_every_segment(tmp_path):
+    result, ranges = _download(str(tmp_path / "v.mp4"))
+    assert result.size == len(BODY)
+    assert result.resumed_bytes == 0
+    assert result.segments == len(ranges) == len(BODY) // SEGMENT
+
+
+def test_resume_skips_ranges_recorded_in_the_sidecar(tmp_path):
+    path = str(tmp_path / "v.mp4")
+    with open(path + ".part", "wb") as f:
+        f.write(BODY[:2 * SEGMENT] + bytes(len(BODY) - 2 * SEGMENT))
+    _write_sidecar(path, [[0, 2 * SEGMENT - 1]])
+
+    result, ranges = _download(path)
+    assert result.resumed_bytes == 2 * SEGMENT
+    assert f"bytes=0-{SEGMENT - 1}" not in ranges
+    assert len(ranges) == len(BODY) // SEGMENT - 2
+
+
+def test_stale_sidecar_without_part_file_starts_over(tmp_path):
+    path = str(tmp_path / "v.mp4")
+    _write_sidecar(path, [[0, 2 * SEGMENT - 1]])
+
+    result, ranges = _download(path)
+    assert result.resumed_bytes == 0
+    assert len(ranges) == len(BODY) // SEGMENT
+
+
+def test_sidecar_for_a_changed_file_is_ignored(tmp_path):
+    path = str(tmp_path / "v.mp4")
+    with open(path + ".part", "wb") as f:
+        f.write(bytes(len(BODY)))
+    with open(path + ".part.json", "w") as f:
+        json.dump({"size": len(BODY), "etag": '"v0"',
+                   "done": [[0, len(BODY) - 1]]}, f)
+
+    result, ranges = _download(path)
+    assert result.resumed_bytes == 0
+    assert len(ranges) == len(BODY) // SEGMENT
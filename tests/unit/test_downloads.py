@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timezone
+
+from profbrainrot.downloader import DownloadResult
+from profbrainrot.downloads import DownloadQueue, parse_expiry
+
+OSS = "https://bucket.oss-cn-beijing.aliyuncs.com/result/v.mp4"
+
+
+def test_parse_expiry_v1_signature():
+    url = f"{OSS}?OSSAccessKeyId=id&Expires=1762159012&Signature=abc%3D"
+    assert parse_expiry(url) == 1762159012.0
+
+
+def test_parse_expiry_v4_signature():
+    url = (f"{OSS}?x-oss-signature-version=OSS4-HMAC-SHA256"
+           f"&x-oss-date=20251102T173652Z&x-oss-expires=86400"
+           f"&x-oss-signature=abc")
+    signed = datetime(2025, 11, 2, 17, 36, 52, tzinfo=timezone.utc)
+    assert parse_expiry(url) == signed.timestamp() + 86400
+
+
+def test_parse_expiry_unknown_or_malformed():
+    assert parse_expiry(OSS) is None
+    assert parse_expiry(f"{OSS}?Expires=soon") is None
+
+
+class _FakeDownloader:
+    """Writes a small file per URL; ``bad`` URLs raise instead."""
+
+    def __init__(self, bad=()):
+        self.order = []
+        self.bad = set(bad)
+
+    async def download(self, url, path):
+        self.order.append(url)
+        if url in self.bad:
+            raise ValueError("invalid literal for int(): 'abc'")
+        with open(path, "wb") as f:
+            f.write(url.encode())
+        return DownloadResult(path, len(url), 1.0)
+
+
+def _drain(queue):
+    async def scenario():
+        runner = asyncio.ensure_future(queue.run())
+        while len(queue) or queue.stats()["active"]:
+            await asyncio.sleep(0.01)
+        queue.stop()
+        await asyncio.gather(runner, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_downloads_run_earliest_expiry_first(tmp_path, clock):
+    downloader = _FakeDownloader()
+    queue = DownloadQueue(downloader, workers=1, clock=clock)
+    now = clock()
+    queue.put("late", str(tmp_path / "late.mp4"), expires_at=now + 3000)
+    queue.put("unknown", str(tmp_path / "unknown.mp4"))
+    queue.put("soon", str(tmp_path / "soon.mp4"), expires_at=now + 600)
+    queue.put("expired", str(tmp_path / "expired.mp4"), expires_at=now - 1)
+
+    _drain(queue)
+    assert downloader.order == ["soon", "late", "unknown"]
+    assert (queue.downloaded, queue.expired) == (3, 1)
+
+
+def test_backlog_alerts_before_link_expires(tmp_path, clock):
+    alerts = []
+    queue = DownloadQueue(_FakeDownloader(), workers=1, margin=60,
+                          on_alert=lambda job, finish: alerts.append(job.url),
+                          clock=clock)
+    now = clock()
+    queue.put("safe", str(tmp_path / "a.mp4"), expires_at=now + 1000)
+    queue.put("tight", str(tmp_path / "b.mp4"), expires_at=now + 75)
+    # Each transfer is assumed to take 10s. "tight" finishes at +10, clear
+    # of its 60s margin, until an earlier-expiring job pushes it to +20.
+    assert alerts == []
+    queue.put("tighter", str(tmp_path / "c.mp4"), expires_at=now + 72)
+    assert alerts == ["tight"]
+    queue.put("again", str(tmp_path / "d.mp4"), expires_at=now + 2000)
+    assert alerts == ["tight"]  # once per job
+
+
+def test_unexpected_errors_count_as_failed_and_keep_the_worker(tmp_path,
+                                                               clock):
+    downloader = _FakeDownloader(bad={"bad"})
+    queue = DownloadQueue(downloader, workers=1, clock=clock)
+    now = clock()
+    queue.put("bad", str(tmp_path / "bad.mp4"), expires_at=now + 10)
+    queue.put("good", str(tmp_path / "good.mp4"), expires_at=now + 20)
+
+    _drain(queue)
+    assert downloader.order == ["bad", "good"]
+    assert (queue.failed, queue.downloaded) == (1, 1)
@@ -0,0 +1,60 @@
+import asyncio
+
+import asyncpg
+
+from profbrainrot import db
+from profbrainrot.importer import import_lessons
+
+
+def _lesson(lesson_id, content):
+    return {"lesson_id": lesson_id, "title": "Fractions", "subject": "math",
+            "grade_level": "5", "original_content": content}
+
+
+def _shorts(text):
+    return [{"platform": "tiktok", "content": text, "hook": "Hook"},
+            {"platform": "youtube_shorts", "content": text, "hook": "Hook"}]
+
+
+def test_reimport_of_edited_lesson_requeues_new_scripts(dsn):
+    async def scenario():
+        conn = await asyncpg.connect(dsn)
+        lesson_id = "test_reimport_" + str(id(conn))
+        try:
+            stats = await import_lessons(conn, [_lesson(lesson_id, "old")])
+            assert stats.inserted == 1
+            await db.enqueue_scripts(conn, lesson_id, "Fractions",
+                                     _shorts("old script"))
+
+            # Unchanged content is a no-op.
+            stats = await import_lessons(conn, [_lesson(lesson_id, "old")])
+            assert (stats.updated, stats.unchanged) == (0, 1)
+
+            stats = await import_lessons(conn, [_lesson(lesson_id, "new")])
+            assert stats.updated == 1
+            lesson = await conn.fetchrow(
+                "SELECT processing_status, content_revision FROM lessons "
+                "WHERE lesson_id = $1", lesson_id)
+            assert lesson["processing_status"] == "pending"
+            assert lesson["content_revision"] == 1
+
+            await db.enqueue_scripts(conn, lesson_id, "Fractions",
+                                     _shorts("new script"))
+            rows = await conn.fetch(
+                "SELECT script_id, status, content FROM video_queue "
+                "WHERE lesson_id = $1 ORDER BY id", lesson_id)
+            by_status = {}
+            for row in rows:
+                by_status.setdefault(row["status"], []).append(row)
+            assert {r["content"] for r in by_status["cancelled"]} == {"old script"}
+            assert {r["content"] for r in by_status["queued"]} == {"new script"}
+            assert [r["script_id"] for r in by_status["queued"]] == [
+                f"{lesson_id}_r1_tiktok_0", f"{lesson_id}_r1_youtube_shorts_1"]
+        finally:
+            await conn.execute("DELETE FROM video_queue WHERE lesson_id = $1",
+                               lesson_id)
+            await conn.execute("DELETE FROM lessons WHERE lesson_id = $1",
+                               lesson_id)
+            await conn.close()
+
+    asyncio.run(scenario())
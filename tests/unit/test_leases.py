@@ -0,0 +1,114 @@
+import asyncio
+
+import asyncpg
+
+from profbrainrot import db
+
+PREFIX = "test_lease_"
+
+
+async def _claim_own_rows(conn, other, n):
+    """Insert ``n`` rows and claim them as w1, skipping everyone else's."""
+    await conn.execute(
+        """
+        INSERT INTO video_queue (lesson_id, lesson_title, script_id,
+                                 script_type, content, target_platform)
+        SELECT 'math_algebra_01', 'Test', $1 || n, 'short', 'Script ' || n,
+               'tiktok'
+        FROM generate_series(1, $2) n
+        """, PREFIX, n)
+    # SKIP LOCKED passes over rows another transaction holds.
+    await other.execute(
+        """
+        SELECT id FROM video_queue
+        WHERE status IN ('queued', 'processing')
+          AND script_id NOT LIKE $1 || '%'
+        FOR UPDATE
+        """, PREFIX)
+    return await db.claim_batch(conn, "w1", n, lease_seconds=60)
+
+
+async def _expire(conn, script_ids):
+    await conn.execute(
+        "UPDATE video_queue SET lease_expires_at = CURRENT_TIMESTAMP "
+        "- INTERVAL '1 second' WHERE script_id = ANY($1::text[])",
+        script_ids)
+
+
+async def _cleanup(conn):
+    await conn.execute(
+        """
+        DELETE FROM processing_batches WHERE batch_id IN (
+            SELECT batch_id FROM video_queue WHERE script_id LIKE $1 || '%')
+        """, PREFIX)
+    await conn.execute(
+        "DELETE FROM generation_tasks WHERE script_id LIKE $1 || '%'", PREFIX)
+    await conn.execute(
+        "DELETE FROM video_queue WHERE script_id LIKE $1 || '%'", PREFIX)
+
+
+def _run(dsn, check):
+    async def scenario():
+        conn = await asyncpg.connect(dsn)
+        other = await asyncpg.connect(dsn)
+        try:
+            async with other.transaction():
+                await check(conn, other)
+        finally:
+            await other.close()
+            await _cleanup(conn)
+            await conn.close()
+
+    asyncio.run(scenario())
+
+
+def test_heartbeat_renews_only_the_owners_rows(dsn):
+    async def check(conn, other):
+        rows = await _claim_own_rows(conn, other, 2)
+        ids = [row["script_id"] for row in rows]
+        await _expire(conn, ids)
+        assert await db.renew_leases(conn, "w2", ids) == 0
+        assert await db.renew_leases(conn, "w1", ids[:1]) == 1
+        reclaimed = await db.claim_expired_leases(conn, "w2")
+        assert [row["script_id"] for row in reclaimed] == ids[1:]
+
+    _run(dsn, check)
+
+
+def test_reaper_takes_over_expired_rows_with_their_task(dsn):
+    async def check(conn, other):
+        rows = await _claim_own_rows(conn, other, 2)
+        ids = [row["script_id"] for row in rows]
+        ledger = await db.record_intent(conn, ids[0], 0)
+        await db.record_submitted(conn, ledger["id"], ids[0], "task-123")
+
+        assert await db.claim_expired_leases(conn, "w2") == []
+        await _expire(conn, ids)
+        reclaimed = await db.claim_expired_leases(conn, "w2", lease_seconds=60)
+        by_id = {row["script_id"]: row for row in reclaimed}
+        assert set(by_id) == set(ids)
+        assert by_id[ids[0]]["previous_owner"] == "w1"
+        assert by_id[ids[0]]["task_id"] == "task-123"
+        assert by_id[ids[1]]["task_id"] is None
+        owners = await conn.fetch(
+            "SELECT claimed_by, lease_expires_at > CURRENT_TIMESTAMP AS live "
+            "FROM video_queue WHERE script_id = ANY($1::text[])", ids)
+        assert {(r["claimed_by"], r["live"]) for r in owners} == {("w2", True)}
+
+        # A live lease is not taken again.
+        assert await db.claim_expired_leases(conn, "w3") == []
+
+    _run(dsn, check)
+
+
+def test_requeue_returns_a_reclaimed_row_to_the_queue(dsn):
+    async def check(conn, other):
+        rows = await _claim_own_rows(conn, other, 1)
+        script_id = rows[0]["script_id"]
+        await db.requeue(conn, script_id)
+        row = await conn.fetchrow(
+            "SELECT status, claimed_by, lease_expires_at FROM video_queue "
+            "WHERE script_id = $1", script_id)
+        assert tuple(row) == ("queued", None, None)
+
+    _run(dsn, check)
@@ -0,0 +1,52 @@
+import asyncio
+
+import asyncpg
+
+from profbrainrot import db
+
+SCRIPT_ID = "test_ledger_1"
+
+
+def test_lost_task_advances_the_attempt(dsn):
+    async def scenario():
+        conn = await asyncpg.connect(dsn)
+        try:
+            await conn.execute(
+                """
+                INSERT INTO video_queue (lesson_id, lesson_title, script_id,
+                                         script_type, content, target_platform,
+                                         status, claimed_by)
+                VALUES ('math_algebra_01', 'Test', $1, 'short', 'Script',
+                        'tiktok', 'processing', 'w1')
+                """, SCRIPT_ID)
+            statuses = []
+            for attempt in range(3):
+                ledger = await db.record_intent(conn, SCRIPT_ID, attempt)
+                # A fresh attempt each time, never the dead task again.
+                assert ledger["created"] and ledger["task_id"] is None
+                await db.record_submitted(conn, ledger["id"], SCRIPT_ID,
+                                          f"task-{attempt}")
+                statuses.append(await db.requeue_lost_task(
+                    conn, SCRIPT_ID, "Task not found"))
+                await conn.execute(
+                    "UPDATE video_queue SET status = 'processing' "
+                    "WHERE script_id = $1 AND status = 'queued'", SCRIPT_ID)
+            assert statuses == ["queued", "queued", "cancelled"]
+            tasks = await conn.fetch(
+                "SELECT attempt, status FROM generation_tasks "
+                "WHERE script_id = $1 ORDER BY attempt", SCRIPT_ID)
+            assert [tuple(t) for t in tasks] == [
+                (0, "failed"), (1, "failed"), (2, "failed")]
+            row = await conn.fetchrow(
+                "SELECT error_count, metadata FROM video_queue "
+                "WHERE script_id = $1", SCRIPT_ID)
+            assert row["error_count"] == 3
+            assert "task_id" not in row["metadata"]
+        finally:
+            await conn.execute(
+                "DELETE FROM generation_tasks WHERE script_id = $1", SCRIPT_ID)
+            await conn.execute(
+                "DELETE FROM video_queue WHERE script_id = $1", SCRIPT_ID)
+            await conn.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,65 @@
+import json
+from datetime import datetime, timezone
+
+from profbrainrot.logsink import API_TABLE, ERROR_TABLE, LogSink
+
+
+def _lines(path):
+    with open(path, encoding="utf-8") as f:
+        return f.readlines()
+
+
+def test_spilled_records_decode_to_the_same_rows(tmp_path):
+    sink = LogSink(None, spill_path=str(tmp_path / "spill.jsonl"))
+    sink.api_call("s1", "/tasks", "status", 200, 150, cost_cents=250)
+    sink.error("s1", "task_failed", "boom", '{"code": "X"}', 2)
+    records = sink._take(len(sink))
+    sink._spill(records)
+
+    assert [LogSink._decode(line) for line in _lines(sink.spill_path)] == records
+    assert sink.spilled == 2
+    assert sink.dropped == 0
+
+
+def test_respill_is_not_counted_twice(tmp_path):
+    sink = LogSink(None, spill_path=str(tmp_path / "spill.jsonl"))
+    sink.error(None, "x", "y")
+    sink._spill(sink._take(1), respill=True)
+    assert sink.spilled == 0
+    assert len(_lines(sink.spill_path)) == 1
+
+
+def test_spill_without_file_drops_records():
+    sink = LogSink(None)
+    sink.error(None, "x", "y")
+    sink._spill(sink._take(1))
+    assert (sink.spilled, sink.dropped) == (0, 1)
+
+
+def test_full_buffer_spills_oldest_batch(tmp_path):
+    sink = LogSink(None, max_batch=2, max_buffer=2,
+                   spill_path=str(tmp_path / "spill.jsonl"))
+    for n in range(3):
+        sink.error(None, "x", str(n))
+    assert len(sink) == 1
+    messages = [LogSink._decode(line)[1][2]
+                for line in _lines(sink.spill_path)]
+    assert messages == ["0", "1"]
+
+
+def test_decode_pads_rows_spilled_before_cost_cents():
+    row = ["s1", "wan2.5", "/x", "create", 201, 5, None,
+           "2026-10-18T00:00:00+00:00", "2026-10-18T00:00:01+00:00"]
+    table, decoded = LogSink._decode(json.dumps({"table": API_TABLE,
+                                                 "row": row}))
+    assert table == API_TABLE
+    assert decoded[7] == datetime(2026, 10, 18, tzinfo=timezone.utc)
+    assert len(decoded) == 10 and decoded[9] is None
+
+
+def test_decode_skips_unreadable_lines():
+    assert LogSink._decode('{"table": "error_log", "row": [null, "x"') is None
+    assert LogSink._decode('{"table": "nope", "row": []}') is None
+    assert LogSink._decode(json.dumps(
+        {"table": ERROR_TABLE,
+         "row": [None, "x", "y", "{}", 0, "not a time"]})) is None
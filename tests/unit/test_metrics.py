@@ -0,0 +1,65 @@
+import pytest
+
+from profbrainrot.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_render_formats_each_metric_kind():
+    registry = Registry()
+    counter = Counter("demo_events_total", "Events", ("outcome",),
+                      registry=registry)
+    gauge = Gauge("demo_depth", "Depth", registry=registry)
+    histogram = Histogram("demo_seconds", "Latency", buckets=(5, 1),
+                          registry=registry)
+    counter.inc(outcome="ok")
+    counter.inc(2, outcome='say "hi"\n')
+    gauge.set(1.5)
+    for value in (1, 3, 10):
+        histogram.observe(value)
+
+    assert registry.render() == "\n".join([
+        "# HELP demo_events_total Events",
+        "# TYPE demo_events_total counter",
+        'demo_events_total{outcome="ok"} 1',
+        'demo_events_total{outcome="say \\"hi\\"\\n"} 2',
+        "# HELP demo_depth Depth",
+        "# TYPE demo_depth gauge",
+        "demo_depth 1.5",
+        "# HELP demo_seconds Latency",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{le="1"} 1',
+        'demo_seconds_bucket{le="5"} 2',
+        'demo_seconds_bucket{le="+Inf"} 3',
+        "demo_seconds_sum 14",
+        "demo_seconds_count 3",
+    ]) + "\n"
+
+
+def test_unregistered_metrics_are_not_rendered():
+    registry = Registry()
+    Counter("demo_total", "Demo", registry=None).inc()
+    assert registry.render() == "\n"
+
+
+def test_duplicate_names_are_rejected():
+    registry = Registry()
+    Gauge("demo", "Demo", registry=registry)
+    with pytest.raises(ValueError):
+        Gauge("demo", "Demo", registry=registry)
+
+
+def test_labels_must_match():
+    counter = Counter("demo_total", "Demo", ("outcome",), registry=None)
+    with pytest.raises(ValueError):
+        counter.inc()
+    with pytest.raises(ValueError):
+        counter.inc(kind="x")
+    with pytest.raises(ValueError):
+        counter.inc(-1, outcome="ok")
+
+
+def test_gauge_replace_drops_stale_series():
+    gauge = Gauge("demo", "Demo", ("status",), registry=None)
+    gauge.set(3, status="queued")
+    gauge.replace({("failed",): 1})
+    assert gauge.value(status="queued") == 0.0
+    assert list(gauge.samples()) == ['demo{status="failed"} 1']
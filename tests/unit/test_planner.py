@@ -0,0 +1,52 @@
+import pytest
+
+from profbrainrot.planner import LANDSCAPE, PORTRAIT, VideoPlanner
+
+
+def _words(n):
+    return " ".join(["word"] * n)
+
+
+def test_short_script_gets_shortest_duration():
+    plan = VideoPlanner().plan(_words(10), "tiktok")  # 4s spoken
+    assert (plan.size, plan.duration, plan.cents) == ("720*1280", 5, 50)
+    assert plan.spoken_seconds == pytest.approx(4.0)
+
+
+def test_duration_covers_spoken_length():
+    plan = VideoPlanner().plan(_words(20), "youtube")  # 8s spoken
+    assert (plan.size, plan.duration, plan.cents) == ("1280*720", 10, 100)
+
+
+def test_long_script_is_capped_at_longest_duration():
+    assert VideoPlanner().plan(_words(60), "tiktok").duration == 10
+
+
+def test_attention_span_caps_needed_length():
+    plan = VideoPlanner().plan(_words(20), "tiktok", attention_span=4)
+    assert plan.duration == 5
+
+
+def test_aspect_falls_back_to_script_type():
+    assert VideoPlanner.aspect("Instagram_Reels") == PORTRAIT
+    assert VideoPlanner.aspect("vimeo", "short") == PORTRAIT
+    assert VideoPlanner.aspect(None, "long") == LANDSCAPE
+
+
+def test_platform_tiers_override_default_tier():
+    planner = VideoPlanner(tier=480, platform_tiers={"tiktok": 1080})
+    assert planner.plan(_words(5), "tiktok").size == "1080*1920"
+    assert planner.plan(_words(5), "youtube").size == "832*480"
+
+
+def test_unknown_tier_is_rejected():
+    with pytest.raises(ValueError):
+        VideoPlanner(tier=360)
+
+
+def test_stats_count_seconds_saved():
+    planner = VideoPlanner()
+    planner.plan(_words(5), "tiktok")
+    planner.plan(_words(40), "tiktok")
+    assert planner.stats() == {"planned": 2, "planned_seconds": 15,
+                               "seconds_saved": 5}
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from profbrainrot.poller import TaskPoller
+from profbrainrot.wan25 import Task, TaskStatus
+
+
+def _poller(clock, **kwargs):
+    kwargs.setdefault("jitter", 0.0)
+    return TaskPoller(None, clock=clock, **kwargs)
+
+
+def test_first_poll_waits_for_earliest_finish(clock):
+    poller = _poller(clock)
+    # Priors: RUNNING finishes in 30-120s, PENDING adds 1-40s.
+    assert poller.completion_window(TaskStatus.RUNNING) == (30.0, 120.0)
+    assert poller.next_delay(TaskStatus.RUNNING, 10) == pytest.approx(20.0)
+    assert poller.next_delay(TaskStatus.PENDING, 0) == pytest.approx(31.0)
+
+
+def test_dense_polls_through_completion_window(clock):
+    poller = _poller(clock, dense_polls=6)
+    assert poller.next_delay(TaskStatus.RUNNING, 50) == pytest.approx(15.0)
+
+
+def test_delay_never_below_min_interval(clock):
+    poller = _poller(clock)
+    assert poller.next_delay(TaskStatus.RUNNING, 29.5) == 2.0
+
+
+def test_overdue_backoff_is_capped(clock):
+    poller = _poller(clock, min_interval=2.0, max_interval=60.0)
+    assert poller.next_delay(TaskStatus.RUNNING, 200, overdue=0) == 2.0
+    assert poller.next_delay(TaskStatus.RUNNING, 200, overdue=3) == 16.0
+    assert poller.next_delay(TaskStatus.RUNNING, 200, overdue=5000) == 60.0
+
+
+def test_jitter_stays_in_bounds(clock):
+    poller = _poller(clock, jitter=0.2)
+    for _ in range(50):
+        assert 16.0 <= poller.next_delay(TaskStatus.RUNNING, 10) <= 24.0
+
+
+class _UnknownClient:
+    async def get_task(self, task_id):
+        return Task(task_id, TaskStatus.UNKNOWN)
+
+
+def test_unknown_task_is_finished_after_max_polls(clock):
+    finished = []
+
+    async def on_complete(task, context):
+        finished.append((task.status, context))
+
+    async def scenario():
+        poller = TaskPoller(_UnknownClient(), on_complete=on_complete,
+                            max_unknown_polls=3, clock=clock)
+        future = poller.track("t1", context="script")
+        for _ in range(3):
+            assert not future.done()
+            await poller._poll_slots.acquire()
+            await poller._poll(poller._entries["t1"])
+        assert "t1" not in poller
+        return future.result()
+
+    task = asyncio.run(scenario())
+    assert task.status == TaskStatus.UNKNOWN
+    assert finished == [(TaskStatus.UNKNOWN, "script")]
+
+
+class _FailingClient:
+    async def get_task(self, task_id):
+        raise OSError("connection reset")
+
+
+def test_failed_poll_counts_overdue_once(clock):
+    async def scenario():
+        poller = TaskPoller(_FailingClient(), clock=clock)
+        poller.track("t1", status=TaskStatus.RUNNING, elapsed=500)
+        entry = poller._entries["t1"]
+        before = entry.overdue
+        await poller._poll_slots.acquire()
+        await poller._poll(entry)
+        return entry.overdue - before
+
+    assert asyncio.run(scenario()) == 1
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from profbrainrot.scheduler import TokenBucket
+
+
+def test_bucket_starts_full_and_refills_to_capacity(clock):
+    bucket = TokenBucket(2.0, 4.0, clock=clock)
+    assert bucket.tokens == 4.0
+    asyncio.run(bucket.acquire(3))
+    assert bucket.tokens == pytest.approx(1.0)
+    clock.advance(1)
+    assert bucket.tokens == pytest.approx(3.0)
+    clock.advance(10)
+    assert bucket.tokens == 4.0
+
+
+def test_acquire_waits_for_refill(clock, monkeypatch):
+    bucket = TokenBucket(2.0, 2.0, clock=clock)
+    waits = []
+
+    async def fake_sleep(seconds):
+        waits.append(seconds)
+        clock.advance(seconds)
+
+    async def scenario():
+        await bucket.acquire(2)
+        monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+        await bucket.acquire(1)
+
+    asyncio.run(scenario())
+    assert waits == [pytest.approx(0.5)]
+    assert bucket.tokens == pytest.approx(0.0)
+
+
+def test_adjust_can_overdraw_and_refund(clock):
+    bucket = TokenBucket(1.0, 4.0, clock=clock)
+    bucket.adjust(5)
+    assert bucket.tokens == pytest.approx(-1.0)
+    clock.advance(2)
+    assert bucket.tokens == pytest.approx(1.0)
+    bucket.adjust(-10)
+    assert bucket.tokens == 4.0
+
+
+def test_drain_delays_refill(clock):
+    bucket = TokenBucket(2.0, 4.0, clock=clock)
+    bucket.drain(3)
+    clock.advance(3)
+    assert bucket.tokens == pytest.approx(0.0)
+    clock.advance(1)
+    assert bucket.tokens == pytest.approx(2.0)
+
+
+def test_invalid_requests_are_rejected(clock):
+    with pytest.raises(ValueError):
+        TokenBucket(0, clock=clock)
+    bucket = TokenBucket(1.0, 2.0, clock=clock)
+    with pytest.raises(ValueError):
+        asyncio.run(bucket.acquire(3))
@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+import pytest
+
+from profbrainrot.wan25 import RateLimitError, Wan25Client, Wan25Error
+
+
+class _Response:
+    def __init__(self, status, text, headers=None):
+        self.status = status
+        self._text = text
+        self.headers = headers or {}
+
+    async def json(self, content_type=None):
+        return json.loads(self._text)
+
+    async def text(self):
+        return self._text
+
+
+def _read(status, text, headers=None):
+    return asyncio.run(Wan25Client._read_json(
+        _Response(status, text, headers)))
+
+
+def test_success_returns_body():
+    body = {"output": {"task_id": "t1"}}
+    assert _read(200, json.dumps(body)) == body
+
+
+def test_error_carries_code_and_message():
+    with pytest.raises(Wan25Error) as raised:
+        _read(400, '{"code": "InvalidParameter", "message": "bad size"}')
+    assert (raised.value.status, raised.value.code,
+            raised.value.message) == (400, "InvalidParameter", "bad size")
+
+
+@pytest.mark.parametrize("text", ["null", "[1, 2]", "<html>Bad Gateway</html>"])
+def test_non_object_bodies_become_the_message(text):
+    with pytest.raises(Wan25Error) as raised:
+        _read(502, text)
+    assert raised.value.status == 502
+    assert raised.value.code is None
+
+
+def test_rate_limit_parses_retry_after():
+    with pytest.raises(RateLimitError) as raised:
+        _read(429, "{}", {"Retry-After": "2.5"})
+    assert raised.value.retry_after == 2.5
+    with pytest.raises(RateLimitError) as raised:
+        _read(429, "{}", {"Retry-After": "soon"})
+    assert raised.value.retry_after is None